@@ -21,21 +21,223 @@
 
 from __future__ import annotations
 
-import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
 from datetime import datetime
+from functools import lru_cache, partial
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, List, NamedTuple, Tuple, Optional
 
 import pandas as pd
-from transformers import pipeline
+
+from utils_backends import BackendRechazadoError, comparar_resultados, crear_backend
+from utils_cascada import ClasificadorCascada
+from utils_cache import CachePredicciones, huella_configuracion
+from utils_compactacion import CompactadorLogs
+from utils_analisis import CapturaPorBloques, guardar_puntuaciones, matriz_puntuaciones
+from utils_coincidencias import MotorCoincidencias, literales_de_patron
+from utils_feedback import AlmacenFeedback, build_question_id, obtener_almacen, resumir_respuesta
+from utils_evaluacion import evaluar_en_streaming
+from utils_indice_faq import IndiceFAQ
+from utils_metricas import RegistroMetricas
+from utils_modelo import GestorModelo
+from utils_pesos_compartidos import ARCHIVO_PESOS, desglose_memoria
+from utils_planificador import PlanificadorInferencia
+from utils_plazo import EjecutorConPlazo
+from utils_registro import EscritorCSV
+from utils_vecinos import VecinosConfirmados
+from utils_zeroshot import EjecutorZeroShot
 
 
 # ---------- 1. Modelo PLN para clasificación de incidencias ----------
 
-clasificador = pipeline(
-    "zero-shot-classification",
-    model="facebook/bart-large-mnli"
-)
+MODELO_NLI = "facebook/bart-large-mnli"
+PLANTILLA_HIPOTESIS = "Esta incidencia trata sobre {}."
+
+
+# Motor de inferencia: "transformers" (fp32), "onnx" o "int8".
+# Un motor distinto de fp32 solo se activa si, sobre el CSV de validación,
+# sus predicciones no se alejan de fp32 más de las tolerancias.
+BACKEND_NLI = "transformers"
+RUTA_ONNX = Path("modelos/bart-large-mnli-onnx")
+RUTA_VALIDACION_BACKEND = "incidencias.csv"
+TOLERANCIA_DISCREPANCIA = 0.0    # fracción de etiquetas distintas permitida
+TOLERANCIA_CONFIANZA = 0.05      # diferencia máxima en confianza_top
+
+# Ejecutor propio en lugar del pipeline de transformers: tokeniza las
+# hipótesis una sola vez y la premisa una vez por petición, y manda
+# todos los pares en un único lote. Mismas puntuaciones que el pipeline.
+EJECUTOR_PROPIO = True
+
+# Pesos compartidos entre procesos (Streamlit, servicio HTTP, trabajadores
+# de evaluación): el modelo fp32 se carga mapeando en memoria el
+# model.safetensors de RUTA_PESOS (se exporta la primera vez). Todos los
+# procesos del equipo usan las mismas páginas, así que cada proceso extra
+# solo cuesta sus activaciones. RUTA_PESOS puede estar en /dev/shm para
+# tenerlo en memoria compartida sin depender de la caché de disco.
+PESOS_MAPEADOS = True
+RUTA_PESOS = Path("modelos/bart-large-mnli-safetensors")
+
+
+def _crear_motor(nombre: str):
+    pipe = crear_backend(nombre, MODELO_NLI, RUTA_ONNX, ruta_pesos=RUTA_PESOS if PESOS_MAPEADOS else None)
+    if not EJECUTOR_PROPIO:
+        return pipe
+    motor = EjecutorZeroShot.desde_pipeline(pipe)
+    motor.observar = metricas.observar
+    return motor
+
+
+def _cargar_clasificador():
+    # Import diferido (dentro de crear_backend): importar transformers ya
+    # cuesta varios segundos
+    global BACKEND_NLI
+    if BACKEND_NLI == "transformers":
+        return _crear_motor("transformers")
+    try:
+        return validar_backend(BACKEND_NLI)
+    except (BackendRechazadoError, ImportError) as e:
+        print(f"⚠️ {e} Se usa el backend 'transformers' (fp32).")
+        # BACKEND_NLI entra en la huella de la caché: debe ser el motor cargado
+        motor = _crear_motor("transformers")
+        BACKEND_NLI = "transformers"
+        return motor
+
+
+def validar_backend(nombre: str, referencia=None, ruta_csv: str = RUTA_VALIDACION_BACKEND):
+    """
+    Crea el backend `nombre`, pasa todos los textos de `ruta_csv` por él y
+    por fp32 y lo devuelve solo si las etiquetas y puntuaciones coinciden
+    dentro de la tolerancia. Si no, lanza BackendRechazadoError.
+
+    Se llama a los dos modelos directamente, sin reglas: con
+    evaluar_sobre_csv las filas que resuelven las reglas no llegarían
+    al modelo y no validarían nada.
+    """
+    candidato = _crear_motor(nombre)
+    if referencia is None:
+        referencia = _crear_motor("transformers")
+
+    textos = pd.read_csv(ruta_csv)["texto"].astype(str).tolist()
+    salidas = []
+    for motor in (referencia, candidato):
+        resultado = motor(textos, categorias, hypothesis_template=PLANTILLA_HIPOTESIS) if textos else []
+        salidas.append([resultado] if isinstance(resultado, dict) else resultado)
+    comparacion = comparar_resultados(*salidas)
+
+    if (comparacion["discrepancia"] > TOLERANCIA_DISCREPANCIA
+            or comparacion["max_dif_confianza"] > TOLERANCIA_CONFIANZA):
+        raise BackendRechazadoError(
+            f"El backend '{nombre}' no supera la validación sobre {ruta_csv}: "
+            f"{comparacion['discrepancia']:.1%} de etiquetas distintas, "
+            f"diferencia máxima de confianza {comparacion['max_dif_confianza']:.3f}."
+        )
+    return candidato
+
+
+def activar_backend(nombre: str) -> None:
+    """Cambia de backend en caliente (con la misma validación)."""
+    global BACKEND_NLI
+    if nombre == "transformers":
+        modelo = _crear_motor("transformers")
+    else:
+        referencia = gestor_modelo.obtener() if BACKEND_NLI == "transformers" else None
+        modelo = validar_backend(nombre, referencia=referencia)
+    gestor_modelo.reemplazar(modelo)
+    BACKEND_NLI = nombre
+
+
+# Único por proceso: lo comparten todas las sesiones de Streamlit.
+# La carga real ocurre en precargar() (hilo en segundo plano) o en la
+# primera llamada que necesite el modelo.
+gestor_modelo = GestorModelo(_cargar_clasificador, nombre="modelo NLI")
+
+
+# Cascada: un modelo NLI multilingüe pequeño, guardado en local (p. ej.
+# un mDeBERTa-xnli con save_pretrained), responde primero; solo las
+# incidencias dudosas pasan a bart-large-mnli. Si RUTA_MODELO_PEQUENO no
+# existe, todo va al modelo grande como siempre.
+CASCADA_ACTIVA = True
+RUTA_MODELO_PEQUENO = Path("modelos/nli-pequeno")
+UMBRAL_CASCADA = 0.7    # por debajo de esta confianza del pequeño -> grande
+MARGEN_CASCADA = 0.1    # también se escala si queda a ±0.1 de UMBRAL_CONFIANZA
+
+
+def _cargar_clasificador_pequeno():
+    # Si se guardó con save_pretrained ya tiene su model.safetensors: se mapea tal cual
+    mapeable = PESOS_MAPEADOS and (RUTA_MODELO_PEQUENO / ARCHIVO_PESOS).exists()
+    pipe = crear_backend("transformers", str(RUTA_MODELO_PEQUENO),
+                         ruta_pesos=RUTA_MODELO_PEQUENO if mapeable else None)
+    if not EJECUTOR_PROPIO:
+        return pipe
+    motor = EjecutorZeroShot.desde_pipeline(pipe)
+    motor.observar = lambda etapa, segundos: metricas.observar(f"{etapa}_pequeno", segundos)
+    return motor
+
+
+gestor_modelo_pequeno = GestorModelo(_cargar_clasificador_pequeno, nombre="modelo NLI pequeño")
+
+_cascada_global: Optional[ClasificadorCascada] = None
+_cascada_lock = threading.Lock()
+
+
+def cascada_disponible() -> bool:
+    return CASCADA_ACTIVA and RUTA_MODELO_PEQUENO.exists()
+
+
+def _nueva_cascada() -> ClasificadorCascada:
+    return ClasificadorCascada(
+        gestor_modelo_pequeno.obtener,
+        gestor_modelo.obtener,
+        umbral=UMBRAL_CASCADA,
+        umbral_decision=UMBRAL_CONFIANZA,
+        margen=MARGEN_CASCADA,
+    )
+
+
+def _cascada() -> ClasificadorCascada:
+    global _cascada_global
+    with _cascada_lock:
+        if _cascada_global is None:
+            _cascada_global = _nueva_cascada()
+        # Los umbrales se pueden cambiar en caliente
+        _cascada_global.umbral = UMBRAL_CASCADA
+        _cascada_global.umbral_decision = UMBRAL_CONFIANZA
+        _cascada_global.margen = MARGEN_CASCADA
+        return _cascada_global
+
+
+def estadisticas_cascada() -> Dict[str, Dict[str, float]]:
+    """Tasa de resueltos y latencia media por etapa de la cascada."""
+    return _cascada().estadisticas()
+
+
+def cargar_modelos() -> None:
+    """Carga ya (en este hilo) los modelos que se van a usar."""
+    gestor_modelo.obtener()
+    if cascada_disponible():
+        gestor_modelo_pequeno.obtener()
+
+
+def memoria_proceso() -> Dict[str, float]:
+    """Desglose de memoria de este proceso en MB (pesos_*: los model.safetensors mapeados)."""
+    archivos = [RUTA_PESOS / ARCHIVO_PESOS, RUTA_MODELO_PEQUENO / ARCHIVO_PESOS] if PESOS_MAPEADOS else []
+    return desglose_memoria(archivos=archivos)
+
+
+def precargar_modelos() -> None:
+    gestor_modelo.precargar()
+    if cascada_disponible():
+        gestor_modelo_pequeno.precargar()
+
+
+def clasificador(*args, **kwargs):
+    if cascada_disponible():
+        return _cascada()(*args, **kwargs)
+    return gestor_modelo.obtener()(*args, **kwargs)
 
 categorias = [
     "problema de acceso",
@@ -46,6 +248,7 @@ categorias = [
     "otro tipo de incidencia"
 ]
 
+ETIQUETA_OTRO = categorias[-1]
 UMBRAL_CONFIANZA = 0.45
 
 
@@ -63,6 +266,12 @@ FAQ: List[Dict] = [
             "3) Contraseña: la misma que usas para entrar al Blackboard\n"
             "Si falla, prueba a olvidar la red y volver a conectarte."
         ),
+        "ejemplos": [
+            "¿Cómo me conecto a la wifi de la universidad?",
+            "No me conecta la red de la uni",
+            "¿Cuál es la contraseña del wifi?",
+            "No tengo conexión a internet en el campus",
+        ],
         "links": [
             {"text": "Guía de eduroam (Nebrija)", "url": "https://campusvirtual.nebrija.es/?new_loc=%2Fultra%2Fcourses%2F_91881_1%2Foutline%2Ffile%2F_3633088_1%3FlinkContentId%3D_3633088_1M"}
         ],
@@ -74,6 +283,11 @@ FAQ: List[Dict] = [
             "El horario depende de tu titulación y grupo. Normalmente se consulta en el portal del alumno.\n"
             "Si me dices tu grado y curso (por ejemplo: 'Informática 4º'), te indico qué dato necesitas buscar."
         ),
+        "ejemplos": [
+            "¿Dónde veo mi horario de clases?",
+            "¿A qué hora empiezan las clases?",
+            "¿Dónde está el calendario académico?",
+        ],
         "links": [
             {"text": "Portal del alumno (Nebrija)", "url": "https://app.unne.universitasxxi.com/ServiciosApp/;PortalJSESSION=QmVIMULsKmgO6cFuRLpjIaK92G1vyaVxE8r6QFcIAak5eChvJ4F0!1109235815"}
         ],
@@ -88,6 +302,11 @@ FAQ: List[Dict] = [
             "- si el navegador tiene caché antigua (prueba modo incógnito)\n"
             "Si sigue fallando, dime el mensaje exacto de error."
         ),
+        "ejemplos": [
+            "No puedo entrar al campus virtual",
+            "¿Cómo accedo a Blackboard?",
+            "No me cargan las asignaturas en el aula virtual",
+        ],
         "links": [
             {"text": "Acceso Blackboard (Nebrija)", "url": "https://campusvirtual.nebrija.es/?new_loc=%2Fultra%2Fcourses%2F_91881_1%2Foutline%2Ffile%2F_3633088_1%3FlinkContentId%3D_3633088_1"}
         ],
@@ -102,6 +321,11 @@ FAQ: List[Dict] = [
             "3) Si te da error de credenciales, puede ser un problema de acceso o cuenta bloqueada\n"
             "4) Prueba cambiando la contraseña e intenta de nuevo."
         ),
+        "ejemplos": [
+            "No puedo entrar en Teams",
+            "No me funciona el correo de la universidad",
+            "¿Cómo accedo a Outlook con mi cuenta de Nebrija?",
+        ],
         "links": [
             {"text": "Soporte Microsoft 365 (Nebrija)", "url": "https://www.nebrija.es/login/passwords/recuperacioninicial.php"}
         ],
@@ -113,6 +337,11 @@ FAQ: List[Dict] = [
             "Para incidencias técnicas o administrativas, abrir un ticket ayuda a que se asigne rápido.\n"
             "Recomendación: añade descripción breve, capturas (si aplica) y tu usuario/correo."
         ),
+        "ejemplos": [
+            "¿Cómo abro un ticket de soporte?",
+            "¿Dónde pido ayuda al servicio técnico?",
+            "Quiero abrir una incidencia",
+        ],
         "links": [
             {"text": "Portal de soporte / tickets (Nebrija)", "url": "https://www.nebrija.com/vida_universitaria/servicios/secretaria/"}
         ],
@@ -121,33 +350,75 @@ FAQ: List[Dict] = [
 
 
 def detectar_faq(texto: str) -> Optional[Dict]:
-    texto_min = texto.lower()
-    for item in FAQ:
-        if any(re.search(p, texto_min) for p in item["patterns"]):
-            return item
+    with metricas.etapa("faq_regex"):
+        analisis = analizar_texto(texto)
+    if analisis.faq is not None:
+        metricas.contar_ruta("faq")
+        return FAQ[analisis.faq]
+
+    # Paráfrasis que no contienen las palabras exactas de los patrones:
+    # se prueba el índice vectorial antes de pasar al modelo NLI. Si ya
+    # hay una regla que aplica, se deja que la regla decida.
+    if INDICE_FAQ_ACTIVO and analisis.regla is None:
+        with metricas.etapa("faq_similar"):
+            similares = buscar_faq_similar(texto, k=1)
+        if similares and similares[0][1] >= UMBRAL_SIMILITUD_FAQ:
+            metricas.contar_ruta("faq_similar")
+            return FAQ[similares[0][0]]
+
     return None
 
 
+# ---------- 2b. Índice vectorial de FAQ ----------
+
+INDICE_FAQ_ACTIVO = True
+UMBRAL_SIMILITUD_FAQ = 0.5
+
+_indice_faq: Optional[IndiceFAQ] = None
+
+
+def _construir_indice_faq() -> IndiceFAQ:
+    documentos = []
+    for i, item in enumerate(FAQ):
+        for patron in item["patterns"]:
+            documentos.extend((i, lit) for lit in (literales_de_patron(patron) or []))
+        documentos.append((i, item["answer"]))
+        documentos.extend((i, e) for e in item.get("ejemplos", []))
+    return IndiceFAQ(documentos)
+
+
+def buscar_faq_similar(texto: str, k: int = 3) -> List[Tuple[int, float]]:
+    """Top-k (índice en FAQ, similitud coseno) según el índice vectorial."""
+    global _indice_faq
+    if _indice_faq is None:
+        _indice_faq = _construir_indice_faq()
+    return _indice_faq.buscar(texto, k=k)
+
+
 # ---------- 3. Clasificación + prioridad + solicitud de info ----------
 
-def estimar_prioridad(texto: str) -> str:
-    texto_min = texto.lower()
-
-    disparadores_alta = [
-        "no puedo acceder",
-        "no puedo entrar",
-        "no tengo acceso",
-        "cuenta bloqueada",
-        "bloqueado",
-        "examen",
-        "entrega hoy",
-        "plazo termina",
-        "plazo acaba",
-        "urgente",
-        "hoy"
-    ]
+DISPARADORES_ALTA = [
+    "no puedo acceder",
+    "no puedo entrar",
+    "no tengo acceso",
+    "cuenta bloqueada",
+    "bloqueado",
+    "examen",
+    "entrega hoy",
+    "plazo termina",
+    "plazo acaba",
+    "urgente",
+    "hoy"
+]
+
+PALABRAS_MATRICULA = ["matrícula", "matricula", "tasas", "pagar", "pago de tasas", "confirmar la matrícula", "confirmar la matricula"]
+PALABRAS_ADMINISTRATIVAS = ["plazos", "solicitar el título", "solicitar el titulo", "título", "titulo", "trámite", "tramite", "cambio de grupo", "secretaría", "secretaria"]
+PALABRAS_CORREO = ["correo", "outlook", "mensajes", "mail"]
+PALABRAS_FALLO = ["falla", "no recibo", "no llegan", "no me llegan", "error", "no funciona"]
 
-    return "alta" if any(d in texto_min for d in disparadores_alta) else "normal"
+
+def estimar_prioridad(texto: str) -> str:
+    return "alta" if analizar_texto(texto).prioridad_alta else "normal"
 
 
 def preguntas_seguimiento(categoria: str) -> List[str]:
@@ -188,47 +459,437 @@ def preguntas_seguimiento(categoria: str) -> List[str]:
 
 
 def clasificacion_por_reglas(texto: str) -> Optional[str]:
-    t = texto.lower()
+    return analizar_texto(texto).regla
+
+
+# ---------- 3a. Motor de coincidencias (una sola pasada) ----------
+
+# FAQ, reglas y disparadores de prioridad se compilan en un único motor:
+# el texto se pasa a minúsculas una vez y se recorre una vez, y las tres
+# funciones anteriores leen el mismo resultado (memorizado por texto).
+
+class AnalisisTexto(NamedTuple):
+    faq: Optional[int]          # índice en FAQ del primer intent que coincide
+    regla: Optional[str]        # categoría por reglas (o None)
+    prioridad_alta: bool
+
+
+_motor: Optional[MotorCoincidencias] = None
+
+
+def _construir_motor() -> MotorCoincidencias:
+    motor = MotorCoincidencias()
+    for i, item in enumerate(FAQ):
+        for patron in item["patterns"]:
+            motor.agregar_patron(patron, f"faq:{i}")
+    for grupo, palabras in (
+        ("matricula", PALABRAS_MATRICULA),
+        ("administrativa", PALABRAS_ADMINISTRATIVAS),
+        ("correo", PALABRAS_CORREO),
+        ("fallo", PALABRAS_FALLO),
+    ):
+        for k in palabras:
+            motor.agregar_termino(k, f"regla:{grupo}")
+    for d in DISPARADORES_ALTA:
+        motor.agregar_termino(d, "prioridad:alta")
+    motor.compilar()
+    return motor
+
+
+def reconstruir_motor() -> None:
+    """Llamar si se modifican FAQ o las listas de palabras en caliente."""
+    global _motor, _indice_faq
+    _motor = _construir_motor()
+    _indice_faq = _construir_indice_faq()
+    analizar_texto.cache_clear()
+
+
+@lru_cache(maxsize=4096)
+def analizar_texto(texto: str) -> AnalisisTexto:
+    global _motor
+    if _motor is None:
+        _motor = _construir_motor()
+
+    etiquetas = _motor.analizar(texto.lower())
+
+    faqs = [int(e[4:]) for e in etiquetas if e.startswith("faq:")]
+
+    if "regla:matricula" in etiquetas:
+        regla: Optional[str] = "error de matrícula"
+    elif "regla:administrativa" in etiquetas:
+        regla = "consulta administrativa"
+    elif "regla:correo" in etiquetas and "regla:fallo" in etiquetas:
+        regla = "problema técnico"
+    else:
+        regla = None
+
+    return AnalisisTexto(
+        faq=min(faqs) if faqs else None,
+        regla=regla,
+        prioridad_alta="prioridad:alta" in etiquetas,
+    )
+
 
-    if any(k in t for k in ["matrícula", "matricula", "tasas", "pagar", "pago de tasas", "confirmar la matrícula", "confirmar la matricula"]):
-        return "error de matrícula"
+def _interpretar_resultado(texto: str, resultado: Dict) -> Tuple[str, Dict[str, float], str, float]:
+    etiqueta_top = resultado["labels"][0]
+    score_top = float(resultado["scores"][0])
+    scores = dict(zip(resultado["labels"], resultado["scores"]))
 
-    if any(k in t for k in ["plazos", "solicitar el título", "solicitar el titulo", "título", "titulo", "trámite", "tramite", "cambio de grupo", "secretaría", "secretaria"]):
-        return "consulta administrativa"
+    prioridad = estimar_prioridad(texto)
 
-    if any(k in t for k in ["correo", "outlook", "mensajes", "mail"]) and any(k in t for k in ["falla", "no recibo", "no llegan", "no me llegan", "error", "no funciona"]):
-        return "problema técnico"
+    if score_top < UMBRAL_CONFIANZA:
+        etiqueta_top = "otro tipo de incidencia"
 
-    return None
+    return etiqueta_top, scores, prioridad, score_top
 
 
-def clasificar_incidencia(texto: str) -> Tuple[str, Dict[str, float], str, float]:
-    por_reglas = clasificacion_por_reglas(texto)
+def _clasificar_sin_modelo(texto: str) -> Optional[Tuple[str, Dict[str, float], str, float]]:
+    """Reglas, caché y vecinos confirmados: lo que no necesita el modelo (o None)."""
+    with metricas.etapa("reglas"):
+        por_reglas = clasificacion_por_reglas(texto)
     if por_reglas:
+        metricas.contar_ruta("regla")
         prioridad = estimar_prioridad(texto)
         return por_reglas, {}, prioridad, 1.0
 
-    resultado = clasificador(
-        texto,
+    if CACHE_ACTIVA:
+        with metricas.etapa("cache"):
+            guardado = _cache().obtener(texto)
+        if guardado is not None:
+            metricas.contar_ruta("cache")
+            etiqueta_top, scores, score_top = guardado
+            return etiqueta_top, dict(scores), estimar_prioridad(texto), score_top
+
+    if VECINOS_ACTIVO:
+        with metricas.etapa("vecinos"):
+            vecino = _vecinos().buscar(texto, UMBRAL_VECINO)
+        if vecino is not None:
+            metricas.contar_ruta("vecino")
+            etiqueta, similitud = vecino
+            return etiqueta, {}, estimar_prioridad(texto), similitud
+
+    return None
+
+
+def _clasificar_con_modelo(texto: str) -> Tuple[str, Dict[str, float], str, float]:
+    # "modelo" incluye la espera en cola, la tokenización y el forward,
+    # que también se miden por separado
+    metricas.contar_ruta("modelo")
+    with metricas.etapa("modelo"):
+        if PLANIFICADOR_ACTIVO:
+            resultado = _planificador().ejecutar(texto, timeout=PLANIFICADOR_ESPERA_COLA_S)
+        else:
+            resultado = clasificador(
+                texto,
+                categorias,
+                hypothesis_template=PLANTILLA_HIPOTESIS
+            )
+
+    etiqueta_top, scores, prioridad, score_top = _interpretar_resultado(texto, resultado)
+    if CACHE_ACTIVA:
+        _cache().guardar(texto, [etiqueta_top, {k: float(v) for k, v in scores.items()}, score_top])
+
+    return etiqueta_top, scores, prioridad, score_top
+
+
+def clasificar_incidencia(texto: str) -> Tuple[str, Dict[str, float], str, float]:
+    resultado = _clasificar_sin_modelo(texto)
+    if resultado is not None:
+        return resultado
+    return _clasificar_con_modelo(texto)
+
+
+# ---------- 3b. Caché de predicciones ----------
+
+# Muchas consultas se repiten casi igual (mayúsculas, tildes, signos...).
+# La clave es el texto normalizado + la huella de la configuración del
+# modelo: si cambian el modelo, las categorías, la plantilla o el umbral,
+# la caché se invalida sola.
+CACHE_ACTIVA = True
+CACHE_CAPACIDAD = 4096
+CACHE_RUTA_DISCO: Optional[Path] = None  # p. ej. Path("cache_predicciones.sqlite")
+# En disco conviven las huellas de varios procesos/configuraciones; al
+# abrirla se borran las que nadie ha usado en este tiempo
+CACHE_EDAD_MAX_DIAS = 30
+
+_cache_global: Optional[CachePredicciones] = None
+_cache_lock = threading.Lock()
+
+
+def _cache() -> CachePredicciones:
+    global _cache_global
+    huella = huella_configuracion(
+        modelo=MODELO_NLI,
+        backend=BACKEND_NLI,
+        categorias=categorias,
+        plantilla=PLANTILLA_HIPOTESIS,
+        umbral=UMBRAL_CONFIANZA,
+        cascada=(str(RUTA_MODELO_PEQUENO), UMBRAL_CASCADA, MARGEN_CASCADA) if cascada_disponible() else None,
+    )
+    with _cache_lock:
+        if _cache_global is None or _cache_global.huella != huella:
+            if _cache_global is not None:
+                # Sin esto cada cambio de configuración deja abierta su conexión SQLite
+                _cache_global.cerrar()
+            _cache_global = CachePredicciones(
+                huella,
+                capacidad=CACHE_CAPACIDAD,
+                ruta_disco=CACHE_RUTA_DISCO,
+            )
+            if CACHE_RUTA_DISCO is not None and CACHE_EDAD_MAX_DIAS is not None:
+                _cache_global.podar(CACHE_EDAD_MAX_DIAS * 86400)
+        return _cache_global
+
+
+def estadisticas_cache() -> Dict[str, float]:
+    return _cache().estadisticas()
+
+
+# ---------- 3c. Vecino más cercano entre incidencias confirmadas ----------
+
+# Si un mensaje nuevo es casi igual a uno que un alumno ya confirmó como
+# bien clasificado (feedback SI), se reutiliza esa etiqueta sin modelo.
+# El índice lee solo las filas nuevas de feedback_chat.csv.
+VECINOS_ACTIVO = True
+UMBRAL_VECINO = 0.9
+
+_vecinos_global: Optional[VecinosConfirmados] = None
+_vecinos_lock = threading.Lock()
+
+
+def _vecinos() -> VecinosConfirmados:
+    global _vecinos_global
+    with _vecinos_lock:
+        if _vecinos_global is None or _vecinos_global.categorias_validas != set(categorias[:-1]):
+            # "otro tipo de incidencia" no aporta nada como respuesta reutilizada
+            _vecinos_global = VecinosConfirmados(FEEDBACK_PATH, categorias[:-1])
+        return _vecinos_global
+
+
+TAM_LOTE = 8
+
+# Micro-lotes entre sesiones: las peticiones de varios alumnos que llegan
+# casi a la vez se juntan en una sola pasada del modelo.
+PLANIFICADOR_ACTIVO = True
+PLANIFICADOR_MAX_LOTE = 16
+PLANIFICADOR_ESPERA_MS = 15
+PLANIFICADOR_MAX_COLA = 256
+PLANIFICADOR_ESPERA_COLA_S = 5.0  # si la cola sigue llena tras esto -> ColaLlenaError
+
+_planificador_global: Optional[PlanificadorInferencia] = None
+_planificador_lock = threading.Lock()
+
+
+def _inferir_lote(textos: List[str]) -> List[Dict]:
+    resultados = clasificador(
+        textos,
         categorias,
-        hypothesis_template="Esta incidencia trata sobre {}."
+        hypothesis_template=PLANTILLA_HIPOTESIS,
+        batch_size=len(textos) * len(categorias),
+    )
+    return [resultados] if isinstance(resultados, dict) else resultados
+
+
+def _planificador() -> PlanificadorInferencia:
+    global _planificador_global
+    with _planificador_lock:
+        if _planificador_global is None:
+            _planificador_global = PlanificadorInferencia(
+                _inferir_lote,
+                max_lote=PLANIFICADOR_MAX_LOTE,
+                espera_max_ms=PLANIFICADOR_ESPERA_MS,
+                max_cola=PLANIFICADOR_MAX_COLA,
+                observar_espera=lambda segundos: metricas.observar("espera_cola", segundos),
+            )
+        return _planificador_global
+
+
+def clasificar_incidencias_lote(
+    textos: List[str],
+    batch_size: int = TAM_LOTE,
+    modelo=None,
+) -> List[Tuple[str, Dict[str, float], str, float]]:
+    """
+    Igual que clasificar_incidencia, pero para muchos textos a la vez.
+    Primero se aplican las reglas; el resto va al modelo ordenado por
+    longitud, para que cada lote se rellene (padding) solo hasta su texto
+    más largo y no hasta el más largo de todo el dataset.
+    `modelo` permite evaluar con otro pipeline (p. ej. un backend candidato).
+    """
+    salida: List[Optional[Tuple[str, Dict[str, float], str, float]]] = [None] * len(textos)
+    pendientes: List[int] = []
+
+    for i, texto in enumerate(textos):
+        por_reglas = clasificacion_por_reglas(texto)
+        if por_reglas:
+            salida[i] = (por_reglas, {}, estimar_prioridad(texto), 1.0)
+        else:
+            pendientes.append(i)
+
+    if pendientes:
+        pendientes.sort(key=lambda i: len(textos[i]))
+        resultados = (modelo or clasificador)(
+            [textos[i] for i in pendientes],
+            categorias,
+            hypothesis_template=PLANTILLA_HIPOTESIS,
+            # el pipeline agrupa pares (texto, hipótesis): batch_size textos
+            # equivalen a batch_size * len(categorias) pares
+            batch_size=batch_size * len(categorias),
+        )
+        if isinstance(resultados, dict):
+            resultados = [resultados]
+
+        for i, resultado in zip(pendientes, resultados):
+            salida[i] = _interpretar_resultado(textos[i], resultado)
+
+    return salida  # type: ignore[return-value]
+
+
+# ---------- 3d. Métricas por etapa ----------
+
+# Latencia de cada etapa del mensaje (faq_regex, faq_similar, reglas,
+# cache, vecinos, espera_cola, tokenizacion, modelo_forward, modelo,
+# registro, mensaje) y contadores por ruta. Con METRICAS_ACTIVAS = False
+# (o metricas.activo = False) cada punto de medida es solo una comprobación.
+METRICAS_ACTIVAS = True
+RUTA_METRICAS: Optional[Path] = None   # p. ej. Path("metricas_asistente.prom") (textfile de node_exporter)
+PUERTO_METRICAS: Optional[int] = None  # p. ej. 9464 -> http://127.0.0.1:9464/metrics
+
+metricas = RegistroMetricas(activo=METRICAS_ACTIVAS)
+
+
+def iniciar_exportacion_metricas() -> None:
+    """Arranca (una sola vez) el archivo y/o el endpoint configurados."""
+    if RUTA_METRICAS is not None:
+        metricas.escribir_periodicamente(RUTA_METRICAS)
+    if PUERTO_METRICAS is not None:
+        metricas.servir(PUERTO_METRICAS)
+
+
+# ---------- 3e. Clasificación con presupuesto de latencia ----------
+
+# En picos de carga el modelo puede tardar varios segundos. Con un
+# presupuesto, si no contesta a tiempo se responde ya con lo barato
+# (regla, FAQ parecidas, prioridad y preguntas de seguimiento) y el
+# modelo sigue en segundo plano: su resultado se registra en el log, se
+# guarda en la caché y queda listo para recoger_diferido() en el
+# siguiente rerun. Las respuestas provisionales se cuentan en la ruta
+# "provisional" de las métricas y en estadisticas_presupuesto().
+PRESUPUESTO_MS: Optional[float] = 1500.0   # None -> siempre se espera al modelo
+PRESUPUESTO_MAX_EN_VUELO = 2 * PLANIFICADOR_MAX_LOTE
+UMBRAL_PISTA_FAQ = 0.25   # similitud mínima para sugerir una FAQ en la respuesta provisional
+MAX_DIFERIDOS = 1024      # resultados pendientes de recoger que se conservan
+
+
+class ClasificacionConPlazo(NamedTuple):
+    categoria: str
+    scores: Dict[str, float]
+    prioridad: str
+    confianza: float
+    provisional: bool             # True si el modelo no llegó a tiempo
+    ticket: Optional[str]         # para recoger_diferido(); None si no hay nada pendiente
+    pistas_faq: List[Dict]        # FAQ parecidas (solo en la provisional)
+
+
+_ejecutor_plazo: Optional[EjecutorConPlazo] = None
+_ejecutor_plazo_lock = threading.Lock()
+_diferidos: "OrderedDict[str, Future]" = OrderedDict()
+_diferidos_lock = threading.Lock()
+
+
+def _ejecutor() -> EjecutorConPlazo:
+    global _ejecutor_plazo
+    with _ejecutor_plazo_lock:
+        if _ejecutor_plazo is None:
+            _ejecutor_plazo = EjecutorConPlazo(PRESUPUESTO_MAX_EN_VUELO, nombre="presupuesto")
+        return _ejecutor_plazo
+
+
+def _completar_en_segundo_plano(texto: str, resultado: Tuple[str, Dict[str, float], str, float]) -> None:
+    categoria, _, prioridad, conf = resultado
+    registrar_log(texto, categoria, prioridad, conf, respuesta_incidencia(categoria))
+
+
+def clasificar_incidencia_con_plazo(texto: str, presupuesto_ms: Optional[float] = None) -> ClasificacionConPlazo:
+    """
+    Como clasificar_incidencia, pero esperando al modelo como mucho
+    `presupuesto_ms` (por defecto PRESUPUESTO_MS). Si no llega, devuelve
+    una clasificación provisional (confianza 0) con un ticket para
+    recoger el resultado definitivo con recoger_diferido().
+    """
+    resultado = _clasificar_sin_modelo(texto)
+    if resultado is not None:
+        return ClasificacionConPlazo(*resultado, provisional=False, ticket=None, pistas_faq=[])
+
+    presupuesto_ms = PRESUPUESTO_MS if presupuesto_ms is None else presupuesto_ms
+    if presupuesto_ms is None:
+        return ClasificacionConPlazo(*_clasificar_con_modelo(texto), provisional=False, ticket=None, pistas_faq=[])
+
+    ejecucion = _ejecutor().ejecutar(
+        _clasificar_con_modelo, texto,
+        plazo_s=presupuesto_ms / 1000,
+        al_terminar=partial(_completar_en_segundo_plano, texto),
+    )
+    if ejecucion.a_tiempo:
+        return ClasificacionConPlazo(*ejecucion.valor, provisional=False, ticket=None, pistas_faq=[])
+
+    metricas.contar_ruta("provisional")
+    ticket = None
+    if ejecucion.futuro is not None:
+        ticket = uuid.uuid4().hex
+        with _diferidos_lock:
+            _diferidos[ticket] = ejecucion.futuro
+            while len(_diferidos) > MAX_DIFERIDOS:
+                _diferidos.popitem(last=False)
+
+    pistas = [FAQ[i] for i, similitud in buscar_faq_similar(texto, k=2) if similitud >= UMBRAL_PISTA_FAQ]
+    # Las reglas ya se probaron en _clasificar_sin_modelo y no encajaron
+    return ClasificacionConPlazo(
+        ETIQUETA_OTRO,
+        {},
+        estimar_prioridad(texto),
+        0.0,
+        provisional=True,
+        ticket=ticket,
+        pistas_faq=pistas,
     )
 
-    etiqueta_top = resultado["labels"][0]
-    score_top = float(resultado["scores"][0])
-    scores = dict(zip(resultado["labels"], resultado["scores"]))
 
-    prioridad = estimar_prioridad(texto)
+def recoger_diferido(ticket: str) -> Optional[Tuple[str, Dict[str, float], str, float]]:
+    """
+    Resultado definitivo de una clasificación provisional, o None si el
+    modelo aún no ha terminado. Una vez recogido se olvida. Si el modelo
+    falló (o el ticket ya no existe) lanza la excepción correspondiente.
+    """
+    with _diferidos_lock:
+        futuro = _diferidos.get(ticket)
+        if futuro is None:
+            raise KeyError(f"No hay ninguna clasificación pendiente con el ticket {ticket}.")
+        if not futuro.done():
+            return None
+        del _diferidos[ticket]
+    return futuro.result()
 
-    if score_top < UMBRAL_CONFIANZA:
-        etiqueta_top = "otro tipo de incidencia"
 
-    return etiqueta_top, scores, prioridad, score_top
+def estadisticas_presupuesto() -> Dict[str, float]:
+    """A tiempo / fuera de plazo / sin capacidad, y cómo acabaron las de segundo plano."""
+    return _ejecutor().estadisticas()
 
 
 # ---------- 4. Evaluación con CSV (incidencias.csv) ----------
 
-def evaluar_sobre_csv(ruta_csv: str) -> Tuple[pd.DataFrame, float]:
+def evaluar_sobre_csv(ruta_csv: str, batch_size: int = TAM_LOTE, modelo=None,
+                      mostrar: bool = True, comparar_cascada: bool = False,
+                      ruta_puntuaciones: Optional[str] = None) -> Tuple[pd.DataFrame, float]:
+    """
+    Con `comparar_cascada` (y la cascada disponible) el dataset se pasa
+    además solo por el modelo grande, para comparar precisión y coste en
+    df.attrs["cascada"]: el doble de inferencia, así que solo si se pide.
+
+    Con `ruta_puntuaciones` guarda además la matriz de puntuaciones de
+    cada fila (.npz) para probar otros umbrales sin volver a pasar el
+    modelo (utils_analisis).
+    """
     df = pd.read_csv(ruta_csv)
 
     predicciones = []
@@ -236,13 +897,27 @@ def evaluar_sobre_csv(ruta_csv: str) -> Tuple[pd.DataFrame, float]:
     confianzas = []
     aciertos = 0
 
-    print("🧪 Evaluación del asistente Nebrija sobre el dataset de ejemplo\n")
+    if mostrar:
+        print("🧪 Evaluación del asistente Nebrija sobre el dataset de ejemplo\n")
+
+    textos = df["texto"].astype(str).tolist()
+    esperados = df["tipo_esperado"].astype(str).tolist()
+
+    # Con la cascada activa se evalúa con una instancia propia, para que
+    # sus contadores reflejen solo este dataset
+    cascada_eval = None
+    if modelo is None and comparar_cascada and cascada_disponible():
+        cascada_eval = modelo = _nueva_cascada()
 
-    for i, fila in df.iterrows():
-        texto = str(fila["texto"])
-        esperado = str(fila["tipo_esperado"])
+    resultados = clasificar_incidencias_lote(textos, batch_size=batch_size, modelo=modelo)
+    if ruta_puntuaciones is not None:
+        guardar_puntuaciones(
+            ruta_puntuaciones, *matriz_puntuaciones(resultados, categorias), esperados,
+            categorias, ETIQUETA_OTRO, UMBRAL_CONFIANZA,
+        )
 
-        pred, scores, prioridad, conf = clasificar_incidencia(texto)
+    for i, (texto, esperado, resultado) in enumerate(zip(textos, esperados, resultados)):
+        pred, scores, prioridad, conf = resultado
 
         predicciones.append(pred)
         prioridades.append(prioridad)
@@ -252,27 +927,139 @@ def evaluar_sobre_csv(ruta_csv: str) -> Tuple[pd.DataFrame, float]:
         if coincide:
             aciertos += 1
 
-        print(f"Incidencia {i+1}:")
-        print(f"  Texto: {texto}")
-        print(f"  Etiqueta esperada: {esperado}")
-        print(f"  Predicción modelo: {pred} (confianza: {conf:.2f})")
-        print(f"  Prioridad estimada: {prioridad}")
-        print(f"  ¿Coincide?: {'✅' if coincide else '❌'}")
-        print()
+        if mostrar:
+            print(f"Incidencia {i+1}:")
+            print(f"  Texto: {texto}")
+            print(f"  Etiqueta esperada: {esperado}")
+            print(f"  Predicción modelo: {pred} (confianza: {conf:.2f})")
+            print(f"  Prioridad estimada: {prioridad}")
+            print(f"  ¿Coincide?: {'✅' if coincide else '❌'}")
+            print()
 
     df["prediccion"] = predicciones
     df["prioridad"] = prioridades
     df["confianza_top"] = confianzas
 
     precision = aciertos / len(df) if len(df) else 0.0
-    print(f"Precisión aproximada del modelo en este dataset: {precision:.2%}\n")
+    if mostrar:
+        print(f"Precisión aproximada del modelo en este dataset: {precision:.2%}\n")
+
+    if cascada_eval is not None:
+        df.attrs["cascada"] = _comparar_con_modelo_grande(
+            textos, esperados, batch_size, cascada_eval, precision, mostrar
+        )
 
     return df, precision
 
 
+def evaluar_sobre_csv_streaming(ruta_csv: str, ruta_salida: str = "resultados_evaluacion.csv",
+                                tam_bloque: int = 1000, batch_size: int = TAM_LOTE, modelo=None,
+                                reanudar: bool = True, n_procesos: int = 1,
+                                hilos: Optional[int] = None, puntuaciones: bool = True) -> Dict:
+    """
+    Variante de evaluar_sobre_csv para datasets grandes (p. ej. un export
+    histórico de 200k filas): lee por trozos, escribe `ruta_salida` sobre
+    la marcha y, si se interrumpe, la siguiente llamada sigue donde se
+    quedó. En vez de imprimir cada fila informa del progreso y del ritmo.
+
+    Con n_procesos > 1 reparte los trozos entre procesos, cada uno con su
+    propio modelo y `hilos` hilos de torch (por defecto núcleos / procesos).
+    Con `puntuaciones` la matriz de puntuaciones queda en "<salida>.npz".
+    """
+    if n_procesos > 1 and modelo is not None:
+        raise ValueError("Con varios procesos cada uno carga su modelo: no se puede pasar `modelo`.")
+
+    print(f"🧪 Evaluación por bloques de {ruta_csv}")
+    if modelo is None:
+        clasificar_lote = partial(clasificar_incidencias_lote, batch_size=batch_size)
+    else:
+        clasificar_lote = partial(clasificar_incidencias_lote, batch_size=batch_size, modelo=modelo)
+    return evaluar_en_streaming(
+        ruta_csv,
+        ruta_salida,
+        clasificar_lote,
+        tam_bloque=tam_bloque,
+        reanudar=reanudar,
+        n_procesos=n_procesos,
+        hilos=hilos,
+        preparar_trabajador=cargar_modelos,
+        captura=CapturaPorBloques(
+            Path(ruta_salida).with_suffix(".npz"), categorias, ETIQUETA_OTRO, UMBRAL_CONFIANZA
+        ) if puntuaciones else None,
+    )
+
+
+def _comparar_con_modelo_grande(textos: List[str], esperados: List[str], batch_size: int,
+                                cascada: ClasificadorCascada, precision_cascada: float,
+                                mostrar: bool) -> Dict[str, float]:
+    # Mismo dataset solo con el modelo grande, para ver qué se gana y qué
+    # se pierde con la cascada. El coste es tiempo de modelo por incidencia
+    # que llega al modelo (las resueltas por reglas no cuentan en ninguno).
+    inicio = time.perf_counter()
+    solo_grande = clasificar_incidencias_lote(textos, batch_size=batch_size, modelo=gestor_modelo.obtener())
+    segundos_grande = time.perf_counter() - inicio
+
+    etapas = cascada.estadisticas()
+    al_modelo = etapas["pequeno"]["resueltos"] + etapas["grande"]["resueltos"]
+    aciertos_grande = sum(pred == esperado for (pred, _, _, _), esperado in zip(solo_grande, esperados))
+
+    comparacion = {
+        "precision_cascada": precision_cascada,
+        "precision_grande": aciertos_grande / len(textos) if textos else 0.0,
+        "ms_cascada": cascada.coste_medio_ms(),
+        "ms_grande": 1000 * segundos_grande / al_modelo if al_modelo else 0.0,
+        "resueltas_pequeno": etapas["pequeno"]["tasa_resueltos"],
+        "ms_etapa_pequeno": etapas["pequeno"]["ms_por_texto"],
+        "ms_etapa_grande": etapas["grande"]["ms_por_texto"],
+    }
+
+    if mostrar:
+        print("⚖️ Cascada frente a usar siempre el modelo grande")
+        print(f"  Precisión: {comparacion['precision_cascada']:.2%} (cascada) "
+              f"vs {comparacion['precision_grande']:.2%} (solo grande)")
+        print(f"  Coste medio: {comparacion['ms_cascada']:.1f} ms/incidencia (cascada) "
+              f"vs {comparacion['ms_grande']:.1f} ms (solo grande)")
+        print(f"  Resueltas por el modelo pequeño: {comparacion['resueltas_pequeno']:.0%} "
+              f"({comparacion['ms_etapa_pequeno']:.1f} ms/texto; "
+              f"grande {comparacion['ms_etapa_grande']:.1f} ms/texto)\n")
+
+    return comparacion
+
+
 # ---------- 5. Registro de chat (log) ----------
 
 LOG_PATH = Path("log_chat.csv")
+LOG_COLUMNAS = ["timestamp", "texto_usuario", "tipo_detectado", "prioridad", "confianza_top", "respuesta_resumen"]
+
+# Las filas se encolan y un hilo las escribe por lotes (ver utils_registro).
+# Rotación: al llegar a este tamaño el log pasa a log_chat-<fecha>.csv.
+LOG_ROTAR_BYTES: Optional[int] = 50 * 1024 * 1024
+LOG_ROTAR_DIARIO = False
+
+_escritores: Dict[str, EscritorCSV] = {}
+_escritores_lock = threading.Lock()
+
+
+def _escritor(ruta: Path, columnas: List[str], rotar: bool = False) -> EscritorCSV:
+    clave = str(ruta.resolve())
+    with _escritores_lock:
+        if clave not in _escritores:
+            _escritores[clave] = EscritorCSV(
+                ruta,
+                columnas,
+                rotar_bytes=LOG_ROTAR_BYTES if rotar else None,
+                rotar_diario=LOG_ROTAR_DIARIO if rotar else False,
+            )
+        return _escritores[clave]
+
+
+def vaciar_registros() -> None:
+    """Espera a que los logs y el feedback encolados estén escritos en disco."""
+    with _escritores_lock:
+        escritores = list(_escritores.values())
+    for e in escritores:
+        e.vaciar()
+
 
 def registrar_log(texto_usuario: str, tipo: str, prioridad: str, confianza: float, respuesta: str) -> None:
     fila = {
@@ -284,29 +1071,68 @@ def registrar_log(texto_usuario: str, tipo: str, prioridad: str, confianza: floa
         "respuesta_resumen": respuesta.replace("\n", " ").strip()[:250]
     }
 
-    existe = LOG_PATH.exists()
-    df = pd.DataFrame([fila])
-    df.to_csv(LOG_PATH, mode="a", index=False, header=not existe, encoding="utf-8")
+    with metricas.etapa("registro"):
+        _escritor(LOG_PATH, LOG_COLUMNAS, rotar=True).escribir(fila)
+
+
+# ---------- 5b. Logs en formato columnar (analítica) ----------
+
+# El CSV es para añadir rápido; para consultar (por horas, categorías,
+# prioridades...) se compacta en Parquet particionado por día, con
+# tipo_detectado y prioridad como categorías (utils_compactacion).
+# Necesita pyarrow. También se puede lanzar por cron:
+#   python utils_compactacion.py log_chat.csv logs_columnar
+LOGS_COLUMNAR_DIR = Path("logs_columnar")
+
+
+def compactar_logs() -> Dict[str, int]:
+    """Vacía la cola del log y pasa a Parquet lo que aún no esté compactado."""
+    vaciar_registros()
+    return CompactadorLogs(LOG_PATH, LOGS_COLUMNAR_DIR).compactar()
 
 
 # ---------- 6. Registro de feedback (SI / NO) ----------
 
 FEEDBACK_PATH = Path("feedback_chat.csv")
+FEEDBACK_DB_PATH = Path("feedback_chat.sqlite")
+FEEDBACK_COLUMNAS = LOG_COLUMNAS + ["feedback", "question_id"]
+
+
+def _almacen_feedback() -> AlmacenFeedback:
+    # El CSV sigue siendo el registro exportable; el índice SQLite es el
+    # que decide en O(1) si una pregunta ya tiene voto.
+    return obtener_almacen(FEEDBACK_DB_PATH, FEEDBACK_PATH)
+
+
+def feedback_registrado(question_id: str) -> Optional[str]:
+    """Voto guardado (SI / NO) para esa pregunta, o None si aún no hay."""
+    return _almacen_feedback().voto(question_id)
 
-def registrar_feedback(texto_usuario: str, tipo: str, prioridad: str, confianza: float, respuesta: str, feedback: str) -> None:
+
+def estadisticas_feedback() -> Dict:
+    """Totales SI/NO y desgloses, mantenidos al registrar cada voto (O(1))."""
+    return _almacen_feedback().estadisticas()
+
+
+def registrar_feedback(texto_usuario: str, tipo: str, prioridad: str, confianza: float, respuesta: str, feedback: str,
+                       question_id: Optional[str] = None) -> bool:
     fila = {
         "timestamp": datetime.now().isoformat(timespec="seconds"),
         "texto_usuario": texto_usuario,
         "tipo_detectado": tipo,
         "prioridad": prioridad,
         "confianza_top": round(confianza, 4),
-        "respuesta_resumen": respuesta.replace("\n", " ").strip()[:250],
-        "feedback": feedback
+        "respuesta_resumen": resumir_respuesta(respuesta),
+        "feedback": feedback,
+        "question_id": question_id or build_question_id(texto_usuario, respuesta),
     }
 
-    existe = FEEDBACK_PATH.exists()
-    df = pd.DataFrame([fila])
-    df.to_csv(FEEDBACK_PATH, mode="a", index=False, header=not existe, encoding="utf-8")
+    # Devuelve False (y no escribe nada) si esa pregunta ya tenía feedback
+    if not _almacen_feedback().insertar(fila):
+        return False
+
+    _escritor(FEEDBACK_PATH, FEEDBACK_COLUMNAS).escribir(fila)
+    return True
 
 
 # ---------- 7. Chat interactivo ----------
@@ -320,6 +1146,48 @@ def formatear_links(links: List[Dict[str, str]]) -> str:
     return "\n".join(out)
 
 
+RESPUESTAS_INCIDENCIA: Dict[str, str] = {
+    "problema de acceso": (
+        "Te recomiendo probar primero:\n"
+        "1) Comprobar usuario/contraseña\n"
+        "2) Probar modo incógnito\n"
+        "3) Restablecer contraseña si es necesario\n"
+        "Si me dices el mensaje de error, lo afinamos."
+    ),
+    "error de matrícula": (
+        "En errores de matrícula suele ayudar:\n"
+        "1) Revisar en qué paso ocurre (confirmación/pago/asignaturas)\n"
+        "2) Hacer captura del error\n"
+        "3) Abrir ticket a Secretaría/Soporte con esa información"
+    ),
+    "cuenta bloqueada": (
+        "Es posible que la cuenta se haya bloqueado por intentos fallidos.\n"
+        "Prueba a restablecer la contraseña y, si sigue igual, solicita desbloqueo a Soporte."
+    ),
+    "consulta administrativa": (
+        "Para consultas administrativas, normalmente encontrarás la info en el portal del alumno "
+        "o normativa/calendario académico. Si me das más detalle, te digo el paso exacto."
+    ),
+    "problema técnico": (
+        "Para problemas técnicos:\n"
+        "- indica qué aplicación/sistema falla\n"
+        "- desde cuándo\n"
+        "- dispositivo/navegador\n"
+        "Con eso se puede abrir un ticket más completo."
+    ),
+}
+
+RESPUESTA_INCIDENCIA_DUDOSA = (
+    "No estoy 100% seguro del tipo de incidencia. "
+    "Si me das más detalle (qué sistema, qué estabas intentando hacer y qué error sale), "
+    "puedo clasificarlo mejor o derivarlo."
+)
+
+
+def respuesta_incidencia(categoria: str) -> str:
+    return RESPUESTAS_INCIDENCIA.get(categoria, RESPUESTA_INCIDENCIA_DUDOSA)
+
+
 def chat_simulado() -> None:
     print("\n💬 Chat con el asistente Nebrija (FAQ + Incidencias)")
     print("Escribe 'salir' para terminar.\n")
@@ -330,6 +1198,7 @@ def chat_simulado() -> None:
             print("🤖 Asistente: Gracias, hasta pronto.")
             break
 
+        inicio = time.perf_counter()
         faq = detectar_faq(texto)
         if faq:
             respuesta = faq["answer"]
@@ -339,6 +1208,7 @@ def chat_simulado() -> None:
                 print(links_txt)
             print()
             registrar_log(texto, f"FAQ:{faq['intent']}", "n/a", 1.0, respuesta)
+            metricas.observar("mensaje", time.perf_counter() - inicio)
             continue
 
         categoria, scores, prioridad, conf = clasificar_incidencia(texto)
@@ -346,45 +1216,7 @@ def chat_simulado() -> None:
         print(f"🤖 Asistente: He detectado que tu incidencia parece un '{categoria}'.")
         print(f"   Prioridad estimada: {prioridad.upper()} (confianza: {conf:.2f})")
 
-        if categoria == "problema de acceso":
-            respuesta = (
-                "Te recomiendo probar primero:\n"
-                "1) Comprobar usuario/contraseña\n"
-                "2) Probar modo incógnito\n"
-                "3) Restablecer contraseña si es necesario\n"
-                "Si me dices el mensaje de error, lo afinamos."
-            )
-        elif categoria == "error de matrícula":
-            respuesta = (
-                "En errores de matrícula suele ayudar:\n"
-                "1) Revisar en qué paso ocurre (confirmación/pago/asignaturas)\n"
-                "2) Hacer captura del error\n"
-                "3) Abrir ticket a Secretaría/Soporte con esa información"
-            )
-        elif categoria == "cuenta bloqueada":
-            respuesta = (
-                "Es posible que la cuenta se haya bloqueado por intentos fallidos.\n"
-                "Prueba a restablecer la contraseña y, si sigue igual, solicita desbloqueo a Soporte."
-            )
-        elif categoria == "consulta administrativa":
-            respuesta = (
-                "Para consultas administrativas, normalmente encontrarás la info en el portal del alumno "
-                "o normativa/calendario académico. Si me das más detalle, te digo el paso exacto."
-            )
-        elif categoria == "problema técnico":
-            respuesta = (
-                "Para problemas técnicos:\n"
-                "- indica qué aplicación/sistema falla\n"
-                "- desde cuándo\n"
-                "- dispositivo/navegador\n"
-                "Con eso se puede abrir un ticket más completo."
-            )
-        else:
-            respuesta = (
-                "No estoy 100% seguro del tipo de incidencia. "
-                "Si me das más detalle (qué sistema, qué estabas intentando hacer y qué error sale), "
-                "puedo clasificarlo mejor o derivarlo."
-            )
+        respuesta = respuesta_incidencia(categoria)
 
         print("   " + respuesta.replace("\n", "\n   "))
 
@@ -396,17 +1228,21 @@ def chat_simulado() -> None:
 
         print()
         registrar_log(texto, categoria, prioridad, conf, respuesta)
+        metricas.observar("mensaje", time.perf_counter() - inicio)
 
 
 # ---------- 8. Punto de entrada ----------
 
 if __name__ == "__main__":
     print("=== Asistente Nebrija · Versión mejorada ===\n")
+    precargar_modelos()
+    iniciar_exportacion_metricas()
 
     try:
-        df_resultados, precision = evaluar_sobre_csv("incidencias.csv")
+        df_resultados, precision = evaluar_sobre_csv("incidencias.csv", ruta_puntuaciones="resultados_evaluacion.npz")
         df_resultados.to_csv("resultados_evaluacion.csv", index=False, encoding="utf-8")
-        print("✅ Se ha guardado 'resultados_evaluacion.csv' con predicciones y confianza.\n")
+        print("✅ Se ha guardado 'resultados_evaluacion.csv' con predicciones y confianza "
+              "(y las puntuaciones en 'resultados_evaluacion.npz').\n")
     except FileNotFoundError:
         print("No se ha encontrado 'incidencias.csv'. "
               "Crea el archivo en la misma carpeta para ejecutar la evaluación.\n")
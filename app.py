@@ -8,18 +8,47 @@
 # python -m streamlit run app.py
 
 import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait as esperar_futuros
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
 import streamlit as st
 import pandas as pd
-from pandas.errors import EmptyDataError
 
 from Asistente_Nebrija import (
     detectar_faq,
-    clasificar_incidencia,
+    clasificar_incidencia_con_plazo,
+    recoger_diferido,
+    estadisticas_presupuesto,
+    cascada_disponible,
+    memoria_proceso,
     preguntas_seguimiento,
+    estimar_prioridad,
     evaluar_sobre_csv,
     registrar_log,
     registrar_feedback,
+    precargar_modelos,
+    iniciar_exportacion_metricas,
+    metricas,
+    feedback_registrado,
+    estadisticas_feedback,
+    compactar_logs,
+    LOGS_COLUMNAR_DIR,
+)
+from utils_analisis import (
+    Puntuaciones,
+    barrido_umbral,
+    cargar_puntuaciones,
+    matriz_confusion,
+    mejor_umbral,
+    precision_exhaustividad,
 )
+from utils_compactacion import ARCHIVO_ESTADO, contar_por_periodo, resumen_por_categoria
+from utils_csv import ultimas_filas
+from utils_feedback import build_question_id
+from utils_historial import HistorialChat, purgar_historiales
 
 st.set_page_config(
     page_title="Asistente Nebrija",
@@ -30,123 +59,234 @@ st.set_page_config(
 st.title("🤖 Tony, el asistente de la Nebrija (Prototipo)")
 st.caption("Interfaz visual para las incidencias de los alumnos de Nebrija.")
 
+# Precarga de los modelos en segundo plano (una sola vez por proceso):
+# las FAQ se responden ya mientras el modelo termina de cargar.
+precargar_modelos()
+iniciar_exportacion_metricas()
+
 # ---------- Utilidades locales (para evitar duplicados y lecturas rotas) ----------
 FEEDBACK_PATH = "feedback_chat.csv"
-FEEDBACK_COLUMNS = [
-    "timestamp",
-    "texto_usuario",
-    "tipo_detectado",
-    "prioridad",
-    "confianza_top",
-    "respuesta_resumen",
-    "feedback",
-    # columna extra para bloquear duplicados (la gestionamos desde app.py)
-    "question_id",
-]
-
-
-def _ensure_feedback_file_has_header() -> None:
+
+# Historial por sesión: solo los últimos mensajes viven en memoria y se
+# pintan; el resto va a historial_sesiones/<sesión>.jsonl
+HISTORIAL_DIR = Path("historial_sesiones")
+HISTORIAL_VENTANA = 30
+HISTORIAL_PAGINA = 20
+
+# Chat no bloqueante: la clasificación se lanza en un pool y un fragmento
+# pinta el resultado cuando llega; el resto de la página sigue usable
+MAX_CLASIFICACIONES_CHAT = 16
+ESPERA_INMEDIATA_S = 0.05   # lo que se espera antes de mostrar "Clasificando…"
+INTERVALO_SONDEO_S = 0.5
+
+FRECUENCIAS_ANALITICA = {"hora": "h", "día": "D"}
+
+# Puntuaciones de la última evaluación (para probar umbrales al instante)
+RUTA_PUNTUACIONES = "resultados_evaluacion.npz"
+
+
+def _tail_df(path: str, n: int) -> pd.DataFrame:
     """
-    Si feedback_chat.csv no existe o está vacío (0 bytes), crea el archivo con cabecera.
-    Esto evita EmptyDataError de pandas.
+    Últimas n filas del CSV sin parsear el archivo entero: se busca desde
+    el final y, entre reruns, solo se leen los bytes nuevos (utils_csv).
     """
-    if (not os.path.exists(FEEDBACK_PATH)) or (os.path.getsize(FEEDBACK_PATH) == 0):
-        df = pd.DataFrame(columns=FEEDBACK_COLUMNS)
-        df.to_csv(FEEDBACK_PATH, index=False, encoding="utf-8")
+    cabecera, filas = ultimas_filas(path, n)
+    return pd.DataFrame(filas, columns=cabecera)
 
 
-def _safe_read_csv(path: str) -> pd.DataFrame:
+def _safe_feedback_stats() -> tuple[int, int, int, float, dict]:
     """
-    Lee CSV de forma robusta:
-    - Si no existe o está vacío: devuelve DF vacío (con columnas).
-    - Si pandas lanza EmptyDataError: devuelve DF vacío.
-    - Limpia nombres de columnas.
+    Devuelve (total_validos, si, no, ratio_si, stats)
+    - Lee los agregados que se actualizan con cada voto: no recorre el CSV.
+    - total_validos cuenta solo SI/NO.
     """
-    if (not os.path.exists(path)) or (os.path.getsize(path) == 0):
-        return pd.DataFrame(columns=FEEDBACK_COLUMNS)
-
     try:
-        df = pd.read_csv(path)
-    except EmptyDataError:
-        return pd.DataFrame(columns=FEEDBACK_COLUMNS)
+        stats = estadisticas_feedback()
     except Exception:
         # Si hay cualquier problema raro, no rompemos la app
-        return pd.DataFrame(columns=FEEDBACK_COLUMNS)
+        return 0, 0, 0, 0.0, {}
 
-    if df is None or df.empty:
-        return pd.DataFrame(columns=FEEDBACK_COLUMNS)
+    total, si, no = stats["total"], stats["si"], stats["no"]
+    ratio = (si / total) if total else 0.0
+    return total, si, no, ratio, stats
+
+
+def _respuesta_clasificacion(categoria: str, prioridad: str, conf: float) -> str:
+    respuesta = (
+        f"**Clasificación:** {categoria}\n\n"
+        f"**Prioridad estimada:** {prioridad.upper()}  \n"
+        f"**Confianza:** {conf:.2f}\n\n"
+    )
+
+    if categoria == "problema de acceso":
+        respuesta += "Te recomiendo probar: modo incógnito, revisar credenciales y restablecer contraseña si es necesario."
+    elif categoria == "error de matrícula":
+        respuesta += "Indica en qué paso ocurre (confirmación/pago/asignaturas) y el mensaje de error. Si procede, abre ticket con captura."
+    elif categoria == "cuenta bloqueada":
+        respuesta += "Prueba restablecer la contraseña. Si sigue igual, solicita desbloqueo a Soporte."
+    elif categoria == "consulta administrativa":
+        respuesta += "Suele resolverse consultando portal del alumno/normativa. Si me dices el trámite concreto, te digo dónde mirarlo."
+    elif categoria == "problema técnico":
+        respuesta += "Dime qué aplicación falla, desde cuándo y dispositivo/navegador para orientar mejor el ticket."
+    else:
+        respuesta += "No estoy seguro al 100%. Si me das más detalle (sistema, error, contexto), lo clasificaré mejor."
 
-    df.columns = df.columns.astype(str).str.strip()
-    return df
+    if categoria == "otro tipo de incidencia" or conf < 0.55:
+        respuesta += "\n\n**Para afinar, dime por favor:**\n"
+        for q in preguntas_seguimiento(categoria):
+            respuesta += f"- {q}\n"
+    return respuesta
 
 
-def _build_question_id(texto_usuario: str, respuesta: str) -> str:
+def _respuesta_provisional(prioridad: str, pistas_faq: list, en_marcha: bool) -> str:
     """
-    Id estable para una pregunta+respuesta.
+    Lo que se contesta si el modelo no llega a tiempo (FAQ parecidas,
+    prioridad, seguimiento). `en_marcha` indica si el análisis completo
+    sigue en segundo plano (hay ticket) o ni siquiera se pudo lanzar.
     """
-    base = (texto_usuario or "").strip() + "||" + (respuesta or "").strip()
-    return str(abs(hash(base)))
-
-
-def _feedback_already_recorded(question_id: str) -> bool:
-    """
-    Bloqueo persistente: si el CSV ya tiene una fila con ese question_id, no deja volver a votar.
-    Importante: soporta archivo vacío y falta de columnas.
-    """
-    # Si no existe o está vacío, no hay registros
-    if (not os.path.exists(FEEDBACK_PATH)) or (os.path.getsize(FEEDBACK_PATH) == 0):
-        return False
+    if en_marcha:
+        aviso = "el análisis completo sigue en marcha y aparecerá aquí en cuanto termine."
+    else:
+        aviso = ("ahora mismo hay demasiadas consultas y no se ha podido iniciar el análisis completo; "
+                 "vuelve a enviarla en unos segundos.")
+    respuesta = (
+        f"⏳ **Respuesta rápida:** {aviso}\n\n"
+        f"**Prioridad estimada:** {prioridad.upper()}\n\n"
+    )
+    if pistas_faq:
+        respuesta += "**Quizá te sirva:**\n"
+        for faq in pistas_faq:
+            respuesta += f"- {faq['answer'].splitlines()[0]}\n"
+            for l in faq.get("links", []):
+                respuesta += f"  - [{l['text']}]({l['url']})\n"
+        respuesta += "\n"
+    respuesta += "**Mientras tanto, dime por favor:**\n"
+    for q in preguntas_seguimiento("otro tipo de incidencia"):
+        respuesta += f"- {q}\n"
+    return respuesta
+
+
+def _recoger_pendientes(historial: HistorialChat) -> bool:
+    """Añade al chat las clasificaciones de segundo plano que ya han terminado (True si alguna)."""
+    siguen = []
+    for p in st.session_state.pendientes:
+        try:
+            resultado = recoger_diferido(p["ticket"])
+        except Exception:
+            historial.agregar("assistant", f"⚠️ No se pudo completar el análisis de «{p['texto_usuario']}».")
+            continue
+        if resultado is None:
+            siguen.append(p)
+            continue
+
+        categoria, _, prioridad, conf = resultado
+        respuesta = (
+            f"🔄 **Análisis completo de «{p['texto_usuario']}»**\n\n"
+            + _respuesta_clasificacion(categoria, prioridad, conf)
+        )
+        historial.agregar("assistant", respuesta)
+        st.session_state.ultima_interaccion = {
+            "texto_usuario": p["texto_usuario"],
+            "tipo": categoria,
+            "prioridad": prioridad,
+            "confianza": conf,
+            "respuesta": respuesta
+        }
+    hay_nuevas = len(siguen) < len(st.session_state.pendientes)
+    st.session_state.pendientes = siguen
+    return hay_nuevas
+
+
+@st.cache_resource
+def _pool_chat() -> ThreadPoolExecutor:
+    """Hilos para las clasificaciones del chat, compartidos por todas las sesiones."""
+    return ThreadPoolExecutor(max_workers=MAX_CLASIFICACIONES_CHAT, thread_name_prefix="chat")
+
+
+def _cerrar_en_curso(historial: HistorialChat) -> str:
+    """Pinta en el historial la clasificación ya terminada de st.session_state.en_curso."""
+    en_curso = st.session_state.en_curso
+    st.session_state.en_curso = None
+    user_text = en_curso["texto_usuario"]
 
-    df = _safe_read_csv(FEEDBACK_PATH)
-    if df.empty:
-        return False
+    try:
+        r = en_curso["futuro"].result()
+    except Exception as e:
+        respuesta = f"⚠️ No se pudo clasificar la incidencia ({e}). Inténtalo de nuevo en unos segundos."
+        historial.agregar("assistant", respuesta)
+        return respuesta
+
+    if r.provisional:
+        respuesta = _respuesta_provisional(r.prioridad, r.pistas_faq, en_marcha=r.ticket is not None)
+        tipo = f"PROVISIONAL:{r.categoria}"
+        if r.ticket is not None:
+            st.session_state.pendientes.append({"ticket": r.ticket, "texto_usuario": user_text})
+    else:
+        respuesta = _respuesta_clasificacion(r.categoria, r.prioridad, r.confianza)
+        tipo = r.categoria
 
-    # si el CSV todavía no tiene la columna question_id, no podemos bloquear persistente
-    if "question_id" not in df.columns:
-        return False
+    historial.agregar("assistant", respuesta)
+    registrar_log(user_text, tipo, r.prioridad, r.confianza, respuesta)
+    metricas.observar("mensaje", time.perf_counter() - en_curso["inicio"])
 
-    return (df["question_id"].astype(str) == str(question_id)).any()
+    st.session_state.ultima_interaccion = {
+        "texto_usuario": user_text,
+        "tipo": tipo,
+        "prioridad": r.prioridad,
+        "confianza": r.confianza,
+        "respuesta": respuesta
+    }
+    return respuesta
 
 
-def _append_question_id_to_last_row(question_id: str) -> None:
+@st.fragment(run_every=INTERVALO_SONDEO_S)
+def _seguir_respuestas(historial: HistorialChat) -> None:
     """
-    Tu registrar_feedback de Asistente_Nebrija escribe una fila nueva.
-    Aquí añadimos/actualizamos question_id en la última fila para bloqueo persistente.
+    Se repite cada INTERVALO_SONDEO_S mientras haya algo pendiente. Cuando
+    llega un resultado se vuelve a ejecutar la página una vez (historial y
+    feedback); mientras tanto solo se repinta este placeholder.
     """
-    _ensure_feedback_file_has_header()
+    en_curso = st.session_state.en_curso
+    if en_curso is not None:
+        if en_curso["futuro"].done():
+            _cerrar_en_curso(historial)
+            st.rerun()
+        with st.chat_message("assistant"):
+            st.markdown(
+                f"**Prioridad estimada:** {en_curso['prioridad'].upper()}\n\n"
+                f"⏳ Clasificando… ({time.perf_counter() - en_curso['inicio']:.0f} s)"
+            )
+    elif _recoger_pendientes(historial):
+        st.rerun()
 
-    df = _safe_read_csv(FEEDBACK_PATH)
-    if df.empty:
-        return
 
-    if "question_id" not in df.columns:
-        df["question_id"] = ""
+@st.cache_data(max_entries=2)
+def _puntuaciones(version: int) -> Puntuaciones:
+    return cargar_puntuaciones(RUTA_PUNTUACIONES)
 
-    df.loc[df.index.max(), "question_id"] = str(question_id)
-    df.to_csv(FEEDBACK_PATH, index=False, encoding="utf-8")
 
+@st.cache_data(max_entries=2)
+def _barrido(version: int) -> pd.DataFrame:
+    return barrido_umbral(_puntuaciones(version))
 
-def _safe_feedback_stats() -> tuple[int, int, int, float, pd.DataFrame]:
-    """
-    Devuelve (total_validos, si, no, ratio_si, df_fb)
-    - No revienta si falta feedback o si CSV vacío.
-    - total_validos cuenta solo SI/NO.
-    """
-    df_fb = _safe_read_csv(FEEDBACK_PATH)
 
-    if df_fb.empty:
-        return 0, 0, 0, 0.0, df_fb
+def _version_logs_columnar() -> int:
+    """Cambia con cada compactación: invalida las consultas cacheadas."""
+    try:
+        return (LOGS_COLUMNAR_DIR / ARCHIVO_ESTADO).stat().st_mtime_ns
+    except OSError:
+        return 0
 
-    # Asegura columna feedback
-    if "feedback" not in df_fb.columns:
-        df_fb["feedback"] = ""
 
-    fb = df_fb["feedback"].astype(str).str.strip().str.upper()
-    si = int((fb == "SI").sum())
-    no = int((fb == "NO").sum())
-    total = int(si + no)
-    ratio = (si / total) if total else 0.0
-    return total, si, no, ratio, df_fb
+@st.cache_data(max_entries=64)
+def _serie_logs(desde: datetime, hasta: datetime, frecuencia: str, tipos: tuple, prioridades: tuple,
+                version: int) -> pd.DataFrame:
+    return contar_por_periodo(LOGS_COLUMNAR_DIR, desde, hasta, frecuencia, tipos=tipos, prioridades=prioridades)
+
+
+@st.cache_data(max_entries=64)
+def _resumen_logs(desde: datetime, hasta: datetime, tipos: tuple, prioridades: tuple, version: int) -> pd.DataFrame:
+    return resumen_por_categoria(LOGS_COLUMNAR_DIR, desde, hasta, tipos=tipos, prioridades=prioridades)
 
 
 # ---------------- Layout principal ----------------
@@ -157,26 +297,66 @@ with col_chat:
     st.subheader("💬 Chat")
 
     if "historial" not in st.session_state:
-        st.session_state.historial = []
+        purgar_historiales(HISTORIAL_DIR)
+        st.session_state.historial = HistorialChat(
+            HISTORIAL_DIR / f"{uuid.uuid4().hex}.jsonl",
+            ventana=HISTORIAL_VENTANA,
+            tam_pagina=HISTORIAL_PAGINA,
+        )
+    historial: HistorialChat = st.session_state.historial
+    historial.mantener_vivo()  # que purgar_historiales no borre su archivo mientras se usa
 
     if "ultima_interaccion" not in st.session_state:
         st.session_state.ultima_interaccion = None
 
+    # Clasificaciones que no llegaron a tiempo y siguen en segundo plano
+    if "pendientes" not in st.session_state:
+        st.session_state.pendientes = []  # [{"ticket", "texto_usuario"}]
+    _recoger_pendientes(historial)
+
     # Bloqueo en sesión (para que no puedas clickar mil veces sin recargar)
     if "feedback_done" not in st.session_state:
         st.session_state.feedback_done = {}  # question_id -> "SI"/"NO"
 
-    for msg in st.session_state.historial:
+    # Los mensajes antiguos no se pintan en cada rerun: están en disco y
+    # se consultan por páginas solo si se piden
+    if historial.n_desbordados:
+        with st.expander(f"🕘 Mensajes anteriores ({historial.n_desbordados})"):
+            c1, c2 = st.columns(2)
+            if c1.button("⬆️ Cargar anteriores", disabled=not historial.hay_anteriores):
+                historial.pagina_anterior()
+            if c2.button("⬇️ Más recientes", disabled=not historial.hay_siguientes):
+                historial.pagina_siguiente()
+            for msg in historial.pagina:
+                with st.chat_message(msg["role"]):
+                    st.caption(msg.get("timestamp", ""))
+                    st.markdown(msg["content"])
+
+    for msg in historial.recientes:
         with st.chat_message(msg["role"]):
             st.markdown(msg["content"])
 
-    user_text = st.chat_input("Escribe tu consulta o incidencia…")
+    if "en_curso" not in st.session_state:
+        st.session_state.en_curso = None  # clasificación lanzada y aún sin pintar
+
+    user_text = st.chat_input(
+        "Escribe tu consulta o incidencia…",
+        disabled=st.session_state.en_curso is not None,
+    )
+
+    # Doble envío rápido (antes de que el input se pinte deshabilitado):
+    # no se lanza otra inferencia mientras haya una en curso
+    if user_text and st.session_state.en_curso is not None:
+        if user_text != st.session_state.en_curso["texto_usuario"]:
+            st.toast("Espera a que termine la respuesta anterior.")
+        user_text = None
 
     if user_text:
-        st.session_state.historial.append({"role": "user", "content": user_text})
+        historial.agregar("user", user_text)
         with st.chat_message("user"):
             st.markdown(user_text)
 
+        inicio = time.perf_counter()
         faq = detectar_faq(user_text)
         if faq:
             answer = faq["answer"]
@@ -187,11 +367,12 @@ with col_chat:
                 for l in links:
                     answer += f"- [{l['text']}]({l['url']})\n"
 
-            st.session_state.historial.append({"role": "assistant", "content": answer})
+            historial.agregar("assistant", answer)
             with st.chat_message("assistant"):
                 st.markdown(answer)
 
             registrar_log(user_text, f"FAQ:{faq['intent']}", "n/a", 1.0, answer)
+            metricas.observar("mensaje", time.perf_counter() - inicio)
 
             st.session_state.ultima_interaccion = {
                 "texto_usuario": user_text,
@@ -202,45 +383,28 @@ with col_chat:
             }
 
         else:
-            categoria, scores, prioridad, conf = clasificar_incidencia(user_text)
-
-            respuesta = (
-                f"**Clasificación:** {categoria}\n\n"
-                f"**Prioridad estimada:** {prioridad.upper()}  \n"
-                f"**Confianza:** {conf:.2f}\n\n"
-            )
-
-            if categoria == "problema de acceso":
-                respuesta += "Te recomiendo probar: modo incógnito, revisar credenciales y restablecer contraseña si es necesario."
-            elif categoria == "error de matrícula":
-                respuesta += "Indica en qué paso ocurre (confirmación/pago/asignaturas) y el mensaje de error. Si procede, abre ticket con captura."
-            elif categoria == "cuenta bloqueada":
-                respuesta += "Prueba restablecer la contraseña. Si sigue igual, solicita desbloqueo a Soporte."
-            elif categoria == "consulta administrativa":
-                respuesta += "Suele resolverse consultando portal del alumno/normativa. Si me dices el trámite concreto, te digo dónde mirarlo."
-            elif categoria == "problema técnico":
-                respuesta += "Dime qué aplicación falla, desde cuándo y dispositivo/navegador para orientar mejor el ticket."
-            else:
-                respuesta += "No estoy seguro al 100%. Si me das más detalle (sistema, error, contexto), lo clasificaré mejor."
-
-            if categoria == "otro tipo de incidencia" or conf < 0.55:
-                respuesta += "\n\n**Para afinar, dime por favor:**\n"
-                for q in preguntas_seguimiento(categoria):
-                    respuesta += f"- {q}\n"
-
-            st.session_state.historial.append({"role": "assistant", "content": respuesta})
-            with st.chat_message("assistant"):
-                st.markdown(respuesta)
-
-            registrar_log(user_text, categoria, prioridad, conf, respuesta)
-
-            st.session_state.ultima_interaccion = {
+            # La clasificación va al pool; el script no espera al modelo
+            prioridad = estimar_prioridad(user_text)
+            en_curso = {
                 "texto_usuario": user_text,
-                "tipo": categoria,
                 "prioridad": prioridad,
-                "confianza": conf,
-                "respuesta": respuesta
+                "inicio": inicio,
+                "futuro": _pool_chat().submit(clasificar_incidencia_con_plazo, user_text),
             }
+            st.session_state.en_curso = en_curso
+            # Reglas / caché / vecinos contestan en este margen: sin placeholder.
+            # wait() no relanza la excepción de la tarea: si falla (p. ej. el
+            # modelo no cargó), _cerrar_en_curso muestra el error en el chat
+            esperar_futuros([en_curso["futuro"]], timeout=ESPERA_INMEDIATA_S)
+            if en_curso["futuro"].done():
+                respuesta = _cerrar_en_curso(historial)
+                with st.chat_message("assistant"):
+                    st.markdown(respuesta)
+
+    # Respuesta en curso y análisis en segundo plano: se sondean en un
+    # fragmento, sin volver a ejecutar la página entera hasta que llegan
+    if st.session_state.en_curso is not None or st.session_state.pendientes:
+        _seguir_respuestas(historial)
 
     st.divider()
     st.subheader("✅ ¿Te ha servido la respuesta?")
@@ -249,39 +413,46 @@ with col_chat:
         st.info("Aún no hay una respuesta para valorar. Haz una pregunta en el chat.")
     else:
         u = st.session_state.ultima_interaccion
-        qid = _build_question_id(u["texto_usuario"], u["respuesta"])
+        # Id determinista (sha256): sigue siendo el mismo tras reiniciar
+        qid = build_question_id(u["texto_usuario"], u["respuesta"])
 
-        # Bloqueo: sesión + CSV
+        # Bloqueo: sesión + índice persistente de feedback
         ya_en_sesion = qid in st.session_state.feedback_done
-        ya_en_csv = _feedback_already_recorded(qid)
+        ya_guardado = None if ya_en_sesion else feedback_registrado(qid)
 
-        if ya_en_sesion or ya_en_csv:
-            voto = st.session_state.feedback_done.get(qid, "registrado")
+        if ya_en_sesion or ya_guardado:
+            voto = st.session_state.feedback_done.get(qid, ya_guardado or "registrado")
             st.info(f"Ya has valorado esta respuesta: **{voto}**")
         else:
             c1, c2 = st.columns(2)
 
             with c1:
                 if st.button("✅ Sí", key=f"btn_si_{qid}"):
-                    _ensure_feedback_file_has_header()
-                    registrar_feedback(
+                    if registrar_feedback(
                         u["texto_usuario"], u["tipo"], u["prioridad"],
-                        u["confianza"], u["respuesta"], "SI"
-                    )
-                    st.session_state.feedback_done[qid] = "SI"
-                    _append_question_id_to_last_row(qid)
-                    st.success("Feedback guardado: SI ✅")
+                        u["confianza"], u["respuesta"], "SI",
+                        question_id=qid,
+                    ):
+                        st.session_state.feedback_done[qid] = "SI"
+                        st.success("Feedback guardado: SI ✅")
+                    else:
+                        # Otra pestaña (u otro clic) votó antes: manda el voto guardado
+                        st.session_state.feedback_done[qid] = feedback_registrado(qid) or "registrado"
+                        st.info("Ya había feedback para esta respuesta")
 
             with c2:
                 if st.button("❌ No", key=f"btn_no_{qid}"):
-                    _ensure_feedback_file_has_header()
-                    registrar_feedback(
+                    if registrar_feedback(
                         u["texto_usuario"], u["tipo"], u["prioridad"],
-                        u["confianza"], u["respuesta"], "NO"
-                    )
-                    st.session_state.feedback_done[qid] = "NO"
-                    _append_question_id_to_last_row(qid)
-                    st.warning("Feedback guardado: NO ❌")
+                        u["confianza"], u["respuesta"], "NO",
+                        question_id=qid,
+                    ):
+                        st.session_state.feedback_done[qid] = "NO"
+                        st.warning("Feedback guardado: NO ❌")
+                    else:
+                        # Otra pestaña (u otro clic) votó antes: manda el voto guardado
+                        st.session_state.feedback_done[qid] = feedback_registrado(qid) or "registrado"
+                        st.info("Ya había feedback para esta respuesta")
 
 
 # ====================== COLUMNA EVALUACIÓN ======================
@@ -289,12 +460,26 @@ with col_eval:
     st.subheader("🧪 Evaluación con incidencias.csv")
 
     ruta_csv = st.text_input("Ruta del CSV", value="incidencias.csv")
+    comparar = cascada_disponible() and st.checkbox(
+        "Comparar la cascada con solo el modelo grande",
+        help="Pasa el dataset dos veces por el modelo: tarda el doble.",
+    )
 
     if st.button("Evaluar dataset"):
         try:
-            df_res, precision = evaluar_sobre_csv(ruta_csv)
+            df_res, precision = evaluar_sobre_csv(ruta_csv, comparar_cascada=comparar,
+                                                  ruta_puntuaciones=RUTA_PUNTUACIONES)
             st.success(f"Precisión aproximada en este dataset: {precision:.2%}")
 
+            cascada = df_res.attrs.get("cascada")
+            if cascada:
+                c1, c2, c3 = st.columns(3)
+                c1.metric("Precisión solo modelo grande", f"{cascada['precision_grande']:.2%}")
+                c2.metric("Coste cascada (ms/incidencia)", f"{cascada['ms_cascada']:.0f}",
+                          delta=f"{cascada['ms_cascada'] - cascada['ms_grande']:.0f} ms vs grande",
+                          delta_color="inverse")
+                c3.metric("Resueltas por el modelo pequeño", f"{cascada['resueltas_pequeno']:.0%}")
+
             st.write("**Resultados:**")
             st.dataframe(df_res, use_container_width=True)
 
@@ -312,11 +497,28 @@ with col_eval:
         except Exception as e:
             st.error(f"Error durante la evaluación: {e}")
 
+    # Otro umbral sobre la última evaluación, sin volver a pasar el modelo
+    if os.path.exists(RUTA_PUNTUACIONES):
+        with st.expander("🎚️ Ajuste del umbral de confianza"):
+            datos = _puntuaciones(os.stat(RUTA_PUNTUACIONES).st_mtime_ns)
+            umbral = st.slider("Umbral", 0.0, 1.0, float(round(datos.umbral, 2)), 0.01, key="umbral_analisis")
+            barrido = _barrido(os.stat(RUTA_PUNTUACIONES).st_mtime_ns)
+            exactitud = barrido_umbral(datos, [umbral])["exactitud"].iat[0]
+            mejor, exactitud_mejor = mejor_umbral(datos)
+            u1, u2 = st.columns(2)
+            u1.metric("Exactitud con este umbral", f"{exactitud:.2%}")
+            u2.metric("Mejor umbral", f"{mejor:.3f}", f"{exactitud_mejor:.2%}", delta_color="off")
+            st.line_chart(barrido.set_index("umbral"))
+            st.write("**Matriz de confusión**")
+            st.dataframe(matriz_confusion(datos, umbral), use_container_width=True)
+            st.write("**Precisión y exhaustividad por clase**")
+            st.dataframe(precision_exhaustividad(datos, umbral).round(3), use_container_width=True)
+
     st.divider()
     st.subheader("📊 Feedback (éxito percibido)")
 
     if st.button("📈 Calcular porcentaje feedback"):
-        total, si, no, ratio, df_fb = _safe_feedback_stats()
+        total, si, no, ratio, stats = _safe_feedback_stats()
 
         if total == 0:
             st.warning("Aún no hay feedback válido (SI/NO) guardado.")
@@ -324,9 +526,20 @@ with col_eval:
             st.success(f"Éxito percibido: {ratio:.2%}")
             st.write(f"Total valoraciones: {total} | SI: {si} | NO: {no}")
 
+            with st.expander("Desglose (tipo, prioridad, día, confianza)"):
+                for dimension in ("por_tipo", "por_prioridad", "por_dia", "por_confianza"):
+                    desglose = stats.get(dimension, {})
+                    if desglose:
+                        st.write(f"**{dimension.replace('_', ' ').capitalize()}**")
+                        st.dataframe(
+                            pd.DataFrame.from_dict(desglose, orient="index").sort_index(),
+                            use_container_width=True,
+                        )
+
         with st.expander("Ver últimas 20 filas (debug)"):
-            st.write("Columnas detectadas:", list(df_fb.columns))
-            st.dataframe(df_fb.tail(20), use_container_width=True)
+            df_fb_tail = _tail_df(FEEDBACK_PATH, 20)
+            st.write("Columnas detectadas:", list(df_fb_tail.columns))
+            st.dataframe(df_fb_tail, use_container_width=True)
 
     if os.path.exists(FEEDBACK_PATH) and os.path.getsize(FEEDBACK_PATH) > 0:
         st.download_button(
@@ -340,13 +553,131 @@ with col_eval:
     st.subheader("📄 Logs")
 
     try:
-        df_log = pd.read_csv("log_chat.csv")
-        st.dataframe(df_log.tail(50), use_container_width=True)
-        st.download_button(
-            label="⬇️ Descargar log_chat.csv",
-            data=open("log_chat.csv", "rb").read(),
-            file_name="log_chat.csv",
-            mime="text/csv"
-        )
+        df_log = _tail_df("log_chat.csv", 50)
+        if df_log.empty:
+            raise FileNotFoundError("log_chat.csv")
+        st.dataframe(df_log, use_container_width=True)
+        # Leer el log completo para la descarga cuesta lo que ocupe el
+        # archivo: solo se hace si se pide.
+        if st.checkbox("Preparar descarga de log_chat.csv"):
+            st.download_button(
+                label="⬇️ Descargar log_chat.csv",
+                data=open("log_chat.csv", "rb").read(),
+                file_name="log_chat.csv",
+                mime="text/csv"
+            )
     except Exception:
-        st.info("Aún no hay logs. Habla con el asistente y se generará 'log_chat.csv'.")
\ No newline at end of file
+        st.info("Aún no hay logs. Habla con el asistente y se generará 'log_chat.csv'.")
+
+    st.divider()
+    st.subheader("📊 Analítica de logs")
+    st.caption("Consulta los logs compactados en Parquet por día: solo se leen los días y columnas necesarios.")
+
+    if st.button("🗜️ Compactar logs ahora"):
+        try:
+            with st.spinner("Compactando…"):
+                r = compactar_logs()
+            st.success(f"{r['filas']} filas nuevas en {r['particiones']} días ({r['consolidadas']} consolidados).")
+        except ImportError as e:
+            st.warning(str(e))
+
+    a1, a2 = st.columns([3, 1])
+    with a1:
+        rango = st.date_input(
+            "Periodo",
+            value=(date.today() - timedelta(days=6), date.today()),
+            key="analitica_rango",
+        )
+    with a2:
+        frecuencia = st.selectbox("Agrupar por", list(FRECUENCIAS_ANALITICA), key="analitica_frecuencia")
+
+    if isinstance(rango, (tuple, list)) and len(rango) == 2:
+        desde = datetime.combine(rango[0], datetime.min.time())
+        hasta = datetime.combine(rango[1] + timedelta(days=1), datetime.min.time())
+        version = _version_logs_columnar()
+        try:
+            resumen_logs = _resumen_logs(desde, hasta, (), (), version)
+        except ImportError as e:
+            st.warning(str(e))
+            resumen_logs = None
+
+        if resumen_logs is None:
+            pass
+        elif resumen_logs.empty:
+            st.info("No hay mensajes compactados en ese periodo. Pulsa 'Compactar logs ahora'.")
+        else:
+            f1, f2 = st.columns(2)
+            tipos = f1.multiselect("Tipo", sorted(resumen_logs.index.get_level_values(0).unique()), key="analitica_tipos")
+            prioridades = f2.multiselect("Prioridad", sorted(resumen_logs.index.get_level_values(1).unique()),
+                                         key="analitica_prioridades")
+            serie = _serie_logs(desde, hasta, FRECUENCIAS_ANALITICA[frecuencia], tuple(tipos), tuple(prioridades), version)
+            if serie.empty:
+                st.info("Ningún mensaje cumple esos filtros.")
+            else:
+                st.bar_chart(serie)
+                st.dataframe(
+                    _resumen_logs(desde, hasta, tuple(tipos), tuple(prioridades), version).round(3),
+                    use_container_width=True,
+                )
+
+    st.divider()
+    st.subheader("⏱️ Rendimiento (admin)")
+
+    if not metricas.activo:
+        st.info("Las métricas están desactivadas (METRICAS_ACTIVAS = False).")
+    else:
+        resumen = metricas.resumen()
+        if not resumen["etapas"]:
+            st.info("Aún no hay mediciones. Habla con el asistente para generarlas.")
+        else:
+            st.write("**Latencia por etapa (ms)**")
+            st.dataframe(
+                pd.DataFrame.from_dict(resumen["etapas"], orient="index").round(3),
+                use_container_width=True,
+            )
+            st.write("**Mensajes por ruta**")
+            st.dataframe(
+                pd.DataFrame.from_dict(resumen["rutas"], orient="index", columns=["mensajes"]),
+                use_container_width=True,
+            )
+
+        plazo = estadisticas_presupuesto()
+        if plazo["total"]:
+            st.write("**Presupuesto de latencia del modelo**")
+            p1, p2, p3 = st.columns(3)
+            p1.metric("A tiempo", plazo["a_tiempo"])
+            p2.metric("Provisionales", plazo["fuera_de_plazo"] + plazo["sin_capacidad"],
+                      f"{plazo['tasa_degradadas']:.1%}", delta_color="inverse")
+            p3.metric("Sin capacidad", plazo["sin_capacidad"])
+            st.caption(
+                f"Completadas en segundo plano: {plazo['completadas_fondo']} · "
+                f"fallidas: {plazo['fallidas_fondo']}"
+            )
+
+        memoria = memoria_proceso()
+        if memoria:
+            st.write("**Memoria de este proceso (MB)**")
+            m1, m2, m3, m4 = st.columns(4)
+            m1.metric("Residente (RSS)", f"{memoria['rss']:.0f}")
+            m2.metric("Proporcional (PSS)", f"{memoria['pss']:.0f}")
+            m3.metric("Compartida", f"{memoria['compartida']:.0f}")
+            m4.metric("Propia", f"{memoria['propia']:.0f}")
+            if memoria.get("pesos_rss"):
+                st.caption(
+                    f"Pesos mapeados: {memoria['pesos_rss']:.0f} MB residentes, "
+                    f"{memoria['pesos_compartida']:.0f} MB compartidos con otros procesos "
+                    f"(a este le tocan {memoria['pesos_pss']:.0f} MB)."
+                )
+
+        c1, c2 = st.columns(2)
+        with c1:
+            st.download_button(
+                label="⬇️ Métricas (Prometheus)",
+                data=metricas.exportar_prometheus(),
+                file_name="metricas_asistente.prom",
+                mime="text/plain",
+            )
+        with c2:
+            if st.button("🔄 Reiniciar métricas"):
+                metricas.reiniciar()
+                st.rerun()
@@ -0,0 +1,423 @@
+# ---------------------------------------------------------
+# Autor: Raúl Cid González
+# Benchmark de las rutas calientes del asistente (FAQ, reglas,
+# clasificación, registro, feedback y mensaje completo) con un
+# modelo simulado determinista; el modelo real es opcional
+# ---------------------------------------------------------
+#
+# Ejecución (CPU, sin red):
+#   python benchmark_asistente.py --n 2000 --salida bench.json
+#   python benchmark_asistente.py --base bench.json          # compara con una ejecución anterior
+#   python benchmark_asistente.py --base bench.json --repeticiones 5 --min-dif-us 10
+#   python benchmark_asistente.py --modelo-real               # añade el nivel con el modelo real (caché local)
+
+from __future__ import annotations
+
+import os
+
+# Sin red: si el modelo real no está en la caché local, ese nivel se omite
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+import json
+import math
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+# ---------- 1. Generador de incidencias sintéticas ----------
+
+RELLENO = [
+    "hola", "buenas", "por favor", "desde ayer", "esta mañana", "otra vez", "no sé qué hacer",
+    "me urge un poco", "lo he intentado varias veces", "gracias de antemano", "en el portátil",
+    "desde el móvil", "en casa", "antes funcionaba", "me pasa a menudo", "creo que",
+    "no entiendo por qué", "he probado de todo", "un saludo", "necesito ayuda",
+]
+
+FRASES_NLI = [
+    "la aplicación se cierra sola al abrir la práctica",
+    "no me deja subir la entrega de la asignatura",
+    "la impresora de la biblioteca no imprime nada",
+    "el proyector del aula no enciende",
+    "se me ha olvidado la contraseña del portal",
+    "no aparece mi nota del examen final",
+    "el ordenador del laboratorio va muy lento",
+    "no puedo descargar los apuntes del tema",
+    "me sale una pantalla en blanco al entrar",
+    "la videollamada de la tutoría se corta",
+]
+
+PLANTILLAS_REGLA = [
+    "tengo un problema con {}",
+    "quería preguntar por {}",
+    "me da problemas lo de {}",
+    "necesito ayuda con {}",
+]
+
+MEZCLA_POR_DEFECTO = {"faq": 0.3, "regla": 0.3, "nli": 0.4}
+
+
+def _relleno(rng: random.Random, palabras: int) -> str:
+    trozos: List[str] = []
+    while sum(len(t.split()) for t in trozos) < palabras:
+        trozos.append(rng.choice(RELLENO))
+    return " ".join(trozos)
+
+
+def generar_incidencias(
+    n: int,
+    semilla: int = 0,
+    mezcla: Optional[Dict[str, float]] = None,
+    palabras_medianas: int = 12,
+    dispersion: float = 0.5,
+) -> List[Tuple[str, str]]:
+    """
+    `n` mensajes sintéticos en español como (texto, ruta esperada), con
+    ruta "faq", "regla" o "nli" según `mezcla`. La longitud (en palabras)
+    sigue una log-normal de mediana `palabras_medianas`. Cada mensaje se
+    comprueba con analizar_texto para que vaya de verdad por su ruta.
+    Misma semilla -> mismos mensajes.
+    """
+    import Asistente_Nebrija as asistente
+
+    mezcla = mezcla or MEZCLA_POR_DEFECTO
+    rng = random.Random(semilla)
+    rutas = list(mezcla)
+    pesos = [mezcla[r] for r in rutas]
+    palabras_regla = (asistente.PALABRAS_MATRICULA + asistente.PALABRAS_ADMINISTRATIVAS
+                      + asistente.PALABRAS_CORREO + asistente.PALABRAS_FALLO)
+
+    def candidato(ruta: str) -> str:
+        extra = max(0, int(rng.lognormvariate(math.log(palabras_medianas), dispersion)) - 6)
+        if ruta == "faq":
+            base = rng.choice(rng.choice(asistente.FAQ)["ejemplos"])
+        elif ruta == "regla":
+            base = rng.choice(PLANTILLAS_REGLA).format(rng.choice(palabras_regla))
+        else:
+            base = rng.choice(FRASES_NLI)
+        relleno = _relleno(rng, extra)
+        return f"{relleno} {base}" if rng.random() < 0.5 else f"{base}, {relleno}"
+
+    def ruta_real(texto: str) -> str:
+        analisis = asistente.analizar_texto(texto)
+        if analisis.faq is not None:
+            return "faq"
+        return "regla" if analisis.regla else "nli"
+
+    salida = []
+    for _ in range(n):
+        ruta = rng.choices(rutas, pesos)[0]
+        for _ in range(50):
+            texto = candidato(ruta)
+            if ruta_real(texto) == ruta:
+                break
+        salida.append((texto, ruta))
+    asistente.analizar_texto.cache_clear()
+    return salida
+
+
+# ---------- 2. Medición ----------
+
+def _percentil(ordenados: Sequence[float], p: float) -> float:
+    if not ordenados:
+        return 0.0
+    k = min(len(ordenados) - 1, max(0, int(round(p / 100 * (len(ordenados) - 1)))))
+    return ordenados[k]
+
+
+def resumir_tiempos(tiempos_s: Sequence[float], unidades: int = 1) -> Dict[str, float]:
+    """Estadísticas en microsegundos por unidad (p. ej. por texto en un lote)."""
+    us = sorted(t * 1e6 / unidades for t in tiempos_s)
+    total = sum(tiempos_s)
+    return {
+        "n": len(us) * unidades,
+        "media_us": sum(us) / len(us) if us else 0.0,
+        "p50_us": _percentil(us, 50),
+        "p95_us": _percentil(us, 95),
+        "p99_us": _percentil(us, 99),
+        "ops_s": len(us) * unidades / total if total else 0.0,
+    }
+
+
+def medir(funcion: Callable, entradas: Sequence, calentamiento: int = 20, unidades: int = 1) -> Dict[str, float]:
+    for entrada in entradas[:calentamiento]:
+        funcion(entrada)
+    tiempos = []
+    reloj = time.perf_counter
+    for entrada in entradas:
+        inicio = reloj()
+        funcion(entrada)
+        tiempos.append(reloj() - inicio)
+    return resumir_tiempos(tiempos, unidades)
+
+
+# ---------- 3. Suites ----------
+
+def atender_mensaje(texto: str) -> str:
+    """Lo mismo que hace el chat con un mensaje: FAQ o clasificación, respuesta y log."""
+    import Asistente_Nebrija as asistente
+
+    faq = asistente.detectar_faq(texto)
+    if faq:
+        asistente.registrar_log(texto, f"FAQ:{faq['intent']}", "n/a", 1.0, faq["answer"])
+        return faq["answer"]
+
+    categoria, _, prioridad, conf = asistente.clasificar_incidencia(texto)
+    respuesta = asistente.respuesta_incidencia(categoria)
+    if categoria == "otro tipo de incidencia" or conf < 0.55:
+        asistente.preguntas_seguimiento(categoria)
+    asistente.registrar_log(texto, categoria, prioridad, conf, respuesta)
+    return respuesta
+
+
+def suite_simulada(mensajes: List[Tuple[str, str]], ms_por_par: float = 0.0,
+                   repeticion: int = 0) -> Dict[str, Dict[str, float]]:
+    """
+    Todo el coste que no es el modelo, con ClasificadorSimulado en su lugar.
+    `repeticion` distingue los question_id del feedback entre pasadas, para
+    que "nuevo" lo sea también en la segunda.
+    """
+    import Asistente_Nebrija as asistente
+    from utils_modelo import ClasificadorSimulado
+
+    asistente.CASCADA_ACTIVA = False
+    asistente.gestor_modelo.reemplazar(ClasificadorSimulado(ms_por_par=ms_por_par))
+
+    textos = [t for t, _ in mensajes]
+    nli = [t for t, ruta in mensajes if ruta == "nli"] or textos
+    resultados: Dict[str, Dict[str, float]] = {}
+
+    def frio(funcion: Callable) -> Callable:
+        # cada texto visto por primera vez: sin la caché de analizar_texto
+        def envuelta(texto):
+            asistente.analizar_texto.cache_clear()
+            return funcion(texto)
+        return envuelta
+
+    resultados["analizar_texto"] = medir(frio(asistente.analizar_texto), textos)
+    resultados["detectar_faq"] = medir(frio(asistente.detectar_faq), textos)
+    resultados["detectar_faq_cacheado"] = medir(asistente.detectar_faq, textos)
+    resultados["estimar_prioridad"] = medir(asistente.estimar_prioridad, textos)
+    resultados["buscar_faq_similar"] = medir(lambda t: asistente.buscar_faq_similar(t, k=1), textos)
+
+    asistente.CACHE_ACTIVA = False
+    resultados["clasificar_incidencia"] = medir(frio(asistente.clasificar_incidencia), nli)
+    asistente.CACHE_ACTIVA = True
+    asistente._cache().limpiar()
+    resultados["clasificar_incidencia_cache_fria"] = medir(frio(asistente.clasificar_incidencia), nli, calentamiento=0)
+    resultados["clasificar_incidencia_cache_caliente"] = medir(asistente.clasificar_incidencia, nli)
+
+    tam = asistente.TAM_LOTE
+    lotes = [nli[i:i + tam] for i in range(0, len(nli) - tam + 1, tam)] or [nli]
+    resultados["clasificar_incidencias_lote_por_texto"] = medir(
+        asistente.clasificar_incidencias_lote, lotes, calentamiento=2, unidades=len(lotes[0])
+    )
+
+    filas = [(t, "problema técnico", "normal", 0.5, "respuesta de prueba") for t in textos]
+    # Solo el coste en la petición (encolar); la escritura va en su hilo
+    resultados["registrar_log"] = medir(lambda f: asistente.registrar_log(*f), filas)
+    asistente.vaciar_registros()
+
+    qids = [f"bench-{repeticion}-{i}" for i in range(len(textos))]
+    votos = [(t, "problema técnico", "normal", 0.5, "resp", "SI", q) for t, q in zip(textos, qids)]
+    resultados["registrar_feedback_nuevo"] = medir(lambda v: asistente.registrar_feedback(*v), votos, calentamiento=0)
+    resultados["registrar_feedback_duplicado"] = medir(lambda v: asistente.registrar_feedback(*v), votos)
+    resultados["feedback_registrado"] = medir(asistente.feedback_registrado, qids)
+    asistente.vaciar_registros()
+
+    asistente._cache().limpiar()
+    resultados["extremo_a_extremo"] = medir(frio(atender_mensaje), textos)
+    asistente.vaciar_registros()
+    return resultados
+
+
+def suite_modelo_real(mensajes: List[Tuple[str, str]], n: int = 32) -> Dict[str, Dict[str, float]]:
+    """Mismo recorrido con el modelo de verdad (solo si está en la caché local)."""
+    import Asistente_Nebrija as asistente
+
+    asistente.gestor_modelo = asistente.GestorModelo(asistente._cargar_clasificador, nombre="modelo NLI")
+    try:
+        inicio = time.perf_counter()
+        asistente.cargar_modelos()
+        carga = time.perf_counter() - inicio
+    except Exception as e:
+        causa = e.__cause__ or e
+        return {"omitido": {"motivo": f"{type(causa).__name__}: {causa}"}}
+
+    nli = [t for t, ruta in mensajes if ruta == "nli"][:n]
+    asistente.CACHE_ACTIVA = False
+    resultados = {"carga_modelo_ms": {"ms": carga * 1000}}
+    resultados["clasificar_incidencia"] = medir(asistente.clasificar_incidencia, nli, calentamiento=2)
+    tam = asistente.TAM_LOTE
+    lotes = [nli[i:i + tam] for i in range(0, len(nli) - tam + 1, tam)] or [nli]
+    resultados["clasificar_incidencias_lote_por_texto"] = medir(
+        asistente.clasificar_incidencias_lote, lotes, calentamiento=1, unidades=len(lotes[0])
+    )
+    resultados["extremo_a_extremo"] = medir(atender_mensaje, nli, calentamiento=2)
+    asistente.CACHE_ACTIVA = True
+    return resultados
+
+
+def combinar_repeticiones(pasadas: Sequence[Dict[str, Dict[str, float]]]) -> Dict[str, Dict[str, float]]:
+    """
+    Una medida por nombre a partir de varias pasadas de la misma suite: la
+    de menor p50 (el ruido del sistema solo suma tiempo, así que el mínimo
+    de las medianas es lo más estable), con los p50 de todas en "p50_reps_us".
+    """
+    combinados: Dict[str, Dict[str, float]] = {}
+    for nombre in pasadas[0]:
+        medidas = [p[nombre] for p in pasadas if nombre in p]
+        if "p50_us" not in medidas[0]:
+            combinados[nombre] = medidas[0]
+            continue
+        mejor = dict(min(medidas, key=lambda m: m["p50_us"]))
+        mejor["p50_reps_us"] = [m["p50_us"] for m in medidas]
+        combinados[nombre] = mejor
+    return combinados
+
+
+# ---------- 4. Comparación con una ejecución base ----------
+
+def _clave_tiempo(stats: Dict[str, float]) -> Optional[str]:
+    for clave in ("p50_us", "ms"):
+        if clave in stats:
+            return clave
+    return None
+
+
+def comparar(actual: Dict, base: Dict, tolerancia: float = 0.25, min_dif_us: float = 5.0) -> List[str]:
+    """
+    Imprime actual vs base (p50) para cada medida de cada nivel y
+    devuelve las que han empeorado más de `tolerancia` (0.25 = +25 %) y,
+    además, más de `min_dif_us` en valor absoluto: en las medidas de pocos
+    µs un +25 % es ruido del planificador, no una regresión.
+    """
+    claves = ("n", "semilla", "mezcla", "palabras_medianas", "ms_por_par", "nucleos", "repeticiones")
+    distintas = [c for c in claves if actual["meta"].get(c) != base.get("meta", {}).get(c)]
+    if distintas:
+        print(f"⚠️ La base se generó con otra configuración ({', '.join(distintas)}): la comparación es orientativa.")
+
+    regresiones = []
+    for nivel, medidas in actual["resultados"].items():
+        for nombre, stats in medidas.items():
+            previo = base.get("resultados", {}).get(nivel, {}).get(nombre)
+            clave = _clave_tiempo(stats)
+            if not previo or clave is None or not previo.get(clave):
+                continue
+            ratio = stats[clave] / previo[clave]
+            dif_us = (stats[clave] - previo[clave]) * (1000 if clave == "ms" else 1)
+            peor = ratio > 1 + tolerancia and dif_us > min_dif_us
+            mejor = ratio < 1 - tolerancia and -dif_us > min_dif_us
+            marca = "⚠️" if peor else ("🚀" if mejor else "  ")
+            print(f"{marca} {nivel}/{nombre}: {previo[clave]:.1f} -> {stats[clave]:.1f} {clave} (×{ratio:.2f})")
+            if peor:
+                regresiones.append(f"{nivel}/{nombre}")
+    return regresiones
+
+
+def _imprimir(resultados: Dict[str, Dict[str, Dict[str, float]]]) -> None:
+    for nivel, medidas in resultados.items():
+        print(f"\n== {nivel} ==")
+        for nombre, stats in medidas.items():
+            if "p50_us" in stats:
+                print(f"  {nombre:<42} p50 {stats['p50_us']:>10.1f} µs · p95 {stats['p95_us']:>10.1f} µs · "
+                      f"{stats['ops_s']:>10.0f} ops/s")
+            else:
+                print(f"  {nombre:<42} {stats}")
+
+
+def ejecutar(n: int = 1000, semilla: int = 0, mezcla: Optional[Dict[str, float]] = None,
+             palabras_medianas: int = 12, ms_por_par: float = 0.0, modelo_real: bool = False,
+             repeticiones: int = 3) -> Dict:
+    """
+    La suite simulada se repite `repeticiones` veces (ver
+    combinar_repeticiones); la del modelo real, una sola: es la lenta y
+    solo se mira a ojo.
+    """
+    # Los CSV/SQLite de log y feedback se crean en un directorio temporal,
+    # que se borra al terminar; el directorio de trabajo queda como estaba
+    previo = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="bench_asistente_", ignore_cleanup_errors=True) as directorio:
+        os.chdir(directorio)
+        try:
+            mensajes = generar_incidencias(n, semilla=semilla, mezcla=mezcla, palabras_medianas=palabras_medianas)
+            pasadas = [suite_simulada(mensajes, ms_por_par=ms_por_par, repeticion=r)
+                       for r in range(max(1, repeticiones))]
+            resultados = {"simulado": combinar_repeticiones(pasadas)}
+            if modelo_real:
+                resultados["modelo_real"] = suite_modelo_real(mensajes)
+        finally:
+            os.chdir(previo)
+
+    try:
+        import torch
+        version_torch = torch.__version__
+    except ImportError:
+        version_torch = None
+
+    return {
+        "meta": {
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "plataforma": platform.platform(),
+            "nucleos": os.cpu_count(),
+            "torch": version_torch,
+            "n": n,
+            "semilla": semilla,
+            "mezcla": mezcla or MEZCLA_POR_DEFECTO,
+            "palabras_medianas": palabras_medianas,
+            "ms_por_par": ms_por_par,
+            "repeticiones": max(1, repeticiones),
+        },
+        "resultados": resultados,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    raiz = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, raiz)
+
+    parser = argparse.ArgumentParser(description="Benchmark de las rutas calientes del asistente.")
+    parser.add_argument("--n", type=int, default=1000, help="Mensajes sintéticos.")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--mezcla", default="faq=0.3,regla=0.3,nli=0.4", help="Proporción de cada ruta.")
+    parser.add_argument("--palabras", type=int, default=12, help="Mediana de palabras por mensaje.")
+    parser.add_argument("--ms-por-par", type=float, default=0.0, help="Latencia simulada del modelo por par.")
+    parser.add_argument("--modelo-real", action="store_true", help="Añade el nivel con el modelo real (caché local).")
+    parser.add_argument("--salida", help="Guarda los resultados en este JSON.")
+    parser.add_argument("--base", help="JSON de una ejecución anterior con el que comparar.")
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="Empeoramiento permitido frente a la base.")
+    parser.add_argument("--min-dif-us", type=float, default=5.0,
+                        help="Empeoramiento absoluto mínimo (µs) para contar como regresión.")
+    parser.add_argument("--repeticiones", type=int, default=3,
+                        help="Pasadas de la suite simulada; se compara el mejor p50 de todas.")
+    args = parser.parse_args()
+
+    mezcla = {k: float(v) for k, v in (par.split("=") for par in args.mezcla.split(","))}
+    salida = os.path.abspath(args.salida) if args.salida else None
+    base = json.load(open(args.base, encoding="utf-8")) if args.base else None
+
+    informe = ejecutar(args.n, args.semilla, mezcla, args.palabras, args.ms_por_par, args.modelo_real,
+                       args.repeticiones)
+    _imprimir(informe["resultados"])
+
+    if salida:
+        with open(salida, "w", encoding="utf-8") as f:
+            json.dump(informe, f, indent=2, ensure_ascii=False)
+        print(f"\n✅ Resultados guardados en {salida}")
+
+    if base is not None:
+        print(f"\n== Comparación con la base (mejor p50 de {informe['meta']['repeticiones']} pasadas) ==")
+        regresiones = comparar(informe, base, args.tolerancia, args.min_dif_us)
+        if regresiones:
+            print(f"\n❌ {len(regresiones)} medidas han empeorado más de un {args.tolerancia:.0%} "
+                  f"(y más de {args.min_dif_us:g} µs).")
+            sys.exit(1)
+        print("\n✅ Sin regresiones.")
@@ -0,0 +1,402 @@
+# ===============================================================
+# Servicio HTTP (asyncio) · Asistente Nebrija
+# API JSON para otros clientes (portal de helpdesk, ingesta de
+# tickets...): FAQ, clasificación (también por lotes), preguntas de
+# seguimiento y feedback, con comprobaciones de salud y disponibilidad
+# Autor: Raúl Cid González
+# ===============================================================
+
+# Ejecución:
+#   python servicio_http.py --puerto 8080
+#   python servicio_http.py --modelo-simulado        # sin descargar el modelo (pruebas locales)
+#   python servicio_http.py --modelo-simulado --ms-por-par 50 --timeout 1   # probar timeouts
+#
+# Endpoints:
+#   GET  /salud                 el proceso responde
+#   GET  /listo                 200 si el modelo ya está cargado, 503 si no
+#   GET  /metrics               métricas en formato Prometheus
+#   POST /faq                   {"texto"}
+#   POST /clasificar            {"texto"}
+#   POST /clasificar/lote       {"textos": [...]}
+#   POST /mensaje               {"texto"}  FAQ o clasificación + respuesta + log (como el chat)
+#   POST /seguimiento           {"categoria"}
+#   POST /feedback              {"texto_usuario", "tipo", "prioridad", "confianza", "respuesta", "feedback", "question_id"?}
+
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import Asistente_Nebrija as asistente
+from utils_feedback import build_question_id
+from utils_pesos_compartidos import exportar_prometheus as memoria_prometheus
+from utils_planificador import ColaLlenaError
+
+
+MAX_CUERPO = 1 << 20          # 1 MB por petición
+MAX_CABECERAS = 16 * 1024
+ESPERA_INACTIVA_S = 30.0      # conexiones keep-alive sin peticiones
+
+
+class ErrorPeticion(Exception):
+    """Error que se devuelve al cliente con su código HTTP."""
+
+    def __init__(self, estado: HTTPStatus, mensaje: str) -> None:
+        super().__init__(mensaje)
+        self.estado = estado
+        self.mensaje = mensaje
+
+
+def _texto(cuerpo: Dict[str, Any], campo: str = "texto") -> str:
+    valor = cuerpo.get(campo)
+    if not isinstance(valor, str) or not valor.strip():
+        raise ErrorPeticion(HTTPStatus.BAD_REQUEST, f"Falta el campo '{campo}' (texto no vacío).")
+    return valor.strip()
+
+
+def _faq_a_json(faq: Optional[Dict]) -> Dict[str, Any]:
+    if not faq:
+        return {"faq": None}
+    return {"faq": faq["intent"], "respuesta": faq["answer"], "links": faq.get("links", [])}
+
+
+def _clasificacion_a_json(texto: str, resultado: Tuple[str, Dict[str, float], str, float]) -> Dict[str, Any]:
+    categoria, scores, prioridad, confianza = resultado
+    return {
+        "texto": texto,
+        "categoria": categoria,
+        "prioridad": prioridad,
+        "confianza": round(float(confianza), 4),
+        "scores": {k: round(float(v), 4) for k, v in scores.items()},
+    }
+
+
+class ServicioAsistente:
+    """
+    Servidor HTTP/1.1 mínimo sobre asyncio (solo biblioteca estándar).
+
+    - El bucle de eventos solo lee, parsea y responde: todo lo que toca
+      el modelo o el disco se ejecuta en un pool de `max_trabajadores`
+      hilos. Las peticiones concurrentes de clasificación se juntan en
+      lotes en el planificador del asistente.
+    - Como mucho `max_pendientes` peticiones en curso; las demás reciben
+      503 con Retry-After en vez de hacer cola sin límite.
+    - Cada petición tiene `timeout_s`; si se pasa, 504. El hilo que
+      estaba trabajando termina igualmente (el cliente ya no espera) y
+      hasta entonces sigue contando dentro de `max_pendientes`.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        puerto: int = 8080,
+        max_trabajadores: int = 8,
+        max_pendientes: int = 64,
+        timeout_s: float = 10.0,
+        max_lote: int = 256,
+    ) -> None:
+        self.host = host
+        self.puerto = puerto
+        self.timeout_s = timeout_s
+        self.max_lote = max_lote
+        self.max_pendientes = max_pendientes
+        self._pool = ThreadPoolExecutor(max_workers=max_trabajadores, thread_name_prefix="servicio")
+        self._pendientes = 0
+        self._lock_pendientes = threading.Lock()
+        self._servidor: Optional[asyncio.AbstractServer] = None
+        self._rutas: Dict[Tuple[str, str], Callable[[Dict[str, Any]], Any]] = {
+            ("GET", "/salud"): self._salud,
+            ("GET", "/listo"): self._listo,
+            ("GET", "/metrics"): self._metrics,
+            ("POST", "/faq"): self._faq,
+            ("POST", "/clasificar"): self._clasificar,
+            ("POST", "/clasificar/lote"): self._clasificar_lote,
+            ("POST", "/mensaje"): self._mensaje,
+            ("POST", "/seguimiento"): self._seguimiento,
+            ("POST", "/feedback"): self._feedback,
+        }
+
+    # ---------- Ciclo de vida ----------
+
+    async def iniciar(self) -> asyncio.AbstractServer:
+        asistente.precargar_modelos()
+        self._servidor = await asyncio.start_server(
+            self._atender_conexion, self.host, self.puerto, limit=MAX_CABECERAS
+        )
+        self.puerto = self._servidor.sockets[0].getsockname()[1]
+        return self._servidor
+
+    async def detener(self) -> None:
+        if self._servidor is not None:
+            self._servidor.close()
+            await self._servidor.wait_closed()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    # ---------- HTTP ----------
+
+    async def _atender_conexion(self, lector: asyncio.StreamReader, escritor: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    cabecera = await asyncio.wait_for(lector.readuntil(b"\r\n\r\n"), ESPERA_INACTIVA_S)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    return
+                except asyncio.LimitOverrunError:
+                    await self._responder(escritor, HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE,
+                                          {"error": "Cabeceras demasiado grandes."}, cerrar=True)
+                    return
+
+                lineas = cabecera.decode("latin-1").split("\r\n")
+                try:
+                    metodo, objetivo, version = lineas[0].split(" ", 2)
+                except ValueError:
+                    await self._responder(escritor, HTTPStatus.BAD_REQUEST, {"error": "Petición mal formada."}, cerrar=True)
+                    return
+                cabeceras = {}
+                for linea in lineas[1:]:
+                    if ":" in linea:
+                        nombre, valor = linea.split(":", 1)
+                        cabeceras[nombre.strip().lower()] = valor.strip()
+
+                cerrar = cabeceras.get("connection", "").lower() == "close" or version == "HTTP/1.0"
+                try:
+                    longitud = int(cabeceras.get("content-length") or 0)
+                    if longitud < 0:
+                        raise ValueError
+                except ValueError:
+                    await self._responder(escritor, HTTPStatus.BAD_REQUEST,
+                                          {"error": "Content-Length debe ser un entero >= 0."}, cerrar=True)
+                    return
+                if longitud > MAX_CUERPO:
+                    await self._responder(escritor, HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                                          {"error": "Cuerpo demasiado grande."}, cerrar=True)
+                    return
+                cuerpo = await lector.readexactly(longitud) if longitud else b""
+
+                estado, datos, extra = await self._despachar(metodo.upper(), urlsplit(objetivo).path, cuerpo)
+                await self._responder(escritor, estado, datos, cerrar=cerrar, cabeceras=extra)
+                if cerrar:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            escritor.close()
+
+    async def _responder(self, escritor: asyncio.StreamWriter, estado: HTTPStatus, datos: Any,
+                         cerrar: bool = False, cabeceras: Optional[Dict[str, str]] = None) -> None:
+        if isinstance(datos, str):
+            cuerpo = datos.encode("utf-8")
+            tipo = "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            cuerpo = json.dumps(datos, ensure_ascii=False).encode("utf-8")
+            tipo = "application/json; charset=utf-8"
+        lineas = [
+            f"HTTP/1.1 {estado.value} {estado.phrase}",
+            f"Content-Type: {tipo}",
+            f"Content-Length: {len(cuerpo)}",
+            f"Connection: {'close' if cerrar else 'keep-alive'}",
+        ]
+        lineas += [f"{k}: {v}" for k, v in (cabeceras or {}).items()]
+        escritor.write(("\r\n".join(lineas) + "\r\n\r\n").encode("latin-1") + cuerpo)
+        await escritor.drain()
+
+    async def _despachar(self, metodo: str, ruta: str, cuerpo: bytes) -> Tuple[HTTPStatus, Any, Dict[str, str]]:
+        manejador = self._rutas.get((metodo, ruta.rstrip("/") or "/"))
+        if manejador is None:
+            if any(r == ruta for _, r in self._rutas):
+                return HTTPStatus.METHOD_NOT_ALLOWED, {"error": f"Método {metodo} no permitido en {ruta}."}, {}
+            return HTTPStatus.NOT_FOUND, {"error": f"No existe {ruta}."}, {}
+
+        try:
+            datos = json.loads(cuerpo) if cuerpo else {}
+            if not isinstance(datos, dict):
+                raise ValueError
+        except ValueError:
+            return HTTPStatus.BAD_REQUEST, {"error": "El cuerpo debe ser un objeto JSON."}, {}
+
+        try:
+            resultado = await manejador(datos)
+        except ErrorPeticion as e:
+            extra = {"Retry-After": "1"} if e.estado == HTTPStatus.SERVICE_UNAVAILABLE else {}
+            return e.estado, {"error": e.mensaje}, extra
+        except Exception as e:
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"{type(e).__name__}: {e}"}, {}
+        if isinstance(resultado, tuple):
+            estado, resultado = resultado
+            return estado, resultado, {"Retry-After": "5"} if estado == HTTPStatus.SERVICE_UNAVAILABLE else {}
+        return HTTPStatus.OK, resultado, {}
+
+    async def _en_pool(self, funcion: Callable, *args) -> Any:
+        """
+        Ejecuta `funcion` en el pool con control de admisión y timeout.
+        El hueco se libera cuando el trabajo termina de verdad en el pool,
+        no cuando vence el timeout: un 504 no deja sitio a otra petición
+        mientras el hilo siga ocupado, así que la cola del pool nunca pasa
+        de `max_pendientes`.
+        """
+        with self._lock_pendientes:
+            if self._pendientes >= self.max_pendientes:
+                raise ErrorPeticion(HTTPStatus.SERVICE_UNAVAILABLE, "Servicio ocupado, inténtalo de nuevo.")
+            self._pendientes += 1
+        try:
+            trabajo = self._pool.submit(funcion, *args)
+        except RuntimeError:
+            self._liberar()
+            raise
+        trabajo.add_done_callback(lambda _: self._liberar())
+        try:
+            # shield: al vencer el plazo no se cancela el trabajo (ya puede estar en marcha)
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(trabajo)), self.timeout_s)
+        except asyncio.TimeoutError:
+            raise ErrorPeticion(HTTPStatus.GATEWAY_TIMEOUT, f"Sin respuesta en {self.timeout_s:.0f} s.") from None
+        except ColaLlenaError as e:
+            raise ErrorPeticion(HTTPStatus.SERVICE_UNAVAILABLE, str(e)) from None
+        except RuntimeError as e:
+            if not asistente.gestor_modelo.listo:
+                raise ErrorPeticion(HTTPStatus.SERVICE_UNAVAILABLE, f"Modelo no disponible: {e}") from None
+            raise
+
+    def _liberar(self) -> None:
+        # Se llama desde el hilo del pool que termina el trabajo
+        with self._lock_pendientes:
+            self._pendientes -= 1
+
+    @property
+    def pendientes(self) -> int:
+        """Trabajos admitidos que aún no han terminado en el pool (incluye los que dieron 504)."""
+        with self._lock_pendientes:
+            return self._pendientes
+
+    # ---------- Endpoints ----------
+
+    async def _salud(self, _: Dict[str, Any]) -> Dict[str, Any]:
+        return {"estado": "ok"}
+
+    async def _listo(self, _: Dict[str, Any]) -> Tuple[HTTPStatus, Dict[str, Any]]:
+        gestor = asistente.gestor_modelo
+        datos = {
+            "modelo_cargado": gestor.listo,
+            "cargando": gestor.cargando,
+            "peticiones_en_curso": self.pendientes,
+        }
+        return (HTTPStatus.OK if gestor.listo else HTTPStatus.SERVICE_UNAVAILABLE), datos
+
+    async def _metrics(self, _: Dict[str, Any]) -> str:
+        return asistente.metricas.exportar_prometheus() + memoria_prometheus(
+            asistente.memoria_proceso(), prefijo=asistente.metricas.prefijo
+        )
+
+    async def _faq(self, cuerpo: Dict[str, Any]) -> Dict[str, Any]:
+        texto = _texto(cuerpo)
+        return _faq_a_json(await self._en_pool(asistente.detectar_faq, texto))
+
+    async def _clasificar(self, cuerpo: Dict[str, Any]) -> Dict[str, Any]:
+        texto = _texto(cuerpo)
+        return _clasificacion_a_json(texto, await self._en_pool(asistente.clasificar_incidencia, texto))
+
+    async def _clasificar_lote(self, cuerpo: Dict[str, Any]) -> Dict[str, Any]:
+        textos = cuerpo.get("textos")
+        if not isinstance(textos, list) or not textos or not all(isinstance(t, str) and t.strip() for t in textos):
+            raise ErrorPeticion(HTTPStatus.BAD_REQUEST, "Falta 'textos' (lista de textos no vacíos).")
+        if len(textos) > self.max_lote:
+            raise ErrorPeticion(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Como mucho {self.max_lote} textos por lote.")
+        textos = [t.strip() for t in textos]
+        resultados = await self._en_pool(asistente.clasificar_incidencias_lote, textos)
+        return {"resultados": [_clasificacion_a_json(t, r) for t, r in zip(textos, resultados)]}
+
+    async def _mensaje(self, cuerpo: Dict[str, Any]) -> Dict[str, Any]:
+        return await self._en_pool(atender_mensaje, _texto(cuerpo))
+
+    async def _seguimiento(self, cuerpo: Dict[str, Any]) -> Dict[str, Any]:
+        categoria = _texto(cuerpo, "categoria")
+        return {"categoria": categoria, "preguntas": asistente.preguntas_seguimiento(categoria)}
+
+    async def _feedback(self, cuerpo: Dict[str, Any]) -> Dict[str, Any]:
+        texto = _texto(cuerpo, "texto_usuario")
+        respuesta = _texto(cuerpo, "respuesta")
+        voto = _texto(cuerpo, "feedback").upper()
+        if voto not in ("SI", "NO"):
+            raise ErrorPeticion(HTTPStatus.BAD_REQUEST, "'feedback' debe ser SI o NO.")
+        try:
+            confianza = float(cuerpo.get("confianza", 0.0))
+        except (TypeError, ValueError):
+            raise ErrorPeticion(HTTPStatus.BAD_REQUEST, "'confianza' debe ser un número.") from None
+        qid = cuerpo.get("question_id") or build_question_id(texto, respuesta)
+
+        registrado = await self._en_pool(
+            asistente.registrar_feedback,
+            texto, str(cuerpo.get("tipo", "")), str(cuerpo.get("prioridad", "")),
+            confianza, respuesta, voto, qid,
+        )
+        return {"registrado": registrado, "question_id": qid}
+
+
+def atender_mensaje(texto: str) -> Dict[str, Any]:
+    """Lo mismo que el chat: FAQ si la hay; si no, clasificación, respuesta, seguimiento y log."""
+    inicio = time.perf_counter()
+    faq = asistente.detectar_faq(texto)
+    if faq:
+        asistente.registrar_log(texto, f"FAQ:{faq['intent']}", "n/a", 1.0, faq["answer"])
+        asistente.metricas.observar("mensaje", time.perf_counter() - inicio)
+        return {"tipo": f"FAQ:{faq['intent']}", **_faq_a_json(faq),
+                "question_id": build_question_id(texto, faq["answer"])}
+
+    resultado = asistente.clasificar_incidencia(texto)
+    categoria, _, prioridad, confianza = resultado
+    respuesta = asistente.respuesta_incidencia(categoria)
+    seguimiento = (asistente.preguntas_seguimiento(categoria)
+                   if categoria == "otro tipo de incidencia" or confianza < 0.55 else [])
+    asistente.registrar_log(texto, categoria, prioridad, confianza, respuesta)
+    asistente.metricas.observar("mensaje", time.perf_counter() - inicio)
+    return {
+        "tipo": categoria,
+        **_clasificacion_a_json(texto, resultado),
+        "respuesta": respuesta,
+        "seguimiento": seguimiento,
+        "question_id": build_question_id(texto, respuesta),
+    }
+
+
+async def _servir(servicio: ServicioAsistente) -> None:
+    servidor = await servicio.iniciar()
+    print(f"🌐 Servicio del asistente en http://{servicio.host}:{servicio.puerto}")
+    async with servidor:
+        await servidor.serve_forever()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Servicio HTTP del asistente Nebrija.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8080)
+    parser.add_argument("--trabajadores", type=int, default=8, help="Hilos para FAQ/modelo/registro.")
+    parser.add_argument("--max-pendientes", type=int, default=64, help="Peticiones en curso antes de responder 503.")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Segundos máximos por petición.")
+    parser.add_argument("--modelo-simulado", action="store_true",
+                        help="Usa el clasificador simulado determinista (sin descargar el modelo).")
+    parser.add_argument("--ms-por-par", type=float, default=0.0,
+                        help="Con --modelo-simulado: latencia simulada por par texto-etiqueta.")
+    args = parser.parse_args()
+
+    if args.modelo_simulado:
+        from utils_modelo import ClasificadorSimulado
+
+        asistente.CASCADA_ACTIVA = False
+        asistente.gestor_modelo.reemplazar(ClasificadorSimulado(ms_por_par=args.ms_por_par))
+
+    try:
+        asyncio.run(_servir(ServicioAsistente(
+            args.host, args.puerto,
+            max_trabajadores=args.trabajadores,
+            max_pendientes=args.max_pendientes,
+            timeout_s=args.timeout,
+        )))
+    except KeyboardInterrupt:
+        print("\n👋 Servicio detenido.")
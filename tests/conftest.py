@@ -0,0 +1,10 @@
+# ---------------------------------------------------------
+# Autor: Raúl Cid González
+# Configuración común de las pruebas: los módulos del asistente
+# están en la raíz del repositorio
+# ---------------------------------------------------------
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,98 @@
+# ---------------------------------------------------------
+# Autor: Raúl Cid González
+# Pruebas del análisis de puntuaciones: barrido del umbral
+# frente a reclasificar fila a fila con cada umbral
+# ---------------------------------------------------------
+
+import numpy as np
+import pytest
+
+from utils_analisis import (
+    Puntuaciones,
+    barrido_umbral,
+    cargar_puntuaciones,
+    guardar_puntuaciones,
+    matriz_confusion,
+    matriz_puntuaciones,
+    mejor_umbral,
+    predecir,
+)
+
+
+ETIQUETAS = ["acceso", "matrícula", "técnico", "administrativa", "otro"]
+OTRO = 4
+
+
+def _aleatorias(semilla, n=2000):
+    rng = np.random.default_rng(semilla)
+    puntuaciones = rng.dirichlet(np.ones(len(ETIQUETAS)), size=n).astype(np.float32)
+    # Empates en la puntuación máxima, para probar los bordes del umbral
+    puntuaciones[::50] = np.float32(0.2)
+    fijas = np.where(rng.random(n) < 0.2, rng.integers(0, len(ETIQUETAS), n), -1).astype(np.int16)
+    puntuaciones[fijas >= 0] = np.nan
+    esperados = rng.integers(-1, len(ETIQUETAS), n).astype(np.int16)
+    return Puntuaciones(puntuaciones, fijas, esperados, ETIQUETAS, OTRO, 0.45)
+
+
+def _exactitud_fila_a_fila(p, umbral):
+    aciertos = 0
+    for fila in range(len(p.fijas)):
+        if p.fijas[fila] >= 0:
+            prediccion = p.fijas[fila]
+        else:
+            top = float(np.nanmax(p.puntuaciones[fila]))
+            prediccion = OTRO if top < umbral else int(np.nanargmax(p.puntuaciones[fila]))
+        aciertos += prediccion == p.esperados[fila]
+    return aciertos / len(p.fijas)
+
+
+@pytest.mark.parametrize("semilla", [0, 1, 2])
+def test_barrido_igual_a_fuerza_bruta(semilla):
+    p = _aleatorias(semilla)
+    umbrales = [0.0, 0.1, 0.2, 0.2 + 1e-7, 0.33, 0.45, 0.5, 0.9, 1.0]
+    barrido = barrido_umbral(p, umbrales)
+    for umbral, exactitud in zip(umbrales, barrido["exactitud"]):
+        assert exactitud == pytest.approx(_exactitud_fila_a_fila(p, umbral), abs=1e-12), umbral
+
+
+def test_barrido_coincide_con_predecir():
+    p = _aleatorias(3)
+    barrido = barrido_umbral(p)
+    for fila in range(0, len(barrido), 97):
+        umbral = float(barrido["umbral"].iat[fila])
+        assert barrido["exactitud"].iat[fila] == pytest.approx(np.mean(predecir(p, umbral) == p.esperados))
+
+
+def test_mejor_umbral_no_lo_supera_ningun_otro():
+    p = _aleatorias(4, n=500)
+    umbral, exactitud = mejor_umbral(p)
+    assert exactitud == pytest.approx(_exactitud_fila_a_fila(p, umbral))
+    candidatos = np.unique(np.nan_to_num(p.puntuaciones, nan=0.0))
+    assert all(_exactitud_fila_a_fila(p, u) <= exactitud + 1e-12 for u in candidatos[::7])
+
+
+def test_matriz_confusion_suma_las_filas_validas():
+    p = _aleatorias(5)
+    m = matriz_confusion(p)
+    assert m.to_numpy().sum() == np.count_nonzero(p.esperados >= 0)
+    assert m.to_numpy().trace() == np.count_nonzero(predecir(p) == p.esperados)
+
+
+def test_guardar_y_cargar_ida_y_vuelta(tmp_path):
+    def scores(*valores):
+        return dict(zip(ETIQUETAS, valores))
+
+    resultados = [
+        ("acceso", scores(0.7, 0.1, 0.1, 0.05, 0.05), "alta", 0.7),
+        ("matrícula", {}, "normal", 1.0),            # por regla
+        ("otro", scores(0.3, 0.1, 0.4, 0.1, 0.1), "normal", 0.4),
+    ]
+    puntuaciones, fijas = matriz_puntuaciones(resultados, ETIQUETAS)
+    ruta = tmp_path / "p.npz"
+    guardar_puntuaciones(ruta, puntuaciones, fijas, ["acceso", "matrícula", "desconocida"], ETIQUETAS, "otro", 0.45)
+
+    p = cargar_puntuaciones(ruta)
+    assert p.etiquetas == ETIQUETAS and p.otro == OTRO and p.umbral == pytest.approx(0.45)
+    np.testing.assert_array_equal(p.fijas, [-1, 1, -1])
+    np.testing.assert_array_equal(p.esperados, [0, 1, -1])
+    assert predecir(p).tolist() == [0, 1, 4]
@@ -0,0 +1,61 @@
+# ---------------------------------------------------------
+# Autor: Raúl Cid González
+# Pruebas del nivel en disco de la caché de predicciones
+# ---------------------------------------------------------
+
+from utils_cache import CachePredicciones
+
+
+def test_varias_huellas_conviven_en_disco(tmp_path):
+    ruta = tmp_path / "cache.sqlite"
+    app = CachePredicciones("huella-app", ruta_disco=ruta)
+    app.guardar("No puedo entrar", ["problema de acceso", {}, 0.9])
+
+    # Otro proceso con otra configuración abre la misma base
+    evaluacion = CachePredicciones("huella-int8", ruta_disco=ruta)
+    evaluacion.guardar("No puedo entrar", ["cuenta bloqueada", {}, 0.6])
+
+    de_nuevo = CachePredicciones("huella-app", ruta_disco=ruta)
+    assert de_nuevo.obtener("no puedo ENTRAR") == ["problema de acceso", {}, 0.9]
+    assert CachePredicciones("huella-int8", ruta_disco=ruta).obtener("No puedo entrar")[0] == "cuenta bloqueada"
+
+
+def test_podar_borra_solo_huellas_sin_uso(tmp_path):
+    ruta = tmp_path / "cache.sqlite"
+    vieja = CachePredicciones("vieja", ruta_disco=ruta)
+    vieja.guardar("a", 1)
+    vieja.guardar("b", 2)
+    reciente = CachePredicciones("reciente", ruta_disco=ruta)
+    reciente.guardar("a", 3)
+    with vieja._db:
+        vieja._db.execute("UPDATE huellas SET ultimo_uso = ultimo_uso - 40 * 86400 WHERE huella = 'vieja'")
+
+    actual = CachePredicciones("actual", ruta_disco=ruta)
+    assert actual.podar(30 * 86400) == 2
+    assert CachePredicciones("reciente", ruta_disco=ruta).obtener("a") == 3
+    assert CachePredicciones("vieja", ruta_disco=ruta).obtener("a") is None
+
+
+def test_limpiar_no_toca_otras_huellas(tmp_path):
+    ruta = tmp_path / "cache.sqlite"
+    una = CachePredicciones("una", ruta_disco=ruta)
+    una.guardar("a", 1)
+    otra = CachePredicciones("otra", ruta_disco=ruta)
+    otra.guardar("a", 2)
+    otra.limpiar()
+    assert CachePredicciones("una", ruta_disco=ruta).obtener("a") == 1
+    assert CachePredicciones("otra", ruta_disco=ruta).obtener("a") is None
+
+
+def test_cerrar_libera_el_disco_y_sigue_en_memoria(tmp_path):
+    ruta = tmp_path / "cache.sqlite"
+    cache = CachePredicciones("huella", ruta_disco=ruta)
+    cache.guardar("a", 1)
+    cache.cerrar()
+
+    assert cache._db is None
+    cache.guardar("b", 2)
+    assert cache.obtener("a") == 1 and cache.obtener("b") == 2
+    assert cache.podar(0) == 0
+    # Lo escrito tras cerrar no llega al disco
+    assert CachePredicciones("huella", ruta_disco=ruta).obtener("b") is None
@@ -0,0 +1,100 @@
+# ---------------------------------------------------------
+# Autor: Raúl Cid González
+# Pruebas del motor de coincidencias: mismo resultado que el
+# enrutado anterior (re.search por patrón y "in" por palabra)
+# ---------------------------------------------------------
+
+import random
+import re
+
+import pytest
+
+import Asistente_Nebrija as asistente
+from utils_coincidencias import MotorCoincidencias
+
+
+# ----- Enrutado anterior, como referencia -----
+
+def _faq_anterior(texto):
+    t = texto.lower()
+    for i, item in enumerate(asistente.FAQ):
+        if any(re.search(p, t) for p in item["patterns"]):
+            return i
+    return None
+
+
+def _regla_anterior(texto):
+    t = texto.lower()
+    if any(k in t for k in asistente.PALABRAS_MATRICULA):
+        return "error de matrícula"
+    if any(k in t for k in asistente.PALABRAS_ADMINISTRATIVAS):
+        return "consulta administrativa"
+    if any(k in t for k in asistente.PALABRAS_CORREO) and any(k in t for k in asistente.PALABRAS_FALLO):
+        return "problema técnico"
+    return None
+
+
+def _prioridad_anterior(texto):
+    t = texto.lower()
+    return "alta" if any(d in t for d in asistente.DISPARADORES_ALTA) else "normal"
+
+
+# ----- Textos aleatorios con las palabras clave y sus casi-coincidencias -----
+
+def _vocabulario():
+    palabras = set(asistente.DISPARADORES_ALTA + asistente.PALABRAS_MATRICULA + asistente.PALABRAS_ADMINISTRATIVAS
+                   + asistente.PALABRAS_CORREO + asistente.PALABRAS_FALLO)
+    for item in asistente.FAQ:
+        for patron in item["patterns"]:
+            palabras.update(re.sub(r"\\b|[()]", "", patron).split("|"))
+    # Prefijos, sufijos y pegados: el caso difícil de los límites de palabra
+    extra = set()
+    for p in palabras:
+        extra.update({p + "s", p + "es", "a" + p, p[:-1], p.upper(), p.capitalize(), "_" + p, p + "_"})
+    return sorted(palabras | extra | {"hoyo", "redes", "ñred", "red-wifi", "mi", "la", "no", "de", "él", "¿", "?", ",", "."})
+
+
+@pytest.fixture(autouse=True)
+def motor_limpio():
+    asistente.reconstruir_motor()
+    yield
+    asistente.reconstruir_motor()
+
+
+def test_equivale_al_enrutado_anterior():
+    rng = random.Random(2026)
+    vocabulario = _vocabulario()
+    textos = [
+        "".join(rng.choice(vocabulario) + rng.choice([" ", "", "-", ", ", "\n", "!"]) for _ in range(rng.randint(1, 12)))
+        for _ in range(20000)
+    ]
+    for texto in textos:
+        analisis = asistente.analizar_texto(texto)
+        assert analisis.faq == _faq_anterior(texto), texto
+        assert analisis.regla == _regla_anterior(texto), texto
+        assert ("alta" if analisis.prioridad_alta else "normal") == _prioridad_anterior(texto), texto
+
+
+@pytest.mark.parametrize("texto, faq, regla, prioridad", [
+    ("No puedo entrar al campus virtual", "blackboard", None, "alta"),
+    ("la red de casa", "wifi", None, "normal"),
+    ("las redes sociales", None, None, "normal"),
+    ("¿A qué hora empiezan las clases?", "horario", None, "normal"),
+    ("El correo no funciona", "equipos_y_servicios", "problema técnico", "normal"),
+    ("No me llegan los correos", None, "problema técnico", "normal"),  # las reglas no miran límites de palabra
+    ("Tengo que pagar la matrícula hoy", None, "error de matrícula", "alta"),
+])
+def test_casos_conocidos(texto, faq, regla, prioridad):
+    analisis = asistente.analizar_texto(texto)
+    assert (asistente.FAQ[analisis.faq]["intent"] if analisis.faq is not None else None) == faq
+    assert asistente.clasificacion_por_reglas(texto) == regla
+    assert asistente.estimar_prioridad(texto) == prioridad
+
+
+def test_patron_no_literal_se_evalua_como_regex():
+    motor = MotorCoincidencias()
+    motor.agregar_patron(r"\bwi-?fi\b", "wifi")
+    motor.agregar_termino("hoy", "alta")
+    motor.compilar()
+    assert motor.analizar("el wi-fi falla hoy") == {"wifi", "alta"}
+    assert motor.analizar("wifis") == set()
@@ -0,0 +1,125 @@
+# ---------------------------------------------------------
+# Autor: Raúl Cid González
+# Pruebas de la lectura incremental de CSV (SeguidorCSV, ColaCSV)
+# con campos entrecomillados que contienen saltos de línea
+# ---------------------------------------------------------
+
+import csv
+import io
+import os
+
+import pytest
+
+from utils_csv import ColaCSV, SeguidorCSV, _inicio_ultimos_registros, ultimo_fin_de_registro
+
+
+CABECERA = ["timestamp", "texto_usuario", "respuesta_resumen"]
+
+
+def _fila(i):
+    # Cada tercera fila con saltos de línea y comillas dentro de un campo
+    if i % 3 == 0:
+        return [f"t{i}", f'línea 1 de {i}\nlínea 2 con "comillas"\n', f"r{i}"]
+    return [f"t{i}", f"texto {i}, con coma", f"r{i}"]
+
+
+def _csv(filas, cabecera=True):
+    buf = io.StringIO()
+    w = csv.writer(buf, lineterminator="\n")
+    if cabecera:
+        w.writerow(CABECERA)
+    w.writerows(filas)
+    return buf.getvalue().encode("utf-8")
+
+
+def _como_dicts(filas):
+    return [dict(zip(CABECERA, f)) for f in filas]
+
+
+@pytest.fixture
+def ruta(tmp_path):
+    return tmp_path / "log.csv"
+
+
+def test_ultimo_fin_de_registro_ignora_saltos_entrecomillados():
+    datos = _csv([_fila(1), _fila(3)], cabecera=False)
+    assert ultimo_fin_de_registro(datos) == len(datos)
+    # Registro cortado dentro de las comillas: solo cuenta lo anterior
+    corte = datos.index(b"l\xc3\xadnea 2")
+    assert ultimo_fin_de_registro(datos[:corte]) == len(_csv([_fila(1)], cabecera=False))
+
+
+@pytest.mark.parametrize("tam_bloque", [3, 7, 64, 64 * 1024])
+def test_inicio_ultimos_registros_con_bloques_pequenos(ruta, tam_bloque):
+    filas = [_fila(i) for i in range(20)]
+    ruta.write_bytes(_csv(filas))
+    with open(ruta, "rb") as f:
+        inicio = _inicio_ultimos_registros(f, os.path.getsize(ruta), 4, tam_bloque=tam_bloque)
+        f.seek(inicio)
+        resto = f.read().decode("utf-8")
+    assert list(csv.reader(io.StringIO(resto, newline=""))) == filas[-4:]
+
+
+def test_cola_devuelve_los_ultimos_registros(ruta):
+    filas = [_fila(i) for i in range(30)]
+    ruta.write_bytes(_csv(filas))
+    cabecera, ultimas = ColaCSV(ruta, n=5).filas()
+    assert cabecera == CABECERA
+    assert ultimas == _como_dicts(filas[-5:])
+
+
+def test_cola_con_menos_registros_que_n(ruta):
+    filas = [_fila(i) for i in range(3)]
+    ruta.write_bytes(_csv(filas))
+    assert ColaCSV(ruta, n=10).filas()[1] == _como_dicts(filas)
+
+
+def test_cola_sigue_lo_anadido_y_espera_registros_a_medias(ruta):
+    filas = [_fila(i) for i in range(10)]
+    ruta.write_bytes(_csv(filas))
+    cola = ColaCSV(ruta, n=4)
+    cola.filas()
+
+    nueva = _csv([_fila(12)], cabecera=False)
+    corte = nueva.index(b"\n") + 1          # a mitad del campo entrecomillado
+    with open(ruta, "ab") as f:
+        f.write(nueva[:corte])
+    assert cola.filas()[1] == _como_dicts(filas[-4:])
+
+    with open(ruta, "ab") as f:
+        f.write(nueva[corte:] + _csv([_fila(13)], cabecera=False))
+    assert cola.filas()[1] == _como_dicts((filas + [_fila(12), _fila(13)])[-4:])
+
+
+def test_cola_relee_si_el_archivo_se_reescribe(ruta):
+    ruta.write_bytes(_csv([_fila(i) for i in range(10)]))
+    cola = ColaCSV(ruta, n=3)
+    cola.filas()
+    otras = [_fila(i) for i in range(100, 102)]
+    ruta.write_bytes(_csv(otras))
+    assert cola.filas()[1] == _como_dicts(otras)
+
+
+def test_seguidor_solo_devuelve_filas_nuevas(ruta):
+    filas = [_fila(i) for i in range(5)]
+    ruta.write_bytes(_csv(filas))
+    seguidor = SeguidorCSV(ruta)
+    assert seguidor.nuevas_filas() == _como_dicts(filas)
+    assert seguidor.nuevas_filas() == []
+
+    with open(ruta, "ab") as f:
+        f.write(_csv([_fila(6)], cabecera=False))
+    assert seguidor.nuevas_filas() == _como_dicts([_fila(6)])
+    assert not seguidor.reiniciado
+
+
+def test_seguidor_detecta_rotacion(ruta):
+    ruta.write_bytes(_csv([_fila(i) for i in range(5)]))
+    seguidor = SeguidorCSV(ruta)
+    seguidor.nuevas_filas()
+
+    # Otro archivo del mismo tamaño o mayor: la firma deja de coincidir
+    otras = [["x" * len(c) for c in _fila(i)] for i in range(6)]
+    ruta.write_bytes(_csv(otras))
+    assert seguidor.nuevas_filas() == _como_dicts(otras)
+    assert seguidor.reiniciado
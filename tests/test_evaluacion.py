@@ -0,0 +1,111 @@
+# ---------------------------------------------------------
+# Autor: Raúl Cid González
+# Pruebas de la evaluación por bloques: reanudar tras un corte
+# (con otro tamaño de bloque) da la misma salida que de un tirón
+# ---------------------------------------------------------
+
+import zlib
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils_analisis import CapturaPorBloques, cargar_puntuaciones
+from utils_evaluacion import contar_registros, evaluar_en_streaming
+
+
+ETIQUETAS = ["problema de acceso", "error de matrícula", "problema técnico", "otro tipo de incidencia"]
+
+
+def clasificar(textos):
+    """Clasificador determinista (de módulo, para poder usarlo con varios procesos)."""
+    resultados = []
+    for texto in textos:
+        h = zlib.crc32(texto.encode("utf-8"))
+        if h % 5 == 0:
+            resultados.append((ETIQUETAS[1], {}, "normal", 1.0))  # decidido por regla
+            continue
+        pesos = np.array([(h >> (8 * j)) & 0xFF for j in range(len(ETIQUETAS))], dtype=float) + 1
+        scores = pesos / pesos.sum()
+        top = int(scores.argmax())
+        resultados.append((ETIQUETAS[top], dict(zip(ETIQUETAS, scores.tolist())), "alta" if h % 2 else "normal",
+                           float(scores[top])))
+    return resultados
+
+
+class CorteTrasBloques:
+    """Falla al llegar al bloque `n`, como una ejecución interrumpida."""
+
+    def __init__(self, n):
+        self.n = n
+
+    def __call__(self, textos):
+        if self.n == 0:
+            raise KeyboardInterrupt
+        self.n -= 1
+        return clasificar(textos)
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    ruta = tmp_path / "incidencias.csv"
+    filas = [{"texto": f"incidencia {i}" + (',\n"con salto"' if i % 11 == 0 else ""),
+              "tipo_esperado": ETIQUETAS[i % len(ETIQUETAS)]} for i in range(103)]
+    pd.DataFrame(filas).to_csv(ruta, index=False)
+    return ruta
+
+
+def _captura(ruta):
+    return CapturaPorBloques(ruta, ETIQUETAS, ETIQUETAS[-1], 0.45)
+
+
+def _evaluar(dataset, salida, clasificar_lote, tam_bloque, **opciones):
+    return evaluar_en_streaming(dataset, salida, clasificar_lote, tam_bloque=tam_bloque, salida=None,
+                                captura=_captura(salida.with_suffix(".npz")), **opciones)
+
+
+def test_contar_registros_respeta_saltos_entrecomillados(dataset):
+    assert contar_registros(dataset) == 103
+
+
+def test_reanudar_con_otro_tamano_de_bloque_da_lo_mismo(dataset, tmp_path):
+    referencia = tmp_path / "referencia.csv"
+    resumen_ref = _evaluar(dataset, referencia, clasificar, tam_bloque=10)
+
+    salida = tmp_path / "salida.csv"
+    with pytest.raises(KeyboardInterrupt):
+        _evaluar(dataset, salida, CorteTrasBloques(3), tam_bloque=7)
+    # Un trozo a medio escribir tras el último punto de control se descarta
+    with open(salida, "a", encoding="utf-8") as f:
+        f.write("incidencia a medias,problema")
+
+    resumen = _evaluar(dataset, salida, clasificar, tam_bloque=13)
+    assert resumen["reanudado_desde"] == 21
+    assert (resumen["filas"], resumen["aciertos"]) == (resumen_ref["filas"], resumen_ref["aciertos"])
+    assert salida.read_bytes() == referencia.read_bytes()
+    assert not salida.with_name(salida.name + ".checkpoint.json").exists()
+
+    ref, rean = cargar_puntuaciones(referencia.with_suffix(".npz")), cargar_puntuaciones(salida.with_suffix(".npz"))
+    np.testing.assert_array_equal(rean.puntuaciones, ref.puntuaciones)
+    np.testing.assert_array_equal(rean.fijas, ref.fijas)
+    np.testing.assert_array_equal(rean.esperados, ref.esperados)
+
+
+def test_dataset_cambiado_empieza_de_cero(dataset, tmp_path):
+    salida = tmp_path / "salida.csv"
+    with pytest.raises(KeyboardInterrupt):
+        _evaluar(dataset, salida, CorteTrasBloques(2), tam_bloque=10)
+    with open(dataset, "a", encoding="utf-8") as f:
+        f.write("incidencia nueva,problema técnico\n")
+
+    resumen = _evaluar(dataset, salida, clasificar, tam_bloque=10)
+    assert resumen["reanudado_desde"] == 0
+    assert resumen["filas"] == 104
+
+
+def test_varios_procesos_dan_la_misma_salida(dataset, tmp_path):
+    referencia = tmp_path / "referencia.csv"
+    _evaluar(dataset, referencia, clasificar, tam_bloque=10)
+    salida = tmp_path / "paralelo.csv"
+    _evaluar(dataset, salida, clasificar, tam_bloque=9, n_procesos=2, hilos=1)
+    assert salida.read_bytes() == referencia.read_bytes()
@@ -0,0 +1,103 @@
+# ---------------------------------------------------------
+# Autor: Raúl Cid González
+# Pruebas del almacén de feedback: duplicados y estadísticas
+# iguales a las de compute_feedback_stats sobre el CSV
+# ---------------------------------------------------------
+
+import csv
+
+import pandas as pd
+import pytest
+
+from utils_feedback import AlmacenFeedback, build_question_id, compute_feedback_stats
+
+
+CABECERA = ["timestamp", "question_id", "texto_usuario", "tipo_detectado", "prioridad",
+            "confianza_top", "respuesta_resumen", "feedback"]
+
+FILAS_CSV = [
+    # (timestamp, texto, tipo, prioridad, confianza, resumen, feedback)
+    ("2026-01-10T09:00:00", "no puedo entrar", "problema de acceso", "alta", 0.81, "Prueba a...", "SI"),
+    ("2026-01-10T09:05:00", "no puedo entrar", "problema de acceso", "alta", 0.81, "Prueba a...", "NO"),  # repetida
+    ("2026-01-10T09:06:00", "no puedo entrar", "problema de acceso", "alta", 0.81, "Prueba a...", "SI"),  # repetida
+    ("2026-01-11T10:00:00", "error en la matrícula", "error de matrícula", "media", 0.55, "Revisa...", "si"),
+    ("2026-01-11T10:30:00", "la wifi va lenta", "problema técnico", "baja", 0.47, "Reinicia...", "NO"),
+    ("2026-01-12T11:00:00", "otra cosa", "otro tipo de incidencia", "baja", 0.20, "Contacta...", ""),
+]
+
+
+def _escribir_csv(ruta, filas):
+    with open(ruta, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(CABECERA)
+        for t, texto, tipo, prioridad, conf, resumen, fb in filas:
+            w.writerow([t, build_question_id(texto, resumen), texto, tipo, prioridad, conf, resumen, fb])
+
+
+def _sin_desgloses(stats):
+    return {k: stats[k] for k in ("total", "si", "no", "porcentaje_si")}
+
+
+@pytest.fixture
+def rutas(tmp_path):
+    ruta_csv = tmp_path / "feedback_chat.csv"
+    _escribir_csv(ruta_csv, FILAS_CSV)
+    return tmp_path / "feedback_chat.sqlite", ruta_csv
+
+
+def test_importacion_cuenta_como_compute_feedback_stats(rutas):
+    ruta_db, ruta_csv = rutas
+    almacen = AlmacenFeedback(ruta_db, ruta_csv)
+
+    assert _sin_desgloses(almacen.estadisticas()) == compute_feedback_stats(pd.read_csv(ruta_csv))
+    assert almacen.duplicados_csv() == 2
+    # El índice tiene una entrada por pregunta: se queda el primer voto
+    assert almacen.voto(build_question_id("no puedo entrar", "Prueba a...")) == "SI"
+
+
+def test_desgloses_cuentan_todas_las_filas(rutas):
+    ruta_db, ruta_csv = rutas
+    stats = AlmacenFeedback(ruta_db, ruta_csv).estadisticas()
+    assert stats["por_tipo"]["problema de acceso"] == {"si": 2, "no": 1}
+    assert stats["por_dia"]["2026-01-11"] == {"si": 1, "no": 1}
+    assert "otro tipo de incidencia" not in stats["por_tipo"]  # sin voto
+
+
+def test_insertar_bloquea_duplicados_y_actualiza_estadisticas(rutas):
+    ruta_db, ruta_csv = rutas
+    almacen = AlmacenFeedback(ruta_db, ruta_csv)
+    fila = {"question_id": build_question_id("aula sin proyector", "Avisa..."), "timestamp": "2026-01-13T08:00:00",
+            "texto_usuario": "aula sin proyector", "tipo_detectado": "problema técnico", "prioridad": "media",
+            "confianza_top": 0.7, "respuesta_resumen": "Avisa...", "feedback": "SI"}
+
+    assert almacen.insertar(fila) is True
+    assert almacen.insertar({**fila, "feedback": "NO"}) is False
+    assert almacen.ya_registrado(fila["question_id"])
+
+    # Como hace registrar_feedback: solo se añade al CSV lo que entra en el índice
+    with open(ruta_csv, "a", encoding="utf-8", newline="") as f:
+        csv.DictWriter(f, fieldnames=CABECERA).writerow(fila)
+    assert _sin_desgloses(almacen.estadisticas()) == compute_feedback_stats(pd.read_csv(ruta_csv))
+
+
+def test_reconstruir_desde_el_csv_repara_el_indice(rutas):
+    ruta_db, ruta_csv = rutas
+    almacen = AlmacenFeedback(ruta_db, ruta_csv)
+    esperado = almacen.estadisticas()
+
+    # Deriva: se pierde una fila del índice y los agregados quedan mal
+    qid = build_question_id("la wifi va lenta", "Reinicia...")
+    with almacen._db:
+        almacen._db.execute("DELETE FROM feedback WHERE question_id = ?", (qid,))
+        almacen._db.execute("UPDATE estadisticas SET si = si + 5")
+
+    almacen.reconstruir_estadisticas(ruta_csv)
+    assert almacen.estadisticas() == esperado
+    assert almacen.voto(qid) == "NO"
+
+
+def test_reabrir_no_vuelve_a_importar(rutas):
+    ruta_db, ruta_csv = rutas
+    AlmacenFeedback(ruta_db, ruta_csv)._db.close()
+    almacen = AlmacenFeedback(ruta_db, ruta_csv)
+    assert _sin_desgloses(almacen.estadisticas()) == compute_feedback_stats(pd.read_csv(ruta_csv))
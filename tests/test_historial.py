@@ -0,0 +1,56 @@
+# ---------------------------------------------------------
+# Autor: Raúl Cid González
+# Pruebas del historial de chat paginado y de su purga
+# ---------------------------------------------------------
+
+import os
+import time
+
+from utils_historial import HistorialChat, purgar_historiales
+
+
+def _historial(ruta, n):
+    h = HistorialChat(ruta, ventana=3, tam_pagina=2)
+    for i in range(n):
+        h.agregar("user", f"m{i}")
+    return h
+
+
+def _envejecer(ruta, segundos):
+    antes = time.time() - segundos
+    os.utime(ruta, (antes, antes))
+
+
+def test_paginas_anteriores_y_siguientes(tmp_path):
+    h = _historial(tmp_path / "s.jsonl", 8)   # m0..m4 en disco, m5..m7 en memoria
+    assert [m["content"] for m in h.recientes] == ["m5", "m6", "m7"]
+    assert [m["content"] for m in h.pagina_anterior()] == ["m3", "m4"]
+    assert [m["content"] for m in h.pagina_anterior()] == ["m1", "m2"]
+    assert [m["content"] for m in h.pagina_anterior()] == ["m0"]
+    assert not h.hay_anteriores
+    assert [m["content"] for m in h.pagina_siguiente()] == ["m1", "m2"]
+
+
+def test_purga_respeta_sesiones_que_se_siguen_usando(tmp_path):
+    viva = _historial(tmp_path / "viva.jsonl", 6)
+    _historial(tmp_path / "abandonada.jsonl", 6)
+    for ruta in tmp_path.glob("*.jsonl"):
+        _envejecer(ruta, 2 * 24 * 3600)
+
+    viva.mantener_vivo()
+    assert purgar_historiales(tmp_path) == 1
+    assert [m["content"] for m in viva.pagina_anterior()] == ["m1", "m2"]
+
+
+def test_archivo_purgado_no_rompe_la_sesion(tmp_path):
+    ruta = tmp_path / "s.jsonl"
+    h = _historial(ruta, 6)
+    os.remove(ruta)
+
+    assert h.pagina_anterior() == []
+    assert h.n_desbordados == 0 and not h.hay_anteriores
+
+    # Los desbordes nuevos empiezan un archivo coherente
+    for i in range(6, 9):
+        h.agregar("user", f"m{i}")
+    assert [m["content"] for m in h.pagina_anterior()] == ["m4", "m5"]
@@ -0,0 +1,60 @@
+# ---------------------------------------------------------
+# Autor: Raúl Cid González
+# Pruebas de la carga del modelo: reintento tras un fallo
+# ---------------------------------------------------------
+
+import pytest
+
+from utils_modelo import GestorModelo
+
+
+class CargadorQueFalla:
+    """Falla las primeras `fallos` veces y después devuelve "modelo"."""
+
+    def __init__(self, fallos: int) -> None:
+        self.fallos = fallos
+        self.llamadas = 0
+
+    def __call__(self):
+        self.llamadas += 1
+        if self.llamadas <= self.fallos:
+            raise OSError("sin red")
+        return "modelo"
+
+
+def test_obtener_reintenta_tras_un_fallo():
+    cargador = CargadorQueFalla(fallos=1)
+    gestor = GestorModelo(cargador, reintento_s=0)
+
+    with pytest.raises(RuntimeError):
+        gestor.obtener()
+    assert not gestor.listo
+
+    assert gestor.obtener() == "modelo"
+    assert gestor.listo
+    assert cargador.llamadas == 2
+
+
+def test_no_reintenta_antes_de_la_espera():
+    cargador = CargadorQueFalla(fallos=1)
+    gestor = GestorModelo(cargador, reintento_s=3600)
+
+    for _ in range(3):
+        with pytest.raises(RuntimeError):
+            gestor.obtener()
+    gestor.precargar()
+    assert cargador.llamadas == 1
+
+
+def test_precargar_reintenta_en_segundo_plano():
+    cargador = CargadorQueFalla(fallos=1)
+    gestor = GestorModelo(cargador, reintento_s=0)
+    gestor.precargar()
+    hilo = gestor._hilo
+    if hilo is not None:
+        hilo.join(5)
+    assert not gestor.listo and not gestor.cargando
+
+    gestor.precargar()
+    assert gestor.obtener(timeout=5) == "modelo"
+    assert cargador.llamadas == 2
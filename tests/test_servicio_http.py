@@ -0,0 +1,141 @@
+# ---------------------------------------------------------
+# Autor: Raúl Cid González
+# Pruebas del servicio HTTP con el clasificador simulado
+# ---------------------------------------------------------
+
+import asyncio
+import json
+import uuid
+
+import pytest
+
+import Asistente_Nebrija as asistente
+import servicio_http
+from utils_modelo import ClasificadorSimulado
+
+
+@pytest.fixture(autouse=True)
+def modelo_simulado(tmp_path, monkeypatch):
+    # Registros y almacenes relativos al directorio de trabajo: fuera del repo
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(asistente, "CASCADA_ACTIVA", False)
+    monkeypatch.setattr(asistente, "VECINOS_ACTIVO", False)
+    monkeypatch.setattr(asistente, "CACHE_ACTIVA", False)
+
+    def usar(ms_por_par=0.0):
+        asistente.gestor_modelo.reemplazar(ClasificadorSimulado(ms_por_par=ms_por_par))
+
+    usar()
+    return usar
+
+
+def _texto_sin_reglas() -> str:
+    # Ninguna regla ni FAQ reconoce esto: siempre pasa por el modelo
+    return f"zqx {uuid.uuid4().hex}"
+
+
+async def _peticion(puerto, crudo: bytes):
+    lector, escritor = await asyncio.open_connection("127.0.0.1", puerto)
+    escritor.write(crudo)
+    await escritor.drain()
+    cabecera = await lector.readuntil(b"\r\n\r\n")
+    lineas = cabecera.decode("latin-1").split("\r\n")
+    estado = int(lineas[0].split(" ")[1])
+    cabeceras = {k.strip().lower(): v.strip() for k, v in (l.split(":", 1) for l in lineas[1:] if ":" in l)}
+    cuerpo = await lector.readexactly(int(cabeceras["content-length"]))
+    escritor.close()
+    return estado, cabeceras, cuerpo
+
+
+def _post(ruta: str, cuerpo: bytes, cabeceras: str = "") -> bytes:
+    return (f"POST {ruta} HTTP/1.1\r\nHost: x\r\nConnection: close\r\n"
+            f"Content-Length: {len(cuerpo)}\r\n{cabeceras}\r\n").encode() + cuerpo
+
+
+def _json(ruta: str, datos) -> bytes:
+    return _post(ruta, json.dumps(datos).encode())
+
+
+def _con_servicio(prueba, **opciones):
+    async def principal():
+        servicio = servicio_http.ServicioAsistente(puerto=0, **opciones)
+        await servicio.iniciar()
+        try:
+            return await prueba(servicio)
+        finally:
+            await servicio.detener()
+
+    return asyncio.run(principal())
+
+
+def test_clasificar_devuelve_categoria_y_scores():
+    async def prueba(servicio):
+        return await _peticion(servicio.puerto, _json("/clasificar", {"texto": _texto_sin_reglas()}))
+
+    estado, _, cuerpo = _con_servicio(prueba)
+    datos = json.loads(cuerpo)
+    assert estado == 200
+    assert datos["categoria"] in asistente.categorias
+    assert set(datos["scores"]) == set(asistente.categorias)
+
+
+@pytest.mark.parametrize("longitud", ["abc", "-5", "1.5"])
+def test_content_length_mal_formado_da_400(longitud):
+    async def prueba(servicio):
+        crudo = (f"POST /clasificar HTTP/1.1\r\nHost: x\r\nContent-Length: {longitud}\r\n\r\n").encode()
+        return await _peticion(servicio.puerto, crudo)
+
+    estado, cabeceras, _ = _con_servicio(prueba)
+    assert estado == 400
+    assert cabeceras["connection"] == "close"
+
+
+def test_cuerpo_demasiado_grande_da_413_sin_leerlo():
+    async def prueba(servicio):
+        crudo = (f"POST /clasificar HTTP/1.1\r\nHost: x\r\n"
+                 f"Content-Length: {servicio_http.MAX_CUERPO + 1}\r\n\r\n").encode()
+        return await _peticion(servicio.puerto, crudo)
+
+    estado, _, _ = _con_servicio(prueba)
+    assert estado == 413
+
+
+@pytest.mark.parametrize("cuerpo", [b"[1, 2]", b'"texto"', b"no es json"])
+def test_json_que_no_es_objeto_da_400(cuerpo):
+    async def prueba(servicio):
+        return await _peticion(servicio.puerto, _post("/clasificar", cuerpo))
+
+    estado, _, _ = _con_servicio(prueba)
+    assert estado == 400
+
+
+def test_timeout_da_504_y_sigue_ocupando_el_hueco(modelo_simulado):
+    # 6 categorías x 100 ms: el trabajo tarda ~0.6 s y el plazo es 0.2 s
+    modelo_simulado(ms_por_par=100)
+
+    async def prueba(servicio):
+        lenta = await _peticion(servicio.puerto, _json("/clasificar", {"texto": _texto_sin_reglas()}))
+        # El 504 ya está respondido pero el hilo sigue trabajando: no hay hueco
+        ocupado = await _peticion(servicio.puerto, _json("/clasificar", {"texto": _texto_sin_reglas()}))
+        pendientes = servicio.pendientes
+        while servicio.pendientes:
+            await asyncio.sleep(0.05)
+        return lenta, ocupado, pendientes
+
+    lenta, ocupado, pendientes = _con_servicio(prueba, max_pendientes=1, timeout_s=0.2)
+    assert lenta[0] == 504
+    assert ocupado[0] == 503
+    assert ocupado[1]["retry-after"]
+    assert pendientes == 1
+
+
+def test_sin_capacidad_da_503(modelo_simulado):
+    modelo_simulado(ms_por_par=50)
+
+    async def prueba(servicio):
+        peticiones = [_peticion(servicio.puerto, _json("/clasificar", {"texto": _texto_sin_reglas()}))
+                      for _ in range(4)]
+        return [estado for estado, _, _ in await asyncio.gather(*peticiones)]
+
+    estados = _con_servicio(prueba, max_pendientes=1, timeout_s=5)
+    assert sorted(estados) == [200, 503, 503, 503]
@@ -0,0 +1,247 @@
+# ---------------------------------------------------------
+# Autor: Raúl Cid González
+# Matrices de puntuaciones de una evaluación (.npz) y análisis
+# vectorizado sobre ellas: matriz de confusión, precisión y
+# exhaustividad por clase y barrido del umbral de confianza
+# ---------------------------------------------------------
+
+from __future__ import annotations
+
+import shutil
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+
+# ---------- 1. Captura ----------
+
+def matriz_puntuaciones(
+    resultados: Sequence[Tuple[str, Dict[str, float], str, float]],
+    etiquetas: Sequence[str],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    De los resultados de clasificar_incidencias_lote a arrays:
+
+    - puntuaciones (n, k) float32: una columna por etiqueta; NaN en las
+      filas que no pasaron por el modelo.
+    - fijas (n,) int16: índice de la etiqueta cuando la decidió una
+      regla (no depende del umbral); -1 si la decidió el modelo.
+    """
+    indice = {e: i for i, e in enumerate(etiquetas)}
+    puntuaciones = np.full((len(resultados), len(etiquetas)), np.nan, dtype=np.float32)
+    fijas = np.full(len(resultados), -1, dtype=np.int16)
+    for fila, (prediccion, scores, _, _) in enumerate(resultados):
+        if scores:
+            for etiqueta, valor in scores.items():
+                j = indice.get(etiqueta)
+                if j is not None:
+                    puntuaciones[fila, j] = valor
+        else:
+            fijas[fila] = indice.get(prediccion, -2)  # -2: etiqueta fuera de la lista
+    return puntuaciones, fijas
+
+
+def _indices(valores: Sequence[str], etiquetas: Sequence[str]) -> np.ndarray:
+    indice = {e: i for i, e in enumerate(etiquetas)}
+    return np.fromiter((indice.get(v, -1) for v in valores), dtype=np.int16, count=len(valores))
+
+
+def guardar_puntuaciones(
+    ruta: Union[str, Path],
+    puntuaciones: np.ndarray,
+    fijas: np.ndarray,
+    esperados: Sequence[str],
+    etiquetas: Sequence[str],
+    etiqueta_otro: str,
+    umbral: float,
+) -> None:
+    """Guarda la matriz junto con lo necesario para reinterpretarla (etiquetas, "otro", umbral)."""
+    ruta = Path(ruta)
+    tmp = ruta.with_name(ruta.stem + ".tmp.npz")
+    np.savez_compressed(
+        tmp,
+        puntuaciones=puntuaciones.astype(np.float32, copy=False),
+        fijas=fijas.astype(np.int16, copy=False),
+        esperados=_indices(list(esperados), etiquetas),
+        etiquetas=np.array(list(etiquetas)),
+        otro=np.int16(list(etiquetas).index(etiqueta_otro)),
+        umbral=np.float32(umbral),
+    )
+    tmp.replace(ruta)
+
+
+class CapturaPorBloques:
+    """
+    Para evaluaciones por bloques: cada bloque se guarda en
+    "<ruta>.bloques/<fila inicial>.npz" y cerrar() los junta en `ruta`.
+    Un bloque repetido al reanudar se sobrescribe (mismo nombre).
+    """
+
+    def __init__(self, ruta: Union[str, Path], etiquetas: Sequence[str], etiqueta_otro: str, umbral: float) -> None:
+        self.ruta = Path(ruta)
+        self.etiquetas = list(etiquetas)
+        self.etiqueta_otro = etiqueta_otro
+        self.umbral = umbral
+        self.carpeta = self.ruta.with_name(self.ruta.name + ".bloques")
+
+    def preparar(self, desde_fila: int = 0) -> None:
+        """Descarta los bloques a partir de `desde_fila` (todos si es 0)."""
+        if desde_fila == 0:
+            shutil.rmtree(self.carpeta, ignore_errors=True)
+        elif self.carpeta.is_dir():
+            for archivo in self.carpeta.glob("*.npz"):
+                if int(archivo.stem) >= desde_fila:
+                    archivo.unlink()
+        self.carpeta.mkdir(parents=True, exist_ok=True)
+
+    def guardar_bloque(self, fila_inicial: int, puntuaciones: np.ndarray, fijas: np.ndarray,
+                       esperados: Sequence[str]) -> None:
+        np.savez(
+            self.carpeta / f"{fila_inicial:012d}.npz",
+            puntuaciones=puntuaciones,
+            fijas=fijas,
+            esperados=np.array(list(esperados)),
+        )
+
+    def cerrar(self) -> None:
+        bloques = [np.load(a) for a in sorted(self.carpeta.glob("*.npz"))]
+        k = len(self.etiquetas)
+        guardar_puntuaciones(
+            self.ruta,
+            np.concatenate([b["puntuaciones"] for b in bloques]) if bloques else np.empty((0, k), np.float32),
+            np.concatenate([b["fijas"] for b in bloques]) if bloques else np.empty(0, np.int16),
+            np.concatenate([b["esperados"] for b in bloques]).tolist() if bloques else [],
+            self.etiquetas,
+            self.etiqueta_otro,
+            self.umbral,
+        )
+        shutil.rmtree(self.carpeta, ignore_errors=True)
+
+
+# ---------- 2. Análisis ----------
+
+class Puntuaciones(NamedTuple):
+    puntuaciones: np.ndarray    # (n, k) float32, NaN si no pasó por el modelo
+    fijas: np.ndarray           # (n,) índice decidido por regla, o -1
+    esperados: np.ndarray       # (n,) índice de la etiqueta esperada, -1 si no está en `etiquetas`
+    etiquetas: List[str]
+    otro: int                   # índice de "otro tipo de incidencia"
+    umbral: float               # umbral con el que se evaluó
+
+
+def cargar_puntuaciones(ruta: Union[str, Path]) -> Puntuaciones:
+    with np.load(ruta) as d:
+        return Puntuaciones(
+            d["puntuaciones"], d["fijas"], d["esperados"],
+            d["etiquetas"].tolist(), int(d["otro"]), float(d["umbral"]),
+        )
+
+
+def _top(p: Puntuaciones) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(filas del modelo, puntuación máxima, índice de la máxima) de esas filas."""
+    modelo = p.fijas == -1
+    matriz = p.puntuaciones[modelo]
+    return modelo, matriz.max(axis=1), matriz.argmax(axis=1)
+
+
+def predecir(p: Puntuaciones, umbral: Optional[float] = None) -> np.ndarray:
+    """Predicción de cada fila con `umbral` (por defecto el de la evaluación)."""
+    umbral = p.umbral if umbral is None else umbral
+    prediccion = p.fijas.astype(np.int16).copy()
+    modelo, top, arg = _top(p)
+    prediccion[modelo] = np.where(top < umbral, p.otro, arg)
+    return prediccion
+
+
+def matriz_confusion(p: Puntuaciones, umbral: Optional[float] = None) -> pd.DataFrame:
+    """Filas: etiqueta esperada; columnas: predicha. Solo filas con ambas en `etiquetas`."""
+    k = len(p.etiquetas)
+    prediccion = predecir(p, umbral)
+    validas = (p.esperados >= 0) & (prediccion >= 0)
+    cuentas = np.bincount(
+        p.esperados[validas].astype(np.int64) * k + prediccion[validas],
+        minlength=k * k,
+    ).reshape(k, k)
+    return pd.DataFrame(cuentas, index=pd.Index(p.etiquetas, name="esperada"),
+                        columns=pd.Index(p.etiquetas, name="predicha"))
+
+
+def precision_exhaustividad(p: Puntuaciones, umbral: Optional[float] = None) -> pd.DataFrame:
+    """Precisión, exhaustividad (recall), F1 y soporte de cada etiqueta."""
+    m = matriz_confusion(p, umbral).to_numpy()
+    aciertos = np.diag(m).astype(float)
+    predichas = m.sum(axis=0)
+    reales = m.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = aciertos / predichas
+        exhaustividad = aciertos / reales
+        f1 = 2 * precision * exhaustividad / (precision + exhaustividad)
+    return pd.DataFrame(
+        {"precision": precision, "exhaustividad": exhaustividad, "f1": f1, "soporte": reales},
+        index=pd.Index(p.etiquetas, name="etiqueta"),
+    )
+
+
+def barrido_umbral(p: Puntuaciones, umbrales: Optional[Sequence[float]] = None) -> pd.DataFrame:
+    """
+    Exactitud para cada umbral (por defecto 0, 0.001, ..., 1) sin
+    reclasificar: se ordena una vez la puntuación máxima de cada fila y,
+    con sumas acumuladas, cada umbral es una búsqueda binaria.
+
+    Columnas: umbral, exactitud y fraccion_otro (filas del modelo que
+    acaban en "otro" por quedar bajo el umbral).
+    """
+    umbrales = np.linspace(0.0, 1.0, 1001) if umbrales is None else np.asarray(umbrales, dtype=np.float64)
+    n = len(p.fijas)
+    modelo, top, arg = _top(p)
+    esperados_modelo = p.esperados[modelo]
+
+    fijas = ~modelo
+    aciertos_fijos = int(np.count_nonzero(p.fijas[fijas] == p.esperados[fijas]))
+
+    orden = np.argsort(top, kind="stable")
+    top_ordenado = top[orden]
+    # acumulados sobre las filas ordenadas: si quedan por debajo -> "otro"
+    acierta_otro = np.concatenate(([0], np.cumsum(esperados_modelo[orden] == p.otro)))
+    acierta_top = np.concatenate(([0], np.cumsum(arg[orden] == esperados_modelo[orden])))
+
+    bajo = np.searchsorted(top_ordenado, umbrales, side="left")  # puntuación < umbral
+    aciertos = aciertos_fijos + acierta_otro[bajo] + (acierta_top[-1] - acierta_top[bajo])
+    return pd.DataFrame({
+        "umbral": umbrales,
+        "exactitud": aciertos / n if n else np.zeros(len(umbrales)),
+        "fraccion_otro": bajo / len(top) if len(top) else np.zeros(len(umbrales)),
+    })
+
+
+def mejor_umbral(p: Puntuaciones) -> Tuple[float, float]:
+    """(umbral, exactitud) óptimos probando como umbral cada puntuación distinta."""
+    _, top, _ = _top(p)
+    candidatos = np.unique(np.concatenate(([0.0], top.astype(np.float64), [np.nextafter(1.0, 2.0)])))
+    barrido = barrido_umbral(p, candidatos)
+    mejor = int(barrido["exactitud"].to_numpy().argmax())
+    return float(barrido["umbral"].iat[mejor]), float(barrido["exactitud"].iat[mejor])
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Análisis de las puntuaciones guardadas de una evaluación.")
+    parser.add_argument("npz", nargs="?", default="resultados_evaluacion.npz")
+    parser.add_argument("--umbral", type=float, default=None, help="Umbral a analizar (por defecto el de la evaluación).")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    datos = cargar_puntuaciones(args.npz)
+    umbral = datos.umbral if args.umbral is None else args.umbral
+    pd.set_option("display.width", 160)
+    print(f"{len(datos.fijas)} filas · umbral {umbral:.3f}\n")
+    print(matriz_confusion(datos, umbral), "\n")
+    print(precision_exhaustividad(datos, umbral).round(3), "\n")
+    u, exactitud = mejor_umbral(datos)
+    actual = barrido_umbral(datos, [umbral])["exactitud"].iat[0]
+    print(f"Exactitud con {umbral:.3f}: {actual:.2%} · mejor umbral {u:.3f}: {exactitud:.2%}")
+    print(f"({time.perf_counter() - inicio:.2f} s)")
@@ -0,0 +1,116 @@
+# ---------------------------------------------------------
+# Autor: Raúl Cid González
+# Motores de inferencia intercambiables para el modelo NLI:
+# transformers (fp32), ONNX Runtime e int8 cuantizado
+# ---------------------------------------------------------
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Optional, Union
+
+
+BACKENDS = ("transformers", "onnx", "int8")
+
+
+class BackendRechazadoError(RuntimeError):
+    """El backend candidato no supera la comparación con fp32."""
+
+
+def _tokenizer(modelo: str):
+    from transformers import AutoTokenizer
+
+    return AutoTokenizer.from_pretrained(modelo)
+
+
+def _pipeline_zero_shot(model: Any, tokenizer: Any):
+    from transformers import pipeline
+
+    return pipeline("zero-shot-classification", model=model, tokenizer=tokenizer)
+
+
+def crear_backend(
+    nombre: str,
+    modelo: str,
+    ruta_onnx: Optional[Union[str, Path]] = None,
+    ruta_pesos: Optional[Union[str, Path]] = None,
+):
+    """
+    Devuelve un pipeline "zero-shot-classification" con el motor pedido.
+    Todos se llaman igual y devuelven la misma estructura
+    ({"sequence", "labels", "scores"}), así que el resto del código no
+    necesita saber cuál está activo.
+
+    - "transformers": PyTorch fp32, el de siempre. Con `ruta_pesos`, los
+      pesos se mapean en memoria desde el model.safetensors de esa carpeta
+      (se exporta la primera vez) y los comparten todos los procesos del
+      equipo que lo carguen igual (ver utils_pesos_compartidos).
+    - "onnx": ONNX Runtime vía optimum. Si `ruta_onnx` existe se carga de
+      ahí; si no, se exporta el modelo y se guarda en `ruta_onnx` para la
+      próxima vez.
+    - "int8": cuantización dinámica de las capas Linear a int8 (CPU).
+    """
+    if nombre == "transformers":
+        if ruta_pesos is not None:
+            from utils_pesos_compartidos import pipeline_mapeado
+
+            return pipeline_mapeado(modelo, ruta_pesos)
+
+        from transformers import pipeline
+
+        return pipeline("zero-shot-classification", model=modelo)
+
+    if nombre == "onnx":
+        try:
+            from optimum.onnxruntime import ORTModelForSequenceClassification
+        except ImportError as e:
+            raise ImportError(
+                "El backend 'onnx' necesita optimum y onnxruntime: "
+                "pip install optimum[onnxruntime]"
+            ) from e
+
+        if ruta_onnx is not None and Path(ruta_onnx).exists():
+            model = ORTModelForSequenceClassification.from_pretrained(str(ruta_onnx))
+        else:
+            model = ORTModelForSequenceClassification.from_pretrained(modelo, export=True)
+            if ruta_onnx is not None:
+                model.save_pretrained(str(ruta_onnx))
+        return _pipeline_zero_shot(model, _tokenizer(modelo))
+
+    if nombre == "int8":
+        import torch
+        from transformers import AutoModelForSequenceClassification
+
+        model = AutoModelForSequenceClassification.from_pretrained(modelo)
+        model.eval()
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return _pipeline_zero_shot(model, _tokenizer(modelo))
+
+    raise ValueError(f"Backend desconocido: {nombre!r}. Opciones: {', '.join(BACKENDS)}")
+
+
+def comparar_resultados(salidas_referencia, salidas_candidato) -> dict:
+    """
+    Compara dos salidas del pipeline zero-shot texto a texto (listas de
+    {"labels", "scores"}, en el mismo orden):
+    - discrepancia: fracción de textos con distinta etiqueta ganadora
+    - max_dif_confianza: mayor diferencia absoluta en la puntuación de
+      cualquier etiqueta (no solo la ganadora)
+    """
+    n = len(salidas_referencia)
+    if n == 0:
+        return {"filas": 0, "discrepancia": 0.0, "max_dif_confianza": 0.0}
+
+    distintas = 0
+    max_dif = 0.0
+    for ref, cand in zip(salidas_referencia, salidas_candidato):
+        if ref["labels"][0] != cand["labels"][0]:
+            distintas += 1
+        puntuaciones_cand = dict(zip(cand["labels"], cand["scores"]))
+        for etiqueta, valor in zip(ref["labels"], ref["scores"]):
+            max_dif = max(max_dif, abs(float(valor) - float(puntuaciones_cand.get(etiqueta, 0.0))))
+    return {
+        "filas": n,
+        "discrepancia": distintas / n,
+        "max_dif_confianza": max_dif,
+    }
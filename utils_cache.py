@@ -0,0 +1,191 @@
+# ---------------------------------------------------------
+# Autor: Raúl Cid González
+# Caché de predicciones: LRU en memoria + nivel opcional en
+# disco (SQLite) que sobrevive a reinicios
+# ---------------------------------------------------------
+
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+
+def normalizar_texto(texto: str) -> str:
+    """
+    Minúsculas, sin tildes, sin signos de puntuación y con los espacios
+    colapsados. "¿No puedo  ENTRAR a Teams?" -> "no puedo entrar a teams"
+    """
+    t = unicodedata.normalize("NFKD", str(texto).lower())
+    t = "".join(c for c in t if not unicodedata.combining(c))
+    t = re.sub(r"[^\w\s]", " ", t)
+    return " ".join(t.split())
+
+
+def huella_configuracion(**config: Any) -> str:
+    """
+    Resume en un hash todo lo que afecta a una predicción (modelo,
+    categorías, plantilla, umbral...). Si cambia algo, cambia la huella y
+    las entradas antiguas dejan de ser válidas.
+    """
+    base = json.dumps(config, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(base.encode("utf-8")).hexdigest()[:16]
+
+
+class CachePredicciones:
+    """
+    Caché de dos niveles para resultados de clasificación.
+
+    - Memoria: LRU acotado a `capacidad` entradas.
+    - Disco (opcional): tabla SQLite compartida. La huella forma parte de
+      la clave, así que varias configuraciones (la app, el servicio, una
+      evaluación con otro backend) conviven sin pisarse; las huellas que
+      nadie usa se borran con podar().
+
+    Los valores deben ser serializables a JSON.
+    """
+
+    def __init__(
+        self,
+        huella: str,
+        capacidad: int = 2048,
+        ruta_disco: Optional[Union[str, Path]] = None,
+    ) -> None:
+        self.huella = huella
+        self.capacidad = max(1, int(capacidad))
+        self._memoria: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+        self.aciertos_memoria = 0
+        self.aciertos_disco = 0
+        self.fallos = 0
+
+        if ruta_disco is not None:
+            self._db = sqlite3.connect(str(ruta_disco), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS predicciones ("
+                "huella TEXT NOT NULL, clave TEXT NOT NULL, valor TEXT NOT NULL, "
+                "PRIMARY KEY (huella, clave))"
+            )
+            # Último uso de cada huella (al abrir y al escribir), para podar()
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS huellas (huella TEXT PRIMARY KEY, ultimo_uso REAL NOT NULL)"
+            )
+            self._tocar()
+            self._db.commit()
+
+    def _tocar(self) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO huellas (huella, ultimo_uso) VALUES (?, ?)",
+            (self.huella, time.time()),
+        )
+
+    def podar(self, max_edad_s: float) -> int:
+        """
+        Borra del disco las entradas de las huellas que nadie ha abierto ni
+        escrito en `max_edad_s` segundos (nunca las de esta). Las entradas
+        sin registro de uso (de versiones anteriores) cuentan como viejas.
+        Devuelve cuántas entradas se han borrado.
+        """
+        limite = time.time() - max_edad_s
+        with self._lock:
+            if self._db is None:
+                return 0
+            return self._podar(limite)
+
+    def _podar(self, limite: float) -> int:
+        with self._db:
+            viejas = [h for (h,) in self._db.execute(
+                "SELECT DISTINCT huella FROM predicciones WHERE huella != ? AND huella NOT IN "
+                "(SELECT huella FROM huellas WHERE ultimo_uso >= ?)",
+                (self.huella, limite),
+            )]
+            borradas = 0
+            for h in viejas:
+                borradas += self._db.execute("DELETE FROM predicciones WHERE huella = ?", (h,)).rowcount
+            self._db.execute(
+                "DELETE FROM huellas WHERE huella != ? AND ultimo_uso < ?", (self.huella, limite)
+            )
+        return borradas
+
+    def cerrar(self) -> None:
+        """
+        Cierra la conexión a disco. Si algún hilo aún tiene la instancia,
+        sigue funcionando, pero solo en memoria.
+        """
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def clave(self, texto: str) -> str:
+        return normalizar_texto(texto)
+
+    def obtener(self, texto: str) -> Optional[Any]:
+        k = self.clave(texto)
+        with self._lock:
+            if k in self._memoria:
+                self._memoria.move_to_end(k)
+                self.aciertos_memoria += 1
+                return self._memoria[k]
+
+            if self._db is not None:
+                fila = self._db.execute(
+                    "SELECT valor FROM predicciones WHERE huella = ? AND clave = ?",
+                    (self.huella, k),
+                ).fetchone()
+                if fila is not None:
+                    valor = json.loads(fila[0])
+                    self._guardar_memoria(k, valor)
+                    self.aciertos_disco += 1
+                    return valor
+
+            self.fallos += 1
+            return None
+
+    def guardar(self, texto: str, valor: Any) -> None:
+        k = self.clave(texto)
+        with self._lock:
+            self._guardar_memoria(k, valor)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO predicciones (huella, clave, valor) VALUES (?, ?, ?)",
+                    (self.huella, k, json.dumps(valor, ensure_ascii=False)),
+                )
+                self._tocar()
+                self._db.commit()
+
+    def _guardar_memoria(self, k: str, valor: Any) -> None:
+        self._memoria[k] = valor
+        self._memoria.move_to_end(k)
+        while len(self._memoria) > self.capacidad:
+            self._memoria.popitem(last=False)
+
+    def limpiar(self) -> None:
+        """Vacía la caché de esta huella (las de otras configuraciones no se tocan)."""
+        with self._lock:
+            self._memoria.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM predicciones WHERE huella = ?", (self.huella,))
+                self._db.commit()
+
+    def estadisticas(self) -> Dict[str, Any]:
+        """Contadores de aciertos/fallos para ver cuánta inferencia se ahorra."""
+        with self._lock:
+            aciertos = self.aciertos_memoria + self.aciertos_disco
+            total = aciertos + self.fallos
+            return {
+                "aciertos_memoria": self.aciertos_memoria,
+                "aciertos_disco": self.aciertos_disco,
+                "fallos": self.fallos,
+                "tasa_acierto": round(aciertos / total, 4) if total else 0.0,
+                "entradas_memoria": len(self._memoria),
+            }
@@ -0,0 +1,136 @@
+# ---------------------------------------------------------
+# Autor: Raúl Cid González
+# Cascada de modelos zero-shot: un modelo NLI pequeño responde
+# primero y solo las dudas pasan al modelo grande
+# ---------------------------------------------------------
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+
+ETAPAS = ("pequeno", "grande")
+
+
+class ClasificadorCascada:
+    """
+    Se llama igual que el pipeline zero-shot y devuelve lo mismo, con una
+    clave extra "etapa" ("pequeno" o "grande") en cada resultado.
+
+    - Todos los textos pasan primero por el modelo pequeño, en un lote.
+    - Se escalan al grande, también en un lote, los que tienen una
+      confianza top menor que `umbral`, o a menos de `margen` del umbral
+      de decisión (`umbral_decision`, UMBRAL_CONFIANZA), donde un error
+      pequeño cambiaría la etiqueta final.
+    - Si el modelo pequeño no se puede obtener, todo va al grande.
+    - Lleva la cuenta por etapa de textos vistos, resueltos y segundos.
+    """
+
+    def __init__(
+        self,
+        pequeno: Callable[[], Any],
+        grande: Callable[[], Any],
+        umbral: float = 0.7,
+        umbral_decision: Optional[float] = None,
+        margen: float = 0.0,
+    ) -> None:
+        # Se reciben funciones que devuelven el modelo, no el modelo, para
+        # no forzar la carga (p. ej. GestorModelo.obtener)
+        self._pequeno = pequeno
+        self._grande = grande
+        self.umbral = umbral
+        self.umbral_decision = umbral_decision
+        self.margen = margen
+        self._lock = threading.Lock()
+        self._textos = dict.fromkeys(ETAPAS, 0)
+        self._resueltos = dict.fromkeys(ETAPAS, 0)
+        self._segundos = dict.fromkeys(ETAPAS, 0.0)
+        self._errores_pequeno = 0
+
+    def escalar(self, score_top: float) -> bool:
+        if score_top < self.umbral:
+            return True
+        if self.umbral_decision is not None and abs(score_top - self.umbral_decision) <= self.margen:
+            return True
+        return False
+
+    def _ejecutar(self, etapa: str, modelo: Any, textos: List[str], etiquetas, kwargs) -> List[Dict]:
+        inicio = time.perf_counter()
+        resultados = modelo(textos, etiquetas, **kwargs)
+        segundos = time.perf_counter() - inicio
+        if isinstance(resultados, dict):
+            resultados = [resultados]
+        with self._lock:
+            self._textos[etapa] += len(textos)
+            self._segundos[etapa] += segundos
+        return resultados
+
+    def __call__(
+        self,
+        sequences: Union[str, List[str]],
+        candidate_labels: Sequence[str],
+        **kwargs: Any,
+    ):
+        unica = isinstance(sequences, str)
+        textos = [sequences] if unica else list(sequences)
+        salida: List[Optional[Dict]] = [None] * len(textos)
+
+        try:
+            pequeno = self._pequeno()
+        except Exception as e:
+            pequeno = None
+            with self._lock:
+                self._errores_pequeno += 1
+                primero = self._errores_pequeno == 1
+            if primero:
+                print(f"⚠️ Modelo pequeño no disponible ({e}); se usa solo el grande.")
+
+        escalados = list(range(len(textos)))
+        if pequeno is not None:
+            resultados = self._ejecutar("pequeno", pequeno, textos, candidate_labels, kwargs)
+            escalados = []
+            for i, resultado in enumerate(resultados):
+                if self.escalar(float(resultado["scores"][0])):
+                    escalados.append(i)
+                else:
+                    salida[i] = dict(resultado, etapa="pequeno")
+
+        if escalados:
+            # batch_size cuenta pares (texto, hipótesis): no hay que tocarlo
+            resultados = self._ejecutar(
+                "grande", self._grande(), [textos[i] for i in escalados], candidate_labels, kwargs
+            )
+            for i, resultado in zip(escalados, resultados):
+                salida[i] = dict(resultado, etapa="grande")
+
+        with self._lock:
+            for resultado in salida:
+                self._resueltos[resultado["etapa"]] += 1  # type: ignore[index]
+
+        return salida[0] if unica else salida
+
+    def estadisticas(self) -> Dict[str, Dict[str, float]]:
+        """
+        Por etapa: textos que pasaron por ella, resueltos en ella,
+        tasa de acierto de la etapa (resueltos / total) y latencia media
+        por texto en ms.
+        """
+        with self._lock:
+            total = self._resueltos["pequeno"] + self._resueltos["grande"]
+            return {
+                etapa: {
+                    "textos": self._textos[etapa],
+                    "resueltos": self._resueltos[etapa],
+                    "tasa_resueltos": self._resueltos[etapa] / total if total else 0.0,
+                    "ms_por_texto": 1000 * self._segundos[etapa] / self._textos[etapa] if self._textos[etapa] else 0.0,
+                }
+                for etapa in ETAPAS
+            }
+
+    def coste_medio_ms(self) -> float:
+        """Milisegundos de modelo por texto clasificado, sumando las dos etapas."""
+        with self._lock:
+            total = self._resueltos["pequeno"] + self._resueltos["grande"]
+            return 1000 * sum(self._segundos.values()) / total if total else 0.0
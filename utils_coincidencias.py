@@ -0,0 +1,132 @@
+# ---------------------------------------------------------
+# Autor: Raúl Cid González
+# Motor de coincidencias: busca todas las palabras clave
+# (FAQ, reglas, prioridad) en una sola pasada por el texto
+# ---------------------------------------------------------
+
+from __future__ import annotations
+
+import re
+from typing import Dict, FrozenSet, List, Optional, Pattern, Set, Tuple
+
+
+_PATRON_SIMPLE = re.compile(r"^\\b(?:\((?P<alternativas>[^()]+)\)|(?P<literal>[^()]+))\\b$")
+_METACARACTERES = set(".^$*+?{}[]\\|()")
+
+
+def _es_palabra(c: str) -> bool:
+    return c.isalnum() or c == "_"
+
+
+def literales_de_patron(patron: str) -> Optional[List[str]]:
+    """
+    Convierte patrones sencillos del estilo r"\\bwifi\\b" o
+    r"\\b(a qué hora|a que hora)\\b" en su lista de literales.
+    Devuelve None si el patrón usa algo más (se evaluará como regex).
+    """
+    m = _PATRON_SIMPLE.match(patron)
+    if not m:
+        return None
+    cuerpo = m.group("alternativas") or m.group("literal")
+    literales = cuerpo.split("|")
+    for lit in literales:
+        if not lit or any(c in _METACARACTERES for c in lit):
+            return None
+        if not (_es_palabra(lit[0]) and _es_palabra(lit[-1])):
+            return None
+    return literales
+
+
+def _regex_trie(terminos: List[str]) -> str:
+    """
+    Construye una alternancia en forma de trie (prefijos comunes
+    compartidos). Los opcionales son voraces, así que en cada posición
+    la regex devuelve el término más largo que empieza ahí.
+    """
+    raiz: Dict = {}
+    for t in terminos:
+        nodo = raiz
+        for c in t:
+            nodo = nodo.setdefault(c, {})
+        nodo[""] = {}
+
+    def _a_regex(nodo: Dict) -> str:
+        fin = "" in nodo
+        ramas = [re.escape(c) + _a_regex(hijo) for c, hijo in sorted(nodo.items()) if c]
+        if not ramas:
+            return ""
+        if len(ramas) == 1 and not fin:
+            return ramas[0]
+        alternancia = "(?:" + "|".join(ramas) + ")"
+        return alternancia + "?" if fin else alternancia
+
+    return _a_regex(raiz)
+
+
+class MotorCoincidencias:
+    """
+    Conjunto de términos etiquetados que se buscan a la vez.
+
+    - agregar_termino(): literal que puede aparecer como subcadena o como
+      palabra completa (equivalente a r"\\b...\\b").
+    - agregar_patron(): patrón regex; si es un caso sencillo se convierte
+      a literales y entra en la pasada única, si no se guarda aparte.
+
+    analizar() recorre el texto una vez con una regex-trie precompilada y
+    devuelve el conjunto de etiquetas encontradas.
+    """
+
+    def __init__(self) -> None:
+        self._terminos: Dict[str, List[Tuple[str, bool]]] = {}
+        self._regex_aparte: List[Tuple[Pattern, str]] = []
+        self._regex: Optional[Pattern] = None
+        self._prefijos: Dict[str, List[str]] = {}
+
+    def agregar_termino(self, termino: str, etiqueta: str, palabra_completa: bool = False) -> None:
+        self._terminos.setdefault(termino, []).append((etiqueta, palabra_completa))
+        self._regex = None
+
+    def agregar_patron(self, patron: str, etiqueta: str) -> None:
+        literales = literales_de_patron(patron)
+        if literales is None:
+            self._regex_aparte.append((re.compile(patron), etiqueta))
+            return
+        for lit in literales:
+            self.agregar_termino(lit, etiqueta, palabra_completa=True)
+
+    def compilar(self) -> None:
+        terminos = sorted(self._terminos)
+        # El término más largo en una posición "cubre" a sus prefijos: se
+        # precalcula qué otros términos empiezan en ese mismo punto.
+        self._prefijos = {
+            t: [t[:k] for k in range(1, len(t) + 1) if t[:k] in self._terminos]
+            for t in terminos
+        }
+        patron = _regex_trie(terminos) if terminos else "(?!)"
+        self._regex = re.compile(f"(?=({patron}))")
+
+    def analizar(self, texto: str) -> FrozenSet[str]:
+        if self._regex is None:
+            self.compilar()
+
+        encontradas: Set[str] = set()
+        n = len(texto)
+        for m in self._regex.finditer(texto):  # type: ignore[union-attr]
+            inicio = m.start()
+            antes_ok = inicio == 0 or not _es_palabra(texto[inicio - 1])
+            for termino in self._prefijos[m.group(1)]:
+                fin = inicio + len(termino)
+                for etiqueta, palabra_completa in self._terminos[termino]:
+                    if etiqueta in encontradas:
+                        continue
+                    if palabra_completa and not (
+                        antes_ok and (fin == n or not _es_palabra(texto[fin]))
+                    ):
+                        continue
+                    encontradas.add(etiqueta)
+
+        for regex, etiqueta in self._regex_aparte:
+            if etiqueta not in encontradas and regex.search(texto):
+                encontradas.add(etiqueta)
+
+        return frozenset(encontradas)
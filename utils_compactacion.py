@@ -0,0 +1,340 @@
+# ---------------------------------------------------------
+# Autor: Raúl Cid González
+# Compactación de log_chat.csv en Parquet particionado por día
+# (columnas categóricas) y consultas que leen solo las
+# particiones y columnas necesarias
+# ---------------------------------------------------------
+
+from __future__ import annotations
+
+import csv
+import io
+import json
+import os
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import pandas as pd
+
+from utils_csv import ultimo_fin_de_registro
+
+
+ARCHIVO_ESTADO = "_estado.json"
+ARCHIVO_CONSOLIDADO = "datos.parquet"
+CATEGORICAS = ("tipo_detectado", "prioridad")
+TAM_LECTURA = 32 * 1024 * 1024   # bytes de CSV que se procesan de cada vez
+TAM_FIRMA = 64
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError(
+            "La compactación de logs necesita pyarrow: pip install pyarrow"
+        ) from e
+    return pa, ds, pq
+
+
+def _esquema():
+    pa, _, _ = _pyarrow()
+    categoria = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ("timestamp", pa.timestamp("s")),
+        ("texto_usuario", pa.string()),
+        ("tipo_detectado", categoria),
+        ("prioridad", categoria),
+        ("confianza_top", pa.float32()),
+        ("respuesta_resumen", pa.string()),
+    ])
+
+
+def _nombre_particion(dia: Union[date, str]) -> str:
+    return f"fecha={dia}"
+
+
+# ---------- 1. Compactación ----------
+
+class CompactadorLogs:
+    """
+    Pasa las filas nuevas de `ruta_log` (y de sus archivos rotados,
+    "<nombre>-<fecha>.csv") a `directorio/fecha=AAAA-MM-DD/*.parquet`.
+
+    - Lo ya compactado se recuerda por inodo y desplazamiento en bytes,
+      así que al rotar (os.replace conserva el inodo) no se relee nada y
+      lo que faltaba del archivo rotado se recoge igual. Unos bytes de
+      firma antes del desplazamiento detectan si un inodo se reutilizó.
+    - Cada tanda escribe una parte por día, con nombre
+      "parte-<inodo>-<desplazamiento>": si el proceso cae antes de
+      guardar el estado, la siguiente pasada la reescribe en vez de
+      duplicarla.
+    - Los días ya cerrados se consolidan en un único datos.parquet
+      (ordenado por timestamp) para no acumular archivos pequeños.
+    """
+
+    def __init__(self, ruta_log: Union[str, Path], directorio: Union[str, Path]) -> None:
+        self.ruta_log = Path(ruta_log)
+        self.directorio = Path(directorio)
+        self._ruta_estado = self.directorio / ARCHIVO_ESTADO
+
+    # ---------- Estado ----------
+
+    def _cargar_estado(self) -> Dict[str, Dict]:
+        try:
+            return json.loads(self._ruta_estado.read_text(encoding="utf-8"))["archivos"]
+        except (OSError, ValueError, KeyError):
+            return {}
+
+    def _guardar_estado(self, archivos: Dict[str, Dict]) -> None:
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        tmp = self._ruta_estado.with_name(self._ruta_estado.name + ".tmp")
+        tmp.write_text(json.dumps({"archivos": archivos}, ensure_ascii=False, indent=1), encoding="utf-8")
+        os.replace(tmp, self._ruta_estado)
+
+    def fuentes(self) -> List[Path]:
+        """Archivos rotados (de más antiguo a más reciente) y el actual."""
+        rotados = sorted(self.ruta_log.parent.glob(f"{self.ruta_log.stem}-*{self.ruta_log.suffix}"))
+        return rotados + ([self.ruta_log] if self.ruta_log.exists() else [])
+
+    # ---------- Lectura ----------
+
+    @staticmethod
+    def _cabecera(f) -> Tuple[List[str], int]:
+        f.seek(0)
+        linea = f.readline()
+        cabecera = next(csv.reader([linea.decode("utf-8-sig")]), [])
+        return [c.strip() for c in cabecera], len(linea)
+
+    def _leer_nuevas(self, ruta: Path, info: Dict) -> Iterable[Tuple[int, pd.DataFrame]]:
+        """(desplazamiento inicial, filas) por cada bloque nuevo; actualiza `info`."""
+        with open(ruta, "rb") as f:
+            tam = os.fstat(f.fileno()).st_size
+            if info.get("desplazamiento", 0) > tam:
+                info.clear()
+            if info.get("desplazamiento"):
+                firma = bytes.fromhex(info.get("firma", ""))
+                f.seek(info["desplazamiento"] - len(firma))
+                if f.read(len(firma)) != firma:
+                    info.clear()
+            if not info.get("desplazamiento"):
+                cabecera, fin_cabecera = self._cabecera(f)
+                if not cabecera:
+                    return
+                info.update(cabecera=cabecera, desplazamiento=fin_cabecera, firma="")
+
+            while info["desplazamiento"] < tam:
+                inicio = info["desplazamiento"]
+                f.seek(inicio)
+                datos = f.read(min(TAM_LECTURA, tam - inicio))
+                fin = ultimo_fin_de_registro(datos)
+                if fin == 0:
+                    return  # registro a medio escribir: en la próxima pasada
+                n = len(info["cabecera"])
+                filas = [
+                    (fila + [""] * n)[:n]
+                    for fila in csv.reader(io.StringIO(datos[:fin].decode("utf-8"), newline=""))
+                    if fila
+                ]
+                info["desplazamiento"] = inicio + fin
+                info["firma"] = datos[max(0, fin - TAM_FIRMA):fin].hex()
+                if filas:
+                    yield inicio, pd.DataFrame(filas, columns=info["cabecera"])
+
+    @staticmethod
+    def _normalizar(df: pd.DataFrame) -> pd.DataFrame:
+        salida = pd.DataFrame({
+            "timestamp": pd.to_datetime(df.get("timestamp"), errors="coerce", format="ISO8601"),
+            "texto_usuario": df.get("texto_usuario", ""),
+            "tipo_detectado": df.get("tipo_detectado", ""),
+            "prioridad": df.get("prioridad", ""),
+            "confianza_top": pd.to_numeric(df.get("confianza_top"), errors="coerce").astype("float32"),
+            "respuesta_resumen": df.get("respuesta_resumen", ""),
+        })
+        salida = salida.dropna(subset=["timestamp"])
+        for c in CATEGORICAS:
+            salida[c] = salida[c].astype("category")
+        return salida
+
+    # ---------- Escritura ----------
+
+    def _escribir_partes(self, df: pd.DataFrame, etiqueta: str) -> List[str]:
+        pa, _, pq = _pyarrow()
+        esquema = _esquema()
+        dias = []
+        for dia, grupo in df.groupby(df["timestamp"].dt.date, sort=True):
+            carpeta = self.directorio / _nombre_particion(dia)
+            carpeta.mkdir(parents=True, exist_ok=True)
+            destino = carpeta / f"parte-{etiqueta}.parquet"
+            tmp = destino.with_name(destino.name + ".tmp")
+            pq.write_table(pa.Table.from_pandas(grupo, schema=esquema, preserve_index=False), tmp, compression="zstd")
+            os.replace(tmp, destino)
+            dias.append(str(dia))
+        return dias
+
+    def compactar(self, consolidar: bool = True) -> Dict[str, int]:
+        """Una pasada: filas nuevas a Parquet, estado y consolidación de días cerrados."""
+        _pyarrow()
+        estado = self._cargar_estado()
+        vistos: Dict[str, Dict] = {}
+        filas = 0
+        dias = set()
+
+        for ruta in self.fuentes():
+            try:
+                st = os.stat(ruta)
+            except OSError:
+                continue
+            clave = f"{st.st_dev}:{st.st_ino}"
+            info = dict(estado.get(clave, {}))
+            if info.get("desplazamiento") == st.st_size:
+                vistos[clave] = info
+                continue
+            for inicio, bloque in self._leer_nuevas(ruta, info):
+                bloque = self._normalizar(bloque)
+                if len(bloque):
+                    dias.update(self._escribir_partes(bloque, f"{st.st_ino}-{inicio}"))
+                    filas += len(bloque)
+            vistos[clave] = info
+
+        # los inodos que ya no existen (rotados y borrados) se olvidan
+        self._guardar_estado(vistos)
+        consolidados = self.consolidar() if consolidar else 0
+        return {"filas": filas, "particiones": len(dias), "consolidadas": consolidados}
+
+    def consolidar(self, antes_de: Optional[date] = None) -> int:
+        """
+        Junta las partes de cada día anterior a `antes_de` (hoy por
+        defecto) en datos.parquet. El consolidado guarda en sus metadatos
+        qué partes contiene: si se cae a mitad, las que ya estén dentro
+        solo se borran.
+        """
+        pa, _, pq = _pyarrow()
+        antes_de = antes_de or date.today()
+        hechas = 0
+        for carpeta in sorted(self.directorio.glob("fecha=*")):
+            if carpeta.name[len("fecha="):] >= str(antes_de):
+                continue
+            partes = sorted(carpeta.glob("parte-*.parquet"))
+            if not partes:
+                continue
+            consolidado = carpeta / ARCHIVO_CONSOLIDADO
+            incluidas: List[str] = []
+            tablas = []
+            if consolidado.exists():
+                tabla = pq.read_table(consolidado)
+                incluidas = json.loads((tabla.schema.metadata or {}).get(b"partes", b"[]"))
+                tablas.append(tabla)
+            nuevas = [p for p in partes if p.name not in incluidas]
+            if nuevas:
+                tablas.extend(pq.read_table(p) for p in nuevas)
+                tabla = pa.concat_tables(tablas, promote_options="permissive").sort_by("timestamp").combine_chunks()
+                tabla = tabla.replace_schema_metadata(
+                    {"partes": json.dumps(incluidas + [p.name for p in nuevas])}
+                )
+                tmp = consolidado.with_name(consolidado.name + ".tmp")
+                pq.write_table(tabla, tmp, compression="zstd")
+                os.replace(tmp, consolidado)
+                hechas += 1
+            for p in partes:
+                p.unlink()
+        return hechas
+
+
+# ---------- 2. Consultas ----------
+
+def particiones(directorio: Union[str, Path], desde: date, hasta: date) -> List[Path]:
+    """Carpetas de día entre `desde` y `hasta` (ambos incluidos) que existen."""
+    directorio = Path(directorio)
+    salida = []
+    dia = desde
+    while dia <= hasta:
+        carpeta = directorio / _nombre_particion(dia)
+        if carpeta.is_dir():
+            salida.append(carpeta)
+        dia += timedelta(days=1)
+    return salida
+
+
+def leer_logs(
+    directorio: Union[str, Path],
+    desde: datetime,
+    hasta: datetime,
+    columnas: Sequence[str] = ("timestamp", "tipo_detectado", "prioridad"),
+    tipos: Optional[Sequence[str]] = None,
+    prioridades: Optional[Sequence[str]] = None,
+) -> pd.DataFrame:
+    """
+    Filas con `desde <= timestamp < hasta`. Solo se abren las particiones
+    de esos días y solo se leen `columnas`; los filtros se aplican al
+    leer cada grupo de filas.
+    """
+    pa, ds, _ = _pyarrow()
+    archivos = [str(a) for c in particiones(directorio, desde.date(), hasta.date()) for a in sorted(c.glob("*.parquet"))]
+    if not archivos:
+        return pd.DataFrame({c: pd.Series(dtype="category" if c in CATEGORICAS else "object") for c in columnas})
+
+    filtro = (ds.field("timestamp") >= pa.scalar(desde, pa.timestamp("s"))) & \
+             (ds.field("timestamp") < pa.scalar(hasta, pa.timestamp("s")))
+    if tipos:
+        filtro &= ds.field("tipo_detectado").cast(pa.string()).isin(list(tipos))
+    if prioridades:
+        filtro &= ds.field("prioridad").cast(pa.string()).isin(list(prioridades))
+
+    dataset = ds.dataset(archivos, format="parquet", schema=_esquema())
+    return dataset.to_table(columns=list(columnas), filter=filtro).to_pandas()
+
+
+def contar_por_periodo(
+    directorio: Union[str, Path],
+    desde: datetime,
+    hasta: datetime,
+    frecuencia: str = "h",
+    por: str = "tipo_detectado",
+    tipos: Optional[Sequence[str]] = None,
+    prioridades: Optional[Sequence[str]] = None,
+) -> pd.DataFrame:
+    """Mensajes por periodo (`frecuencia` de pandas: "h", "D"...) y valor de `por`."""
+    df = leer_logs(directorio, desde, hasta, ("timestamp", por), tipos, prioridades)
+    if df.empty:
+        return pd.DataFrame()
+    return (
+        df.groupby([df["timestamp"].dt.floor(frecuencia), por], observed=True)
+        .size()
+        .unstack(por, fill_value=0)
+        .rename_axis(index="periodo", columns=None)
+    )
+
+
+def resumen_por_categoria(
+    directorio: Union[str, Path],
+    desde: datetime,
+    hasta: datetime,
+    tipos: Optional[Sequence[str]] = None,
+    prioridades: Optional[Sequence[str]] = None,
+) -> pd.DataFrame:
+    """Por tipo y prioridad: número de mensajes y confianza media."""
+    df = leer_logs(directorio, desde, hasta, ("tipo_detectado", "prioridad", "confianza_top"), tipos, prioridades)
+    if df.empty:
+        return pd.DataFrame(columns=["mensajes", "confianza_media"])
+    return (
+        df.groupby(["tipo_detectado", "prioridad"], observed=True)
+        .agg(mensajes=("confianza_top", "size"), confianza_media=("confianza_top", "mean"))
+        .sort_values("mensajes", ascending=False)
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compacta log_chat.csv en Parquet particionado por día.")
+    parser.add_argument("log", nargs="?", default="log_chat.csv")
+    parser.add_argument("destino", nargs="?", default="logs_columnar")
+    parser.add_argument("--sin-consolidar", action="store_true", help="No juntar las partes de días cerrados.")
+    args = parser.parse_args()
+
+    resultado = CompactadorLogs(args.log, args.destino).compactar(consolidar=not args.sin_consolidar)
+    print(f"✅ {resultado['filas']} filas nuevas en {resultado['particiones']} particiones "
+          f"({resultado['consolidadas']} días consolidados).")
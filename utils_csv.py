@@ -0,0 +1,239 @@
+# ---------------------------------------------------------
+# Autor: Raúl Cid González
+# Lectura incremental de CSV que solo crecen por el final
+# (log_chat.csv, feedback_chat.csv): filas nuevas y cola (tail)
+# ---------------------------------------------------------
+
+from __future__ import annotations
+
+import csv
+import io
+import os
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+
+def ultimo_fin_de_registro(datos: bytes) -> int:
+    """
+    Posición justo después del último salto de línea que cierra un
+    registro completo. Un salto dentro de un campo entrecomillado no
+    cuenta: solo valen los que tienen un número par de comillas antes.
+    Devuelve 0 si no hay ningún registro completo.
+    """
+    fin = 0
+    dentro = False
+    i = 0
+    n = len(datos)
+    while i < n:
+        j_comilla = datos.find(b'"', i)
+        j_salto = datos.find(b"\n", i)
+        if j_salto == -1:
+            break
+        if j_comilla != -1 and j_comilla < j_salto:
+            dentro = not dentro
+            i = j_comilla + 1
+            continue
+        if not dentro:
+            fin = j_salto + 1
+        i = j_salto + 1
+    return fin
+
+
+class SeguidorCSV:
+    """
+    Devuelve solo las filas añadidas desde la última llamada.
+
+    Guarda el desplazamiento en bytes y unos bytes de "firma" justo antes
+    de él. Si el archivo encoge o la firma ya no coincide (se reescribió
+    o se rotó), nuevas_filas() empieza de cero y marca `reiniciado` para
+    que quien lo use pueda reconstruir su estado.
+    """
+
+    TAM_FIRMA = 64
+
+    def __init__(self, ruta: Union[str, Path]) -> None:
+        self.ruta = Path(ruta)
+        self.desplazamiento = 0
+        self.cabecera: Optional[List[str]] = None
+        self.reiniciado = False
+        self._firma = b""
+
+    def _reiniciar(self) -> None:
+        self.desplazamiento = 0
+        self.cabecera = None
+        self._firma = b""
+        self.reiniciado = True
+
+    def nuevas_filas(self) -> List[Dict[str, str]]:
+        self.reiniciado = False
+        try:
+            tam = os.path.getsize(self.ruta)
+        except OSError:
+            if self.desplazamiento:
+                self._reiniciar()
+            return []
+
+        if tam < self.desplazamiento:
+            self._reiniciar()
+        if tam == self.desplazamiento:
+            return []
+
+        with open(self.ruta, "rb") as f:
+            if self.desplazamiento:
+                f.seek(self.desplazamiento - len(self._firma))
+                if f.read(len(self._firma)) != self._firma:
+                    self._reiniciar()
+                    f.seek(0)
+            datos = f.read(tam - self.desplazamiento)
+
+        fin = ultimo_fin_de_registro(datos)
+        if fin == 0:
+            return []
+
+        bloque = datos[:fin]
+        self.desplazamiento += fin
+        self._firma = bloque[-self.TAM_FIRMA:] if len(bloque) >= self.TAM_FIRMA else (self._firma + bloque)[-self.TAM_FIRMA:]
+
+        lector = csv.reader(io.StringIO(bloque.decode("utf-8-sig" if self.cabecera is None else "utf-8"), newline=""))
+        filas = list(lector)
+        if self.cabecera is None:
+            if not filas:
+                return []
+            self.cabecera = [c.strip() for c in filas[0]]
+            filas = filas[1:]
+
+        return [dict(zip(self.cabecera, fila)) for fila in filas if fila]
+
+
+def _fin_primer_registro(f) -> int:
+    """Posición justo después del primer registro (la cabecera)."""
+    f.seek(0)
+    dentro = False
+    pos = 0
+    while True:
+        bloque = f.read(64 * 1024)
+        if not bloque:
+            return pos
+        for i, b in enumerate(bloque):
+            if b == 0x22:  # comilla
+                dentro = not dentro
+            elif b == 0x0A and not dentro:  # salto de línea
+                return pos + i + 1
+        pos += len(bloque)
+
+
+def _inicio_ultimos_registros(f, tam: int, n: int, tam_bloque: int = 64 * 1024) -> int:
+    """
+    Posición donde empiezan los últimos `n` registros, leyendo el archivo
+    desde el final por bloques. Un salto de línea es frontera de registro
+    si detrás de él (hasta el final) hay un número par de comillas, lo que
+    respeta los campos entrecomillados con saltos de línea dentro.
+    Devuelve 0 si el archivo tiene n registros o menos.
+    """
+    fronteras = 0
+    comillas = 0
+    pos = tam
+    # Hacen falta n + 1 saltos: el que cierra el último registro completo
+    # (si el final no acaba en salto, es un registro a medio escribir y se
+    # ignora) y los n que separan hacia atrás.
+    objetivo = n + 1
+
+    while pos > 0:
+        inicio = max(0, pos - tam_bloque)
+        f.seek(inicio)
+        bloque = f.read(pos - inicio)
+        i = len(bloque)
+        while i > 0:
+            j_salto = bloque.rfind(b"\n", 0, i)
+            comillas += bloque.count(b'"', j_salto + 1, i)
+            if j_salto == -1:
+                break
+            if comillas % 2 == 0:
+                fronteras += 1
+                if fronteras == objetivo:
+                    return inicio + j_salto + 1
+            i = j_salto
+        pos = inicio
+    return 0
+
+
+class ColaCSV:
+    """
+    Últimos `n` registros de un CSV que solo crece por el final, sin leer
+    el archivo entero.
+
+    - La primera vez busca desde el final solo los bytes necesarios.
+    - Si el archivo no ha cambiado (tamaño y mtime), devuelve lo cacheado.
+    - Si ha crecido, lee solo los bytes nuevos (con un SeguidorCSV).
+    - Si ha encogido o se ha reescrito/rotado, vuelve a leer la cola.
+    """
+
+    def __init__(self, ruta: Union[str, Path], n: int = 50) -> None:
+        self.ruta = Path(ruta)
+        self.n = n
+        self.cabecera: List[str] = []
+        self._filas: "deque[Dict[str, str]]" = deque(maxlen=n)
+        self._seguidor: Optional[SeguidorCSV] = None
+        self._estado: Optional[tuple] = None
+
+    def _leer_cola(self, tam: int) -> None:
+        self._filas.clear()
+        with open(self.ruta, "rb") as f:
+            fin_cabecera = _fin_primer_registro(f)
+            f.seek(0)
+            primera = f.read(fin_cabecera).decode("utf-8-sig")
+            self.cabecera = [c.strip() for c in next(csv.reader(io.StringIO(primera, newline="")), [])]
+            inicio = max(fin_cabecera, _inicio_ultimos_registros(f, tam, self.n))
+
+        # El resto (desde `inicio`) lo lee el seguidor como si fuera nuevo
+        seguidor = SeguidorCSV(self.ruta)
+        seguidor.cabecera = self.cabecera
+        seguidor.desplazamiento = inicio
+        with open(self.ruta, "rb") as f:
+            f.seek(max(0, inicio - SeguidorCSV.TAM_FIRMA))
+            seguidor._firma = f.read(inicio - max(0, inicio - SeguidorCSV.TAM_FIRMA))
+        self._seguidor = seguidor
+        self._filas.extend(seguidor.nuevas_filas())
+
+    def filas(self) -> Tuple[List[str], List[Dict[str, str]]]:
+        """(cabecera, últimos n registros como dict)."""
+        try:
+            st = os.stat(self.ruta)
+        except OSError:
+            self._estado, self._seguidor = None, None
+            self.cabecera = []
+            self._filas.clear()
+            return [], []
+
+        estado = (st.st_size, st.st_mtime_ns, st.st_ino)
+        if estado != self._estado:
+            if self._seguidor is None or self._estado is None or st.st_ino != self._estado[2] or st.st_size < self._estado[0]:
+                self._leer_cola(st.st_size)
+            else:
+                nuevas = self._seguidor.nuevas_filas()
+                if self._seguidor.reiniciado:
+                    self._leer_cola(st.st_size)
+                else:
+                    self._filas.extend(nuevas)
+            self._estado = estado
+
+        return self.cabecera, list(self._filas)
+
+
+_colas: Dict[Tuple[str, int], ColaCSV] = {}
+_colas_lock = threading.Lock()
+
+
+def ultimas_filas(ruta: Union[str, Path], n: int = 50) -> Tuple[List[str], List[Dict[str, str]]]:
+    """
+    Atajo con caché por (ruta, n) compartida por todo el proceso: en
+    Streamlit cada rerun solo paga los bytes añadidos desde el anterior.
+    """
+    clave = (str(Path(ruta).resolve()), n)
+    with _colas_lock:
+        cola = _colas.get(clave)
+        if cola is None:
+            cola = _colas[clave] = ColaCSV(ruta, n)
+        return cola.filas()
@@ -0,0 +1,381 @@
+# ---------------------------------------------------------
+# Autor: Raúl Cid González
+# Evaluación por bloques para datasets grandes: lectura en
+# trozos, resultados escritos sobre la marcha, reanudación y
+# reparto entre varios procesos
+# ---------------------------------------------------------
+
+from __future__ import annotations
+
+import json
+import multiprocessing
+import os
+import sys
+import time
+from contextlib import closing
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from utils_analisis import CapturaPorBloques, matriz_puntuaciones
+
+
+# clasificar_lote(textos) -> [(prediccion, scores, prioridad, confianza), ...]
+ClasificarLote = Callable[[List[str]], List[Tuple[str, Dict[str, float], str, float]]]
+
+
+def contar_registros(ruta: Union[str, Path], tam_bloque: int = 1 << 20) -> int:
+    """
+    Número de filas de datos sin parsear el CSV: saltos de línea fuera de
+    comillas (paridad de comillas acumulada), menos la cabecera.
+    """
+    n = 0
+    dentro = 0
+    ultimo = b"\n"
+    with open(ruta, "rb") as f:
+        while True:
+            bloque = f.read(tam_bloque)
+            if not bloque:
+                break
+            datos = np.frombuffer(bloque, dtype=np.uint8)
+            paridad = (np.cumsum(datos == 0x22, dtype=np.uint8) + dentro) % 2  # solo importa la paridad
+            n += int(np.count_nonzero((datos == 0x0A) & (paridad == 0)))
+            dentro = int(paridad[-1])
+            ultimo = bloque[-1:]
+    if ultimo != b"\n":
+        n += 1
+    return max(0, n - 1)
+
+
+def evaluar_bloque(
+    df: pd.DataFrame,
+    clasificar_lote: ClasificarLote,
+    etiquetas: Optional[List[str]] = None,
+) -> Tuple[pd.DataFrame, int, Optional[Tuple[np.ndarray, np.ndarray]]]:
+    """
+    Clasifica un trozo del dataset: devuelve el trozo con las columnas de
+    resultado, los aciertos y, si se pasan `etiquetas`, su matriz de
+    puntuaciones (ver utils_analisis.matriz_puntuaciones).
+    """
+    textos = df["texto"].astype(str).tolist()
+    esperados = df["tipo_esperado"].astype(str).tolist()
+    resultados = clasificar_lote(textos)
+
+    df = df.copy()
+    df["prediccion"] = [r[0] for r in resultados]
+    df["prioridad"] = [r[2] for r in resultados]
+    df["confianza_top"] = [r[3] for r in resultados]
+    aciertos = sum(pred == esperado for pred, esperado in zip(df["prediccion"], esperados))
+    puntuaciones = matriz_puntuaciones(resultados, etiquetas) if etiquetas is not None else None
+    return df, aciertos, puntuaciones
+
+
+class PuntoControl:
+    """
+    Estado de una evaluación a medias, en un JSON junto al archivo de
+    salida: filas ya procesadas, aciertos, tamaño de la salida en ese
+    momento y la firma del CSV de entrada (tamaño + mtime) para no
+    reanudar sobre un dataset que ha cambiado.
+    """
+
+    def __init__(self, ruta: Union[str, Path]) -> None:
+        self.ruta = Path(ruta)
+
+    def leer(self) -> Optional[Dict]:
+        try:
+            return json.loads(self.ruta.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def guardar(self, estado: Dict) -> None:
+        # Escritura atómica: un corte a mitad nunca deja un JSON roto
+        tmp = self.ruta.with_name(self.ruta.name + ".tmp")
+        tmp.write_text(json.dumps(estado), encoding="utf-8")
+        os.replace(tmp, self.ruta)
+
+    def borrar(self) -> None:
+        try:
+            self.ruta.unlink()
+        except OSError:
+            pass
+
+
+# ---------- Reparto entre procesos ----------
+
+_clasificar_trabajador: Optional[ClasificarLote] = None
+_etiquetas_trabajador: Optional[List[str]] = None
+
+
+def hilos_por_proceso(n_procesos: int, nucleos: Optional[int] = None) -> int:
+    """Hilos intra-op para cada proceso, de modo que el total no pase de los núcleos."""
+    return max(1, (nucleos or os.cpu_count() or 1) // max(1, n_procesos))
+
+
+def _iniciar_trabajador(clasificar_lote: ClasificarLote, hilos: int,
+                        preparar: Optional[Callable[[], None]], etiquetas: Optional[List[str]]) -> None:
+    # Antes de importar torch: las librerías BLAS/OpenMP leen esto al cargar
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(hilos)
+    try:
+        import torch
+
+        torch.set_num_threads(hilos)
+        torch.set_num_interop_threads(1)
+    except (ImportError, RuntimeError):
+        pass
+
+    global _clasificar_trabajador, _etiquetas_trabajador
+    _clasificar_trabajador = clasificar_lote
+    _etiquetas_trabajador = etiquetas
+    if preparar is not None:
+        preparar()  # p. ej. cargar el modelo una sola vez por proceso
+
+
+def _evaluar_en_trabajador(df: pd.DataFrame) -> Tuple[pd.DataFrame, int, Optional[Tuple[np.ndarray, np.ndarray]], int, float]:
+    inicio = time.perf_counter()
+    resultado, aciertos, puntuaciones = evaluar_bloque(df, _clasificar_trabajador, _etiquetas_trabajador)  # type: ignore[arg-type]
+    return resultado, aciertos, puntuaciones, os.getpid(), time.perf_counter() - inicio
+
+
+def _en_orden_paralelo(
+    bloques: Iterable[pd.DataFrame],
+    clasificar_lote: ClasificarLote,
+    n_procesos: int,
+    hilos: int,
+    preparar: Optional[Callable[[], None]],
+    por_trabajador: Dict[int, List[float]],
+    etiquetas: Optional[List[str]] = None,
+) -> Iterator[Tuple[pd.DataFrame, int, Optional[Tuple[np.ndarray, np.ndarray]]]]:
+    """
+    Reparte los trozos entre `n_procesos` procesos y los devuelve en el
+    orden original. Como mucho hay 2 trozos por proceso en vuelo, para
+    que la memoria no dependa del tamaño del dataset.
+    """
+    contexto = multiprocessing.get_context("spawn")  # fork + hilos de torch = bloqueos
+    with ProcessPoolExecutor(
+        max_workers=n_procesos,
+        mp_context=contexto,
+        initializer=_iniciar_trabajador,
+        initargs=(clasificar_lote, hilos, preparar, etiquetas),
+    ) as pool:
+        en_vuelo: Dict[Future, int] = {}
+        listos: Dict[int, Tuple[pd.DataFrame, int, Optional[Tuple[np.ndarray, np.ndarray]]]] = {}
+        siguiente = 0
+        enviados = 0
+        iterador = iter(bloques)
+        agotado = False
+
+        while not agotado or en_vuelo:
+            while not agotado and len(en_vuelo) < 2 * n_procesos:
+                try:
+                    bloque = next(iterador)
+                except StopIteration:
+                    agotado = True
+                    break
+                en_vuelo[pool.submit(_evaluar_en_trabajador, bloque)] = enviados
+                enviados += 1
+
+            if not en_vuelo:
+                break
+            hechos, _ = wait(en_vuelo, return_when=FIRST_COMPLETED)
+            for futuro in hechos:
+                indice = en_vuelo.pop(futuro)
+                resultado, aciertos, puntuaciones, pid, segundos = futuro.result()
+                cuenta = por_trabajador.setdefault(pid, [0, 0.0])
+                cuenta[0] += len(resultado)
+                cuenta[1] += segundos
+                listos[indice] = (resultado, aciertos, puntuaciones)
+
+            while siguiente in listos:
+                yield listos.pop(siguiente)
+                siguiente += 1
+
+
+# ---------- Utilidades ----------
+
+def _miles(n: int) -> str:
+    return f"{n:,}".replace(",", ".")
+
+
+def _firma_entrada(ruta: Path) -> List:
+    st = os.stat(ruta)
+    return [str(ruta.resolve()), st.st_size, st.st_mtime_ns]
+
+
+class Progreso:
+    """Informe silencioso: una línea cada `cada_s` segundos en vez de una por fila."""
+
+    def __init__(self, total: int, inicial: int = 0, cada_s: float = 5.0, salida=sys.stdout) -> None:
+        self.total = total
+        self.inicial = inicial
+        self.cada_s = cada_s
+        self.salida = salida
+        self.inicio = time.perf_counter()
+        self._ultimo = float("-inf")
+
+    def filas_por_s(self, hechas: int) -> float:
+        segundos = time.perf_counter() - self.inicio
+        return (hechas - self.inicial) / segundos if segundos > 0 else 0.0
+
+    def informar(self, hechas: int, aciertos: int, final: bool = False) -> None:
+        ahora = time.perf_counter()
+        if self.salida is None or (not final and ahora - self._ultimo < self.cada_s):
+            return
+        self._ultimo = ahora
+        ritmo = self.filas_por_s(hechas)
+        precision = aciertos / hechas if hechas else 0.0
+        linea = f"  {_miles(hechas)}/{_miles(self.total)} filas · {ritmo:.0f} filas/s · precisión {precision:.2%}"
+        if not final and ritmo > 0 and self.total > hechas:
+            linea += f" · quedan ~{(self.total - hechas) / ritmo / 60:.1f} min"
+        print(linea, file=self.salida, flush=True)
+
+
+def evaluar_en_streaming(
+    ruta_csv: Union[str, Path],
+    ruta_salida: Union[str, Path],
+    clasificar_lote: ClasificarLote,
+    tam_bloque: int = 1000,
+    reanudar: bool = True,
+    informar_cada_s: float = 5.0,
+    salida=sys.stdout,
+    n_procesos: int = 1,
+    hilos: Optional[int] = None,
+    preparar_trabajador: Optional[Callable[[], None]] = None,
+    captura: Optional[CapturaPorBloques] = None,
+) -> Dict:
+    """
+    Evalúa `ruta_csv` (columnas texto, tipo_esperado) por trozos de
+    `tam_bloque` filas, con memoria constante sea cual sea su tamaño.
+
+    - Cada trozo se añade a `ruta_salida` en cuanto está clasificado.
+    - Tras cada trozo se guarda un punto de control
+      ("<ruta_salida>.checkpoint.json"). Si la ejecución se corta, la
+      siguiente (con reanudar=True) recorta la salida al último trozo
+      completo y sigue desde la fila siguiente.
+    - Al terminar se borra el punto de control.
+    - Con n_procesos > 1 los trozos se reparten entre procesos (spawn).
+      Cada uno recibe `hilos` hilos intra-op de torch (por defecto
+      núcleos / procesos), ejecuta `preparar_trabajador` una vez (cargar
+      el modelo) y clasifica sus trozos por su cuenta; los resultados se
+      escriben en el orden original. `clasificar_lote` y
+      `preparar_trabajador` deben poder serializarse (funciones de
+      módulo o functools.partial).
+    - Con `captura`, la matriz de puntuaciones de cada trozo se guarda
+      también (y se reanuda igual); al terminar queda en un único .npz.
+
+    Devuelve filas, aciertos, precisión, segundos, filas/s y, con varios
+    procesos, filas/s de cada uno ("por_trabajador").
+    """
+    ruta_csv, ruta_salida = Path(ruta_csv), Path(ruta_salida)
+    control = PuntoControl(ruta_salida.with_name(ruta_salida.name + ".checkpoint.json"))
+    firma = _firma_entrada(ruta_csv)
+
+    hechas, aciertos = 0, 0
+    estado = control.leer() if reanudar else None
+    if estado and estado.get("entrada") == firma and ruta_salida.exists():
+        hechas, aciertos = estado["filas"], estado["aciertos"]
+        # lo escrito después del último punto de control es un trozo a medias
+        os.truncate(ruta_salida, estado["bytes_salida"])
+        if salida is not None:
+            print(f"↩️ Reanudando desde la fila {_miles(hechas)}", file=salida)
+    else:
+        if estado and salida is not None:
+            print("⚠️ El dataset ha cambiado desde el punto de control: se empieza de cero.", file=salida)
+        ruta_salida.unlink(missing_ok=True)
+        hechas, aciertos = 0, 0
+
+    if captura is not None:
+        captura.preparar(desde_fila=hechas)
+    etiquetas = captura.etiquetas if captura is not None else None
+
+    progreso = Progreso(contar_registros(ruta_csv), inicial=hechas, cada_s=informar_cada_s, salida=salida)
+    inicio = time.perf_counter()
+    saltar = hechas
+
+    lector = pd.read_csv(
+        ruta_csv,
+        chunksize=tam_bloque,
+        # la fila 0 es la cabecera; las ya evaluadas se saltan sin guardarlas
+        skiprows=(lambda i: 0 < i <= saltar) if saltar else None,
+    )
+    por_trabajador: Dict[int, List[float]] = {}
+    if n_procesos > 1:
+        hilos = hilos or hilos_por_proceso(n_procesos)
+        resultados = _en_orden_paralelo(
+            lector, clasificar_lote, n_procesos, hilos, preparar_trabajador, por_trabajador, etiquetas
+        )
+    else:
+        resultados = (evaluar_bloque(bloque, clasificar_lote, etiquetas) for bloque in lector)
+
+    with lector, closing(resultados), open(ruta_salida, "a", encoding="utf-8", newline="") as f:
+        for resultado, aciertos_bloque, puntuaciones in resultados:
+            resultado.to_csv(f, header=f.tell() == 0, index=False, lineterminator="\n")
+            f.flush()
+            os.fsync(f.fileno())
+            if captura is not None:
+                captura.guardar_bloque(hechas, *puntuaciones, resultado["tipo_esperado"].astype(str).tolist())
+
+            hechas += len(resultado)
+            aciertos += aciertos_bloque
+            control.guardar({
+                "entrada": firma,
+                "filas": hechas,
+                "aciertos": aciertos,
+                "bytes_salida": f.tell(),
+            })
+            progreso.informar(hechas, aciertos)
+
+    progreso.total = hechas
+    progreso.informar(hechas, aciertos, final=True)
+    if captura is not None:
+        captura.cerrar()
+    control.borrar()
+
+    # filas/s de cada proceso mientras clasificaba (sin contar la espera)
+    trabajadores = {
+        pid: {"filas": int(filas), "filas_por_s": filas / seg if seg else 0.0}
+        for pid, (filas, seg) in sorted(por_trabajador.items())
+    }
+    if trabajadores and salida is not None:
+        print(f"  {n_procesos} procesos × {hilos} hilos:", file=salida)
+        for n, (pid, datos) in enumerate(trabajadores.items(), 1):
+            print(f"    trabajador {n} (pid {pid}): {_miles(datos['filas'])} filas · "
+                  f"{datos['filas_por_s']:.0f} filas/s", file=salida)
+
+    segundos = time.perf_counter() - inicio
+    return {
+        "filas": hechas,
+        "aciertos": aciertos,
+        "precision": aciertos / hechas if hechas else 0.0,
+        "segundos": segundos,
+        "filas_por_s": progreso.filas_por_s(hechas),
+        "reanudado_desde": saltar,
+        "procesos": n_procesos,
+        "hilos_por_proceso": hilos,
+        "por_trabajador": trabajadores,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Evaluación por bloques de un CSV de incidencias.")
+    parser.add_argument("csv", help="CSV con columnas texto y tipo_esperado.")
+    parser.add_argument("--salida", default="resultados_evaluacion.csv")
+    parser.add_argument("--bloque", type=int, default=1000, help="Filas por trozo.")
+    parser.add_argument("--sin-reanudar", action="store_true", help="Ignora el punto de control y empieza de cero.")
+    parser.add_argument("--procesos", type=int, default=1, help="Procesos en paralelo (cada uno con su modelo).")
+    parser.add_argument("--hilos", type=int, default=None, help="Hilos de torch por proceso (por defecto núcleos / procesos).")
+    args = parser.parse_args()
+
+    from Asistente_Nebrija import evaluar_sobre_csv_streaming
+
+    resumen = evaluar_sobre_csv_streaming(
+        args.csv, args.salida, tam_bloque=args.bloque, reanudar=not args.sin_reanudar,
+        n_procesos=args.procesos, hilos=args.hilos,
+    )
+    print(f"✅ {resumen['filas']} filas · precisión {resumen['precision']:.2%} · "
+          f"{resumen['filas_por_s']:.1f} filas/s → {args.salida}")
@@ -5,12 +5,18 @@
 
 from __future__ import annotations
 
+import csv
+import hashlib
+import sqlite3
+import threading
 from pathlib import Path
 from datetime import datetime
+from typing import Dict, List, Optional, Union
 import pandas as pd
 
 
 FEEDBACK_PATH = Path("feedback_chat.csv")
+FEEDBACK_DB_PATH = Path("feedback_chat.sqlite")
 
 
 def _normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
@@ -40,29 +46,282 @@ def ensure_feedback_csv_exists() -> None:
     pd.DataFrame(columns=cols).to_csv(FEEDBACK_PATH, index=False, encoding="utf-8")
 
 
-def build_question_id(texto_usuario: str) -> str:
+def resumir_respuesta(respuesta: str) -> str:
+    """Resumen de una línea que se guarda en respuesta_resumen."""
+    return str(respuesta or "").replace("\n", " ").strip()[:250]
+
+
+def build_question_id(texto_usuario: str, respuesta: str = "") -> str:
     """
-    Genera un id estable para una "pregunta".
+    Genera un id estable para una "pregunta" (y su respuesta, si se da).
+    Usa sha256 en vez de hash(): hash() cambia en cada proceso, y con él
+    el bloqueo de duplicados dejaba de funcionar tras un reinicio.
+    La respuesta entra ya resumida, así el id se puede recalcular desde
+    las columnas del CSV (texto_usuario + respuesta_resumen).
     """
-    return str(abs(hash(texto_usuario.strip())))
+    base = (texto_usuario or "").strip() + "||" + resumir_respuesta(respuesta)
+    return hashlib.sha256(base.encode("utf-8")).hexdigest()[:24]
 
 
-def feedback_already_exists(question_id: str) -> bool:
+def tramo_confianza(confianza: float) -> str:
+    """Tramo de 0.1 de ancho: 0.47 -> "0.4-0.5" (1.0 cae en "0.9-1.0")."""
+    i = min(max(int(float(confianza or 0.0) * 10), 0), 9)
+    return f"{i / 10:.1f}-{(i + 1) / 10:.1f}"
+
+
+COLUMNAS_ALMACEN = [
+    "question_id",
+    "timestamp",
+    "texto_usuario",
+    "tipo_detectado",
+    "prioridad",
+    "confianza_top",
+    "respuesta_resumen",
+    "feedback",
+]
+
+
+class AlmacenFeedback:
     """
-    Devuelve True si ya hay feedback registrado para ese question_id.
-    Esto bloquea duplicados incluso si se recarga la página.
+    Índice persistente del feedback en SQLite (modo WAL), con
+    question_id como clave primaria: comprobar un duplicado o insertar un
+    voto es una búsqueda por índice, sin leer ni reescribir el CSV.
+
+    La primera vez que se abre importa las filas de feedback_chat.csv
+    (recalculando su question_id con build_question_id) y calcula los
+    agregados contando todas sus filas, como compute_feedback_stats.
     """
-    if not FEEDBACK_PATH.exists():
-        return False
 
-    df = pd.read_csv(FEEDBACK_PATH)
-    df = _normalize_columns(df)
+    def __init__(
+        self,
+        ruta_db: Union[str, Path] = FEEDBACK_DB_PATH,
+        ruta_csv: Optional[Union[str, Path]] = FEEDBACK_PATH,
+    ) -> None:
+        self.ruta_db = Path(ruta_db)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.ruta_db), check_same_thread=False, timeout=5.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS feedback ("
+            "question_id TEXT PRIMARY KEY, timestamp TEXT, texto_usuario TEXT, "
+            "tipo_detectado TEXT, prioridad TEXT, confianza_top REAL, "
+            "respuesta_resumen TEXT, feedback TEXT)"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor TEXT)")
+        # Agregados que se actualizan en la misma transacción que cada voto
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS estadisticas ("
+            "dimension TEXT NOT NULL, clave TEXT NOT NULL, "
+            "si INTEGER NOT NULL DEFAULT 0, no INTEGER NOT NULL DEFAULT 0, "
+            "PRIMARY KEY (dimension, clave))"
+        )
+        self._db.commit()
 
-    if "question_id" not in df.columns:
-        # CSV antiguo: no podemos comprobar con id
-        return False
+        if ruta_csv is not None:
+            self._migrar_csv(Path(ruta_csv))
+
+    def _filas_csv(self, ruta_csv: Path) -> List[tuple]:
+        """Todas las filas del CSV (duplicados incluidos), con su question_id recalculado."""
+        filas: List[tuple] = []
+        if ruta_csv.exists() and ruta_csv.stat().st_size > 0:
+            with open(ruta_csv, "r", encoding="utf-8-sig", newline="") as f:
+                for fila in csv.DictReader(f):
+                    fila = {str(k).strip(): v for k, v in fila.items() if k is not None}
+                    texto = fila.get("texto_usuario", "") or ""
+                    resumen = fila.get("respuesta_resumen", "") or ""
+                    filas.append(self._tupla({
+                        **fila,
+                        "question_id": build_question_id(texto, resumen),
+                    }))
+        return filas
+
+    def _importar_csv(self, ruta_csv: Path) -> None:
+        """
+        Importa al índice las filas del CSV que falten y recalcula los
+        agregados contando el CSV entero. Las filas repetidas (mismo
+        question_id, de antes de que existiera el bloqueo de duplicados)
+        ocupan una sola entrada en el índice, pero sus votos se siguen
+        contando, igual que en compute_feedback_stats; cuántas hay se
+        guarda en meta ('duplicados_csv').
+        """
+        filas = self._filas_csv(ruta_csv)
+        duplicados = len(filas) - len({f[0] for f in filas})
+        with self._db:
+            self._db.executemany(
+                f"INSERT OR IGNORE INTO feedback ({', '.join(COLUMNAS_ALMACEN)}) "
+                f"VALUES ({', '.join('?' for _ in COLUMNAS_ALMACEN)})",
+                filas,
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO meta (clave, valor) VALUES (?, ?)",
+                [("migrado_csv", datetime.now().isoformat(timespec="seconds")),
+                 ("duplicados_csv", str(duplicados))],
+            )
+            self._recalcular_estadisticas(filas)
+
+    def _migrar_csv(self, ruta_csv: Path) -> None:
+        with self._lock:
+            hecho = self._db.execute(
+                "SELECT valor FROM meta WHERE clave = 'migrado_csv'"
+            ).fetchone()
+            if hecho is not None:
+                return
+            self._importar_csv(ruta_csv)
+
+    @staticmethod
+    def _tupla(fila: Dict) -> tuple:
+        try:
+            confianza = round(float(fila.get("confianza_top") or 0.0), 4)
+        except ValueError:
+            confianza = 0.0
+        return (
+            str(fila["question_id"]),
+            str(fila.get("timestamp", "") or ""),
+            str(fila.get("texto_usuario", "") or ""),
+            str(fila.get("tipo_detectado", "") or ""),
+            str(fila.get("prioridad", "") or ""),
+            confianza,
+            str(fila.get("respuesta_resumen", "") or ""),
+            str(fila.get("feedback", "") or "").strip().upper(),
+        )
+
+    def voto(self, question_id: str) -> Optional[str]:
+        """SI / NO si ya hay feedback para esa pregunta, None si no."""
+        with self._lock:
+            fila = self._db.execute(
+                "SELECT feedback FROM feedback WHERE question_id = ?", (str(question_id),)
+            ).fetchone()
+        return fila[0] if fila else None
+
+    def ya_registrado(self, question_id: str) -> bool:
+        return self.voto(question_id) is not None
+
+    def insertar(self, fila: Dict) -> bool:
+        """
+        Inserta la fila (debe traer question_id). Devuelve False si ya
+        existía feedback para esa pregunta.
+        """
+        with self._lock, self._db:
+            tupla = self._tupla(fila)
+            cur = self._db.execute(
+                f"INSERT OR IGNORE INTO feedback ({', '.join(COLUMNAS_ALMACEN)}) "
+                f"VALUES ({', '.join('?' for _ in COLUMNAS_ALMACEN)})",
+                tupla,
+            )
+            if cur.rowcount != 1:
+                return False
+            self._sumar_estadisticas(tupla)
+            return True
+
+    # ----- Estadísticas incrementales -----
+
+    @staticmethod
+    def _claves_estadisticas(tipo: str, prioridad: str, timestamp: str, confianza: float) -> list:
+        return [
+            ("total", ""),
+            ("tipo", tipo),
+            ("prioridad", prioridad),
+            ("dia", timestamp[:10]),
+            ("confianza", tramo_confianza(confianza)),
+        ]
+
+    def _sumar_estadisticas(self, tupla: tuple) -> None:
+        _, timestamp, _, tipo, prioridad, confianza, _, feedback = tupla
+        if feedback not in ("SI", "NO"):
+            return
+        si, no = (1, 0) if feedback == "SI" else (0, 1)
+        self._db.executemany(
+            "INSERT INTO estadisticas (dimension, clave, si, no) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (dimension, clave) DO UPDATE SET si = si + excluded.si, no = no + excluded.no",
+            [(d, k, si, no) for d, k in self._claves_estadisticas(tipo, prioridad, timestamp, confianza)],
+        )
 
-    return (df["question_id"].astype(str) == str(question_id)).any()
+    def _recalcular_estadisticas(self, filas: Optional[List[tuple]] = None) -> None:
+        """Desde `filas` (tuplas de _tupla, p. ej. todas las del CSV) o, sin ellas, desde la tabla."""
+        self._db.execute("DELETE FROM estadisticas")
+        if filas is None:
+            grupos = self._db.execute(
+                "SELECT timestamp, tipo_detectado, prioridad, confianza_top, feedback, COUNT(*) "
+                "FROM feedback WHERE feedback IN ('SI', 'NO') "
+                "GROUP BY timestamp, tipo_detectado, prioridad, confianza_top, feedback"
+            ).fetchall()
+        else:
+            grupos = [(t, tipo, p, c, fb, 1) for _, t, _, tipo, p, c, _, fb in filas if fb in ("SI", "NO")]
+        acumulado: Dict[tuple, list] = {}
+        for timestamp, tipo, prioridad, confianza, feedback, n in grupos:
+            for clave in self._claves_estadisticas(tipo, prioridad, timestamp, confianza):
+                par = acumulado.setdefault(clave, [0, 0])
+                par[0 if feedback == "SI" else 1] += n
+        self._db.executemany(
+            "INSERT INTO estadisticas (dimension, clave, si, no) VALUES (?, ?, ?, ?)",
+            [(d, k, si, no) for (d, k), (si, no) in acumulado.items()],
+        )
+
+    def reconstruir_estadisticas(self, ruta_csv: Optional[Union[str, Path]] = None) -> None:
+        """
+        Recalcula los agregados para corregir cualquier deriva. Con
+        `ruta_csv` (el registro de referencia) se cuentan las filas del CSV
+        y antes se importan al índice las que falten; sin él, se cuenta la
+        tabla del índice. Las filas que aún estén en la cola del escritor
+        no están en el CSV: vaciarla antes si se llama en el mismo proceso.
+        """
+        with self._lock:
+            if ruta_csv is not None:
+                self._importar_csv(Path(ruta_csv))
+            else:
+                with self._db:
+                    self._recalcular_estadisticas()
+
+    def duplicados_csv(self) -> int:
+        """Filas del CSV con un question_id repetido (contadas en las estadísticas, no en el índice)."""
+        with self._lock:
+            fila = self._db.execute("SELECT valor FROM meta WHERE clave = 'duplicados_csv'").fetchone()
+        return int(fila[0]) if fila else 0
+
+    def estadisticas(self) -> dict:
+        """
+        Totales y desgloses ya agregados (no se recorre el feedback):
+        total, si, no, porcentaje_si y por_tipo / por_prioridad / por_dia /
+        por_confianza como {clave: {"si": n, "no": n}}.
+        """
+        with self._lock:
+            filas = self._db.execute("SELECT dimension, clave, si, no FROM estadisticas").fetchall()
+
+        stats: dict = {"total": 0, "si": 0, "no": 0, "porcentaje_si": 0.0,
+                       "por_tipo": {}, "por_prioridad": {}, "por_dia": {}, "por_confianza": {}}
+        for dimension, clave, si, no in filas:
+            if dimension == "total":
+                stats["si"], stats["no"], stats["total"] = si, no, si + no
+            else:
+                stats[f"por_{dimension}"][clave] = {"si": si, "no": no}
+        if stats["total"]:
+            stats["porcentaje_si"] = round((stats["si"] / stats["total"]) * 100, 2)
+        return stats
+
+
+_almacenes: Dict[str, AlmacenFeedback] = {}
+_almacenes_lock = threading.Lock()
+
+
+def obtener_almacen(
+    ruta_db: Union[str, Path] = FEEDBACK_DB_PATH,
+    ruta_csv: Optional[Union[str, Path]] = FEEDBACK_PATH,
+) -> AlmacenFeedback:
+    """Un AlmacenFeedback por base de datos y proceso."""
+    clave = str(Path(ruta_db).resolve())
+    with _almacenes_lock:
+        if clave not in _almacenes:
+            _almacenes[clave] = AlmacenFeedback(ruta_db, ruta_csv)
+        return _almacenes[clave]
+
+
+def feedback_already_exists(question_id: str) -> bool:
+    """
+    Devuelve True si ya hay feedback registrado para ese question_id.
+    Esto bloquea duplicados incluso si se recarga la página.
+    """
+    return obtener_almacen().ya_registrado(question_id)
 
 
 def registrar_feedback(
@@ -80,11 +339,7 @@ def registrar_feedback(
     """
     ensure_feedback_csv_exists()
 
-    question_id = build_question_id(texto_usuario)
-
-    # Bloqueo anti-duplicados (persistente)
-    if feedback_already_exists(question_id):
-        return False
+    question_id = build_question_id(texto_usuario, respuesta)
 
     fila = {
         "timestamp": datetime.now().isoformat(timespec="seconds"),
@@ -93,10 +348,15 @@ def registrar_feedback(
         "tipo_detectado": tipo,
         "prioridad": prioridad,
         "confianza_top": round(float(confianza), 4),
-        "respuesta_resumen": str(respuesta).replace("\n", " ").strip()[:250],
+        "respuesta_resumen": resumir_respuesta(respuesta),
         "feedback": str(feedback).strip().upper(),  # SI / NO
     }
 
+    # Bloqueo anti-duplicados (persistente): la inserción en el índice
+    # falla si ya existía ese question_id
+    if not obtener_almacen().insertar(fila):
+        return False
+
     existe = FEEDBACK_PATH.exists()
     df = pd.DataFrame([fila])
     df.to_csv(FEEDBACK_PATH, mode="a", index=False, header=not existe, encoding="utf-8")
@@ -146,4 +406,26 @@ def compute_feedback_stats(df: pd.DataFrame) -> dict:
     total = int(si + no)
     porcentaje_si = round((si / total) * 100, 2) if total > 0 else 0.0
 
-    return {"total": total, "si": si, "no": no, "porcentaje_si": porcentaje_si}
\ No newline at end of file
+    return {"total": total, "si": si, "no": no, "porcentaje_si": porcentaje_si}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Mantenimiento del índice de feedback.")
+    parser.add_argument(
+        "--reconstruir-estadisticas",
+        action="store_true",
+        help="Recalcula los agregados desde el CSV de feedback (corrige desajustes).",
+    )
+    args = parser.parse_args()
+
+    almacen = obtener_almacen()
+    if args.reconstruir_estadisticas:
+        almacen.reconstruir_estadisticas(FEEDBACK_PATH)
+        print(f"✅ Estadísticas de feedback reconstruidas desde {FEEDBACK_PATH}.")
+    duplicados = almacen.duplicados_csv()
+    if duplicados:
+        print(f"ℹ️ {duplicados} filas del CSV repiten question_id: cuentan en las "
+              f"estadísticas pero ocupan una sola entrada en el índice.")
+    print(almacen.estadisticas())
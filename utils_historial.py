@@ -0,0 +1,181 @@
+# ---------------------------------------------------------
+# Autor: Raúl Cid González
+# Historial de chat acotado por sesión: ventana de mensajes
+# recientes en memoria y el resto en disco, paginado bajo demanda
+# ---------------------------------------------------------
+
+from __future__ import annotations
+
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+
+
+def _leer_hacia_atras(ruta: Path, fin: int, n: int, tam_bloque: int = 16 * 1024) -> Tuple[int, List[bytes]]:
+    """
+    Las `n` líneas que terminan en el byte `fin`, leyendo desde ahí hacia
+    atrás. Devuelve (byte donde empiezan, líneas).
+    """
+    with open(ruta, "rb") as f:
+        pos = fin
+        datos = b""
+        while pos > 0 and datos.count(b"\n") <= n:
+            inicio = max(0, pos - tam_bloque)
+            f.seek(inicio)
+            datos = f.read(pos - inicio) + datos
+            pos = inicio
+    lineas = datos.split(b"\n")[:-1] if datos.endswith(b"\n") else datos.split(b"\n")
+    tomadas = lineas[-n:]
+    return fin - sum(len(l) + 1 for l in tomadas), tomadas
+
+
+def _leer_hacia_delante(ruta: Path, inicio: int, n: int) -> Tuple[int, List[bytes]]:
+    """Las `n` líneas que empiezan en el byte `inicio`. Devuelve (byte donde terminan, líneas)."""
+    lineas = []
+    with open(ruta, "rb") as f:
+        f.seek(inicio)
+        fin = inicio
+        for _ in range(n):
+            linea = f.readline()
+            if not linea.endswith(b"\n"):
+                break
+            fin += len(linea)
+            lineas.append(linea[:-1])
+    return fin, lineas
+
+
+class HistorialChat:
+    """
+    Historial de una sesión con memoria constante.
+
+    - En memoria solo están los últimos `ventana` mensajes, que son los
+      que se pintan en cada rerun.
+    - Los que salen de la ventana se añaden (JSON por línea) al archivo
+      de la sesión, `ruta_desborde`.
+    - "Cargar anteriores" trae del archivo una página de `tam_pagina`
+      mensajes cada vez, leyendo solo esos bytes; en memoria solo hay una
+      página a la vez.
+    """
+
+    def __init__(self, ruta_desborde: Union[str, Path], ventana: int = 30, tam_pagina: int = 20) -> None:
+        self.ruta_desborde = Path(ruta_desborde)
+        self.tam_pagina = tam_pagina
+        self._ventana: "deque[Dict[str, str]]" = deque(maxlen=ventana)
+        self.n_desbordados = 0
+        self.pagina: List[Dict[str, str]] = []
+        self._inicio_pagina = 0
+        self._fin_pagina = 0
+        self._tam_desborde = 0
+
+    def mantener_vivo(self) -> None:
+        """
+        Actualiza la fecha de modificación del archivo de desborde para que
+        purgar_historiales no lo borre mientras la sesión se siga usando
+        (conviene llamarlo en cada interacción).
+        """
+        if self._tam_desborde:
+            try:
+                os.utime(self.ruta_desborde)
+            except FileNotFoundError:
+                self._olvidar_desborde()
+
+    def _olvidar_desborde(self) -> None:
+        """El archivo ya no existe (purgado): los mensajes antiguos se dan por perdidos."""
+        self.n_desbordados = 0
+        self._tam_desborde = 0
+        self.cerrar_pagina()
+
+    def agregar(self, rol: str, contenido: str) -> None:
+        if len(self._ventana) == self._ventana.maxlen:
+            self._desbordar(self._ventana[0])
+        self._ventana.append({"role": rol, "content": contenido})
+
+    def _desbordar(self, mensaje: Dict[str, str]) -> None:
+        # Si lo purgaron, las posiciones guardadas ya no valen: se empieza de cero
+        if self._tam_desborde and not self.ruta_desborde.exists():
+            self._olvidar_desborde()
+        linea = json.dumps(
+            {"timestamp": datetime.now().isoformat(timespec="seconds"), **mensaje},
+            ensure_ascii=False,
+        ).encode("utf-8") + b"\n"
+        self.ruta_desborde.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.ruta_desborde, "ab") as f:
+            f.write(linea)
+        self._tam_desborde += len(linea)
+        self.n_desbordados += 1
+        if not self.pagina:
+            # sin página abierta, "anteriores" empieza por lo más reciente
+            self._inicio_pagina = self._fin_pagina = self._tam_desborde
+
+    @property
+    def recientes(self) -> List[Dict[str, str]]:
+        return list(self._ventana)
+
+    @property
+    def hay_anteriores(self) -> bool:
+        return self._inicio_pagina > 0
+
+    @property
+    def hay_siguientes(self) -> bool:
+        return bool(self.pagina) and self._fin_pagina < self._tam_desborde
+
+    @staticmethod
+    def _decodificar(lineas: List[bytes]) -> List[Dict[str, str]]:
+        return [json.loads(l) for l in lineas if l]
+
+    def pagina_anterior(self) -> List[Dict[str, str]]:
+        """Página de mensajes justo anterior a la que se está viendo."""
+        if not self.hay_anteriores:
+            return self.pagina
+        try:
+            inicio, lineas = _leer_hacia_atras(self.ruta_desborde, self._inicio_pagina, self.tam_pagina)
+        except FileNotFoundError:
+            self._olvidar_desborde()
+            return self.pagina
+        self._fin_pagina, self._inicio_pagina = self._inicio_pagina, inicio
+        self.pagina = self._decodificar(lineas)
+        return self.pagina
+
+    def pagina_siguiente(self) -> List[Dict[str, str]]:
+        """Página posterior; al llegar a la ventana reciente se cierra."""
+        if not self.hay_siguientes:
+            self.cerrar_pagina()
+            return self.pagina
+        try:
+            fin, lineas = _leer_hacia_delante(self.ruta_desborde, self._fin_pagina, self.tam_pagina)
+        except FileNotFoundError:
+            self._olvidar_desborde()
+            return self.pagina
+        self._inicio_pagina, self._fin_pagina = self._fin_pagina, fin
+        self.pagina = self._decodificar(lineas)
+        return self.pagina
+
+    def cerrar_pagina(self) -> None:
+        self.pagina = []
+        self._inicio_pagina = self._fin_pagina = self._tam_desborde
+
+
+def purgar_historiales(directorio: Union[str, Path], max_edad_s: float = 24 * 3600) -> int:
+    """
+    Borra los archivos de sesiones sin actividad desde hace `max_edad_s`.
+    Las sesiones abiertas renuevan la fecha de su archivo con
+    HistorialChat.mantener_vivo(); si aun así se borra uno en uso, esa
+    sesión pierde los mensajes antiguos pero sigue funcionando.
+    """
+    directorio = Path(directorio)
+    if not directorio.is_dir():
+        return 0
+    limite = time.time() - max_edad_s
+    borrados = 0
+    for archivo in directorio.glob("*.jsonl"):
+        try:
+            if archivo.stat().st_mtime < limite:
+                os.remove(archivo)
+                borrados += 1
+        except OSError:
+            pass
+    return borrados
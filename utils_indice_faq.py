@@ -0,0 +1,139 @@
+# ---------------------------------------------------------
+# Autor: Raúl Cid González
+# Índice vectorial de FAQ: TF-IDF de n-gramas de caracteres
+# con hashing y búsqueda por similitud coseno
+# ---------------------------------------------------------
+
+from __future__ import annotations
+
+import zlib
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utils_cache import normalizar_texto
+
+
+DIMENSION = 1 << 18
+NGRAMAS = (3, 4, 5)
+
+
+def _ngramas(texto: str, tamanos: Sequence[int] = NGRAMAS) -> Dict[int, float]:
+    """
+    Cuenta los n-gramas de caracteres del texto normalizado, ya
+    reducidos a un índice de columna con crc32 (estable entre procesos,
+    a diferencia de hash()).
+    """
+    t = f" {normalizar_texto(texto)} "
+    cuentas: Dict[int, float] = {}
+    for n in tamanos:
+        for i in range(len(t) - n + 1):
+            col = zlib.crc32(t[i:i + n].encode("utf-8")) % DIMENSION
+            cuentas[col] = cuentas.get(col, 0.0) + 1.0
+    return cuentas
+
+
+class VectorizadorNgramas:
+    """
+    Convierte textos en vectores dispersos (columnas, pesos) con TF
+    sublineal, IDF opcional y norma L2 = 1.
+    """
+
+    def __init__(self, idf: Optional[np.ndarray] = None) -> None:
+        self.idf = idf if idf is not None else np.ones(DIMENSION, dtype=np.float32)
+
+    @classmethod
+    def ajustar(cls, documentos: Iterable[str]) -> "VectorizadorNgramas":
+        docs = [np.fromiter(_ngramas(d), dtype=np.int64) for d in documentos]
+        n = len(docs)
+        df = np.bincount(np.concatenate(docs), minlength=DIMENSION) if docs else np.zeros(DIMENSION)
+        # Columnas nunca vistas: mismo peso que un n-grama presente en un solo documento
+        idf = np.log((1 + n) / (1 + np.maximum(df, 1))) + 1.0
+        return cls(idf.astype(np.float32))
+
+    def vectorizar(self, texto: str) -> Tuple[np.ndarray, np.ndarray]:
+        cuentas = _ngramas(texto)
+        if not cuentas:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        cols = np.fromiter(cuentas.keys(), dtype=np.int64, count=len(cuentas))
+        tf = np.fromiter(cuentas.values(), dtype=np.float32, count=len(cuentas))
+        pesos = (1.0 + np.log(tf)) * self.idf[cols]
+        pesos /= np.linalg.norm(pesos) or 1.0
+        return cols, pesos.astype(np.float32)
+
+
+class MatrizDispersa:
+    """
+    Matriz documentos x columnas guardada por columnas (estilo CSC), de
+    modo que el coseno con una consulta solo toca las columnas que la
+    consulta tiene activas: coste proporcional a sus n-gramas, no al
+    número de documentos ni a la dimensión.
+    """
+
+    def __init__(self, vectores: List[Tuple[np.ndarray, np.ndarray]]) -> None:
+        self.n_filas = len(vectores)
+        if vectores:
+            filas = np.concatenate(
+                [np.full(len(c), i, dtype=np.int32) for i, (c, _) in enumerate(vectores)]
+            )
+            cols = np.concatenate([c for c, _ in vectores])
+            pesos = np.concatenate([p for _, p in vectores])
+        else:
+            filas = np.empty(0, dtype=np.int32)
+            cols = np.empty(0, dtype=np.int64)
+            pesos = np.empty(0, dtype=np.float32)
+
+        orden = np.argsort(cols, kind="stable")
+        self._cols = cols[orden]
+        self._filas = filas[orden]
+        self._pesos = pesos[orden]
+
+    def productos(self, cols: np.ndarray, pesos: np.ndarray) -> np.ndarray:
+        """Producto escalar de la consulta con cada fila."""
+        if not self.n_filas or not len(cols):
+            return np.zeros(self.n_filas, dtype=np.float32)
+        ini = np.searchsorted(self._cols, cols, side="left")
+        largos = np.searchsorted(self._cols, cols, side="right") - ini
+        total = int(largos.sum())
+        if not total:
+            return np.zeros(self.n_filas, dtype=np.float32)
+        # Posiciones de todas las entradas de las columnas de la consulta,
+        # sin bucle en Python: ini[j] + 0..largos[j]-1 para cada j
+        desplaz = np.repeat(ini - (np.cumsum(largos) - largos), largos)
+        todos = np.arange(total) + desplaz
+        contrib = self._pesos[todos] * np.repeat(pesos, largos)
+        return np.bincount(self._filas[todos], weights=contrib, minlength=self.n_filas)
+
+
+class IndiceFAQ:
+    """
+    Índice de recuperación sobre las entradas de FAQ.
+
+    Cada entrada aporta varios documentos (patrones, respuesta y
+    preguntas de ejemplo); la similitud de una entrada es la máxima entre
+    sus documentos. buscar() devuelve los k mejores (índice, similitud).
+    """
+
+    def __init__(self, documentos: List[Tuple[int, str]]) -> None:
+        # documentos: (índice de la entrada FAQ, texto); se agrupan por entrada
+        documentos = sorted(documentos, key=lambda d: d[0])
+        self.vectorizador = VectorizadorNgramas.ajustar(t for _, t in documentos)
+        self.matriz = MatrizDispersa([self.vectorizador.vectorizar(t) for _, t in documentos])
+
+        entradas = np.array([i for i, _ in documentos], dtype=np.int64)
+        if len(entradas):
+            self._inicios = np.flatnonzero(np.r_[True, entradas[1:] != entradas[:-1]])
+            self._entradas = entradas[self._inicios]
+        else:
+            self._inicios = np.empty(0, dtype=np.int64)
+            self._entradas = entradas
+
+    def buscar(self, texto: str, k: int = 3) -> List[Tuple[int, float]]:
+        if not len(self._entradas):
+            return []
+        cols, pesos = self.vectorizador.vectorizar(texto)
+        sims = np.maximum.reduceat(self.matriz.productos(cols, pesos), self._inicios)
+        k = min(k, len(sims))
+        mejores = np.argpartition(-sims, k - 1)[:k]
+        mejores = mejores[np.argsort(-sims[mejores])]
+        return [(int(self._entradas[j]), float(sims[j])) for j in mejores]
@@ -0,0 +1,225 @@
+# ---------------------------------------------------------
+# Autor: Raúl Cid González
+# Métricas de latencia por etapa del mensaje (histogramas),
+# contadores por ruta y exportación en formato Prometheus
+# ---------------------------------------------------------
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+
+# Límites de los cubos en segundos: de 10 µs a ~21 s, duplicando
+LIMITES = tuple(1e-5 * 2 ** i for i in range(22))
+
+
+class Histograma:
+    """Histograma de cubos fijos: memoria constante y percentiles aproximados."""
+
+    __slots__ = ("limites", "cuentas", "suma", "n")
+
+    def __init__(self, limites: Tuple[float, ...] = LIMITES) -> None:
+        self.limites = limites
+        self.cuentas = [0] * (len(limites) + 1)  # el último es +Inf
+        self.suma = 0.0
+        self.n = 0
+
+    def observar(self, valor: float) -> None:
+        self.cuentas[bisect_left(self.limites, valor)] += 1
+        self.suma += valor
+        self.n += 1
+
+    def percentil(self, p: float) -> float:
+        """Interpolación lineal dentro del cubo donde cae el percentil."""
+        if self.n == 0:
+            return 0.0
+        objetivo = p / 100 * self.n
+        acumulado = 0
+        for i, cuenta in enumerate(self.cuentas):
+            if cuenta and acumulado + cuenta >= objetivo:
+                if i == len(self.limites):
+                    return self.limites[-1]
+                inferior = self.limites[i - 1] if i else 0.0
+                return inferior + (self.limites[i] - inferior) * (objetivo - acumulado) / cuenta
+            acumulado += cuenta
+        return self.limites[-1]
+
+
+class _Nulo:
+    """Contexto vacío para cuando las métricas están desactivadas."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *_) -> None:
+        return None
+
+
+_NULO = _Nulo()
+
+
+class _Cronometro:
+    __slots__ = ("_registro", "_etapa", "_inicio")
+
+    def __init__(self, registro: "RegistroMetricas", etapa: str) -> None:
+        self._registro = registro
+        self._etapa = etapa
+
+    def __enter__(self) -> None:
+        self._inicio = time.perf_counter()
+
+    def __exit__(self, *_) -> None:
+        self._registro.observar(self._etapa, time.perf_counter() - self._inicio)
+
+
+class RegistroMetricas:
+    """
+    Histogramas de latencia por etapa y contadores por ruta, compartidos
+    por todo el proceso.
+
+        with metricas.etapa("faq_regex"):
+            ...
+        metricas.contar_ruta("faq")
+
+    Con `activo = False` etapa() devuelve un contexto vacío ya creado y
+    contar_ruta()/observar() salen al instante: el coste es una
+    comprobación de atributo.
+    """
+
+    def __init__(self, prefijo: str = "asistente", activo: bool = True,
+                 limites: Tuple[float, ...] = LIMITES) -> None:
+        self.prefijo = prefijo
+        self.activo = activo
+        self.limites = limites
+        self._lock = threading.Lock()
+        self._histogramas: Dict[str, Histograma] = {}
+        self._rutas: Dict[str, int] = {}
+        self._servidor: Optional[ThreadingHTTPServer] = None
+        self._hilo_archivo: Optional[threading.Thread] = None
+
+    # ---------- Registro ----------
+
+    def etapa(self, nombre: str):
+        if not self.activo:
+            return _NULO
+        return _Cronometro(self, nombre)
+
+    def observar(self, etapa: str, segundos: float) -> None:
+        if not self.activo:
+            return
+        with self._lock:
+            histograma = self._histogramas.get(etapa)
+            if histograma is None:
+                histograma = self._histogramas[etapa] = Histograma(self.limites)
+            histograma.observar(segundos)
+
+    def contar_ruta(self, ruta: str) -> None:
+        if not self.activo:
+            return
+        with self._lock:
+            self._rutas[ruta] = self._rutas.get(ruta, 0) + 1
+
+    def reiniciar(self) -> None:
+        with self._lock:
+            self._histogramas.clear()
+            self._rutas.clear()
+
+    # ---------- Consulta ----------
+
+    def resumen(self) -> Dict[str, Dict]:
+        """{"etapas": {etapa: n, media/p50/p95/p99 en ms}, "rutas": {ruta: n}}"""
+        with self._lock:
+            etapas = {
+                nombre: {
+                    "n": h.n,
+                    "media_ms": 1000 * h.suma / h.n if h.n else 0.0,
+                    "p50_ms": 1000 * h.percentil(50),
+                    "p95_ms": 1000 * h.percentil(95),
+                    "p99_ms": 1000 * h.percentil(99),
+                }
+                for nombre, h in sorted(self._histogramas.items())
+            }
+            return {"etapas": etapas, "rutas": dict(sorted(self._rutas.items()))}
+
+    def exportar_prometheus(self) -> str:
+        """Formato de texto de Prometheus (histogramas acumulados + contadores)."""
+        nombre_h = f"{self.prefijo}_etapa_segundos"
+        nombre_c = f"{self.prefijo}_rutas_total"
+        lineas: List[str] = [
+            f"# HELP {nombre_h} Latencia de cada etapa del mensaje en segundos.",
+            f"# TYPE {nombre_h} histogram",
+        ]
+        with self._lock:
+            for etapa, h in sorted(self._histogramas.items()):
+                acumulado = 0
+                for limite, cuenta in zip(self.limites, h.cuentas):
+                    acumulado += cuenta
+                    lineas.append(f'{nombre_h}_bucket{{etapa="{etapa}",le="{limite:.6g}"}} {acumulado}')
+                lineas.append(f'{nombre_h}_bucket{{etapa="{etapa}",le="+Inf"}} {h.n}')
+                lineas.append(f'{nombre_h}_sum{{etapa="{etapa}"}} {h.suma:.9g}')
+                lineas.append(f'{nombre_h}_count{{etapa="{etapa}"}} {h.n}')
+            lineas.append(f"# HELP {nombre_c} Mensajes resueltos por cada ruta (faq, regla, cache, modelo...).")
+            lineas.append(f"# TYPE {nombre_c} counter")
+            for ruta, n in sorted(self._rutas.items()):
+                lineas.append(f'{nombre_c}{{ruta="{ruta}"}} {n}')
+        return "\n".join(lineas) + "\n"
+
+    # ---------- Exportación ----------
+
+    def escribir_prometheus(self, ruta: Union[str, Path]) -> None:
+        """Escritura atómica (para el textfile collector de node_exporter)."""
+        ruta = Path(ruta)
+        tmp = ruta.with_name(ruta.name + ".tmp")
+        tmp.write_text(self.exportar_prometheus(), encoding="utf-8")
+        os.replace(tmp, ruta)
+
+    def escribir_periodicamente(self, ruta: Union[str, Path], intervalo_s: float = 15.0) -> None:
+        """Reescribe `ruta` cada `intervalo_s` en un hilo daemon (solo se arranca una vez)."""
+        with self._lock:
+            if self._hilo_archivo is not None:
+                return
+
+            def bucle() -> None:
+                while True:
+                    try:
+                        self.escribir_prometheus(ruta)
+                    except OSError as e:
+                        print(f"⚠️ No se pudieron escribir las métricas en {ruta}: {e}")
+                    time.sleep(intervalo_s)
+
+            self._hilo_archivo = threading.Thread(target=bucle, name="metricas-archivo", daemon=True)
+            self._hilo_archivo.start()
+
+    def servir(self, puerto: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """Endpoint GET /metrics en un hilo daemon (solo se arranca una vez)."""
+        with self._lock:
+            if self._servidor is not None:
+                return self._servidor
+            registro = self
+
+            class Manejador(BaseHTTPRequestHandler):
+                def do_GET(self) -> None:
+                    if self.path.split("?")[0] != "/metrics":
+                        self.send_error(404)
+                        return
+                    cuerpo = registro.exportar_prometheus().encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                    self.send_header("Content-Length", str(len(cuerpo)))
+                    self.end_headers()
+                    self.wfile.write(cuerpo)
+
+                def log_message(self, *_) -> None:
+                    pass
+
+            self._servidor = ThreadingHTTPServer((host, puerto), Manejador)
+            threading.Thread(target=self._servidor.serve_forever, name="metricas-http", daemon=True).start()
+            return self._servidor
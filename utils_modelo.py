@@ -0,0 +1,167 @@
+# ---------------------------------------------------------
+# Autor: Raúl Cid González
+# Gestión del modelo PLN: carga diferida, compartida por todo
+# el proceso y con precarga en segundo plano; modelo simulado
+# determinista para pruebas y benchmarks sin red
+# ---------------------------------------------------------
+
+from __future__ import annotations
+
+import math
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+
+# Tras una carga fallida, obtener() relanza el error durante este tiempo
+# antes de reintentar; se duplica con cada fallo seguido, hasta el máximo
+REINTENTO_INICIAL_S = 5.0
+REINTENTO_MAX_S = 300.0
+
+
+class GestorModelo:
+    """
+    Envuelve la carga de un modelo pesado (p. ej. el pipeline zero-shot).
+
+    - No carga nada al importarse: el modelo se crea la primera vez que
+      alguien lo pide con obtener(), o antes si se llama a precargar().
+    - precargar() lanza la carga en un hilo en segundo plano, de modo que
+      las respuestas FAQ / reglas se sirven al instante mientras tanto.
+    - Una única instancia por proceso: todas las sesiones de Streamlit y
+      todos los hilos comparten el mismo modelo (y la misma carga).
+    - Si la carga falla (p. ej. sin red un momento), obtener() relanza el
+      error; pasados `reintento_s` segundos (el doble tras cada fallo
+      seguido) la siguiente llamada a obtener() o precargar() reintenta.
+    """
+
+    def __init__(self, cargador: Callable[[], Any], nombre: str = "modelo",
+                 reintento_s: float = REINTENTO_INICIAL_S) -> None:
+        self._cargador = cargador
+        self.nombre = nombre
+        self.reintento_s = reintento_s
+        self._lock = threading.Lock()
+        self._listo = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+        self._modelo: Any = None
+        self._error: Optional[BaseException] = None
+        self._fallos = 0
+        self._fallo_en = 0.0
+
+    def _cargar(self) -> None:
+        try:
+            self._modelo = self._cargador()
+            self._error = None
+            self._fallos = 0
+        except BaseException as e:  # se relanza en obtener()
+            self._error = e
+            self._fallos += 1
+            self._fallo_en = time.monotonic()
+        finally:
+            self._listo.set()
+
+    def _cargar_en_hilo(self) -> None:
+        self._cargar()
+        with self._lock:
+            self._hilo = None
+
+    def _reintentar_si_toca(self) -> None:
+        """
+        Con self._lock tomado: si la última carga falló y ya ha pasado la
+        espera, deja el gestor como sin cargar para que se vuelva a
+        intentar. _error se conserva hasta que el nuevo intento termine,
+        así quien ya esperaba el anterior sigue viendo su error.
+        """
+        if not self._listo.is_set() or self._error is None or self._hilo is not None:
+            return
+        espera = min(REINTENTO_MAX_S, self.reintento_s * 2 ** (self._fallos - 1))
+        if time.monotonic() - self._fallo_en >= espera:
+            self._listo.clear()
+
+    def precargar(self) -> None:
+        """
+        Arranca la carga en un hilo daemon. Llamarla varias veces no
+        provoca cargas duplicadas.
+        """
+        with self._lock:
+            self._reintentar_si_toca()
+            if self._listo.is_set() or self._hilo is not None:
+                return
+            self._hilo = threading.Thread(
+                target=self._cargar_en_hilo, name=f"precarga-{self.nombre}", daemon=True
+            )
+            self._hilo.start()
+
+    def obtener(self, timeout: Optional[float] = None) -> Any:
+        """
+        Devuelve el modelo. Si la precarga está en curso, espera solo lo
+        que le quede; si nadie la ha lanzado, carga en el hilo actual.
+        """
+        if not self._listo.is_set() or self._error is not None:
+            with self._lock:
+                self._reintentar_si_toca()
+                if not self._listo.is_set() and self._hilo is None:
+                    self._cargar()
+            if not self._listo.wait(timeout):
+                raise TimeoutError(f"El {self.nombre} sigue cargándose.")
+
+        error = self._error
+        if error is not None:
+            raise RuntimeError(f"No se pudo cargar el {self.nombre}.") from error
+        return self._modelo
+
+    def reemplazar(self, modelo: Any) -> None:
+        """
+        Sustituye el modelo en caliente (p. ej. al cambiar de backend).
+        Las llamadas en curso terminan con el anterior.
+        """
+        with self._lock:
+            self._modelo = modelo
+            self._error = None
+            self._fallos = 0
+            self._listo.set()
+
+    @property
+    def listo(self) -> bool:
+        """True si el modelo ya está cargado y disponible."""
+        return self._listo.is_set() and self._error is None
+
+    @property
+    def cargando(self) -> bool:
+        """True mientras la precarga en segundo plano no ha terminado."""
+        return self._hilo is not None and not self._listo.is_set()
+
+
+class ClasificadorSimulado:
+    """
+    Sustituto determinista del pipeline zero-shot, sin red ni torch.
+
+    Se llama igual y devuelve lo mismo ({"sequence", "labels", "scores"}).
+    Las puntuaciones salen de un hash (crc32) de texto + etiqueta, así que
+    el mismo texto da siempre el mismo resultado. Con `ms_por_par` simula
+    el coste del modelo por par (texto, hipótesis).
+    """
+
+    def __init__(self, ms_por_par: float = 0.0) -> None:
+        self.ms_por_par = ms_por_par
+
+    def _puntuar(self, texto: str, etiquetas: Sequence[str]) -> Dict[str, Any]:
+        logits = [zlib.crc32(f"{texto}\x00{e}".encode("utf-8")) / 2**32 * 4 for e in etiquetas]
+        maximo = max(logits)
+        exps = [math.exp(l - maximo) for l in logits]
+        total = sum(exps)
+        orden = sorted(range(len(etiquetas)), key=lambda i: -exps[i])
+        return {
+            "sequence": texto,
+            "labels": [etiquetas[i] for i in orden],
+            "scores": [exps[i] / total for i in orden],
+        }
+
+    def __call__(self, sequences: Union[str, List[str]], candidate_labels: Sequence[str], **_: Any):
+        unica = isinstance(sequences, str)
+        textos = [sequences] if unica else list(sequences)
+        etiquetas = list(candidate_labels)
+        if self.ms_por_par:
+            time.sleep(self.ms_por_par * len(textos) * len(etiquetas) / 1000)
+        resultados = [self._puntuar(t, etiquetas) for t in textos]
+        return resultados[0] if unica else resultados
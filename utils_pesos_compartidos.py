@@ -0,0 +1,259 @@
+# ---------------------------------------------------------
+# Autor: Raúl Cid González
+# Pesos del modelo compartidos entre procesos: carga mapeando
+# en memoria un model.safetensors local y desglose de la memoria
+# (residente, proporcional, compartida y propia) de cada proceso
+# ---------------------------------------------------------
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import struct
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence, Tuple, Union
+
+
+ARCHIVO_PESOS = "model.safetensors"
+
+# Tipos de safetensors -> nombre del dtype en torch
+_TIPOS = {
+    "F64": "float64", "F32": "float32", "F16": "float16", "BF16": "bfloat16",
+    "I64": "int64", "I32": "int32", "I16": "int16", "I8": "int8", "U8": "uint8", "BOOL": "bool",
+}
+
+
+# ---------- 1. Exportación (una vez por máquina) ----------
+
+def exportar_pesos(modelo: str, destino: Union[str, Path]) -> Path:
+    """
+    Deja en `destino` el modelo (un solo model.safetensors + config) y su
+    tokenizador, listos para cargar_modelo_mapeado. Si ya están, no hace
+    nada. Se escribe en "<destino>.tmp" y se renombra al final, así que un
+    proceso que arranque a la vez nunca ve una exportación a medias.
+    """
+    destino = Path(destino)
+    if (destino / ARCHIVO_PESOS).exists():
+        return destino
+    if destino.exists():
+        raise FileNotFoundError(f"{destino} existe pero no contiene {ARCHIVO_PESOS}.")
+
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    tmp = destino.with_name(destino.name + f".tmp{os.getpid()}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    model = AutoModelForSequenceClassification.from_pretrained(modelo)
+    # Un único archivo: los trozos (model-0000x-of-0000y) no se mapean aquí
+    model.save_pretrained(str(tmp), max_shard_size="1000GB")
+    AutoTokenizer.from_pretrained(modelo).save_pretrained(str(tmp))
+    del model
+    try:
+        tmp.rename(destino)
+    except OSError:
+        # Otro proceso terminó antes la misma exportación
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not (destino / ARCHIVO_PESOS).exists():
+            raise
+    return destino
+
+
+# ---------- 2. Carga mapeada ----------
+
+def leer_cabecera(ruta: Union[str, Path]) -> Tuple[Dict[str, Any], int]:
+    """(cabecera JSON de safetensors, posición donde empiezan los datos)."""
+    with open(ruta, "rb") as f:
+        n = struct.unpack("<Q", f.read(8))[0]
+        cabecera = json.loads(f.read(n))
+    return cabecera, 8 + n
+
+
+def tensores_mapeados(ruta: Union[str, Path]) -> Dict[str, Any]:
+    """
+    Todos los tensores de un .safetensors como vistas de un único mmap del
+    archivo, sin copiar nada. El mapeo es privado (copy-on-write): mientras
+    nadie escriba en los pesos, las páginas son las de la caché de páginas
+    del sistema y las comparten todos los procesos que mapean el archivo;
+    una escritura accidental solo afectaría a la copia de ese proceso, no
+    al archivo.
+    """
+    import torch
+
+    cabecera, inicio = leer_cabecera(ruta)
+    datos = torch.from_file(str(ruta), shared=False, size=os.path.getsize(ruta), dtype=torch.uint8)
+    tensores: Dict[str, Any] = {}
+    for nombre, info in cabecera.items():
+        if nombre == "__metadata__":
+            continue
+        desde, hasta = info["data_offsets"]
+        tipo = getattr(torch, _TIPOS[info["dtype"]])
+        tensores[nombre] = datos[inicio + desde:inicio + hasta].view(tipo).view(info["shape"])
+    return tensores
+
+
+def cargar_modelo_mapeado(directorio: Union[str, Path]):
+    """
+    AutoModelForSequenceClassification cuyos pesos apuntan directamente al
+    model.safetensors de `directorio` (ver tensores_mapeados). El modelo se
+    construye en el dispositivo "meta" (sin reservar memoria) y luego se le
+    asignan los tensores mapeados, así que el proceso no llega a tener una
+    copia propia de los pesos: solo le cuestan sus activaciones.
+    """
+    import torch
+    from transformers import AutoConfig, AutoModelForSequenceClassification
+
+    directorio = Path(directorio)
+    config = AutoConfig.from_pretrained(str(directorio))
+    with torch.device("meta"):
+        model = AutoModelForSequenceClassification.from_config(config)
+
+    resultado = model.load_state_dict(tensores_mapeados(directorio / ARCHIVO_PESOS), strict=False, assign=True)
+    if resultado.unexpected_keys:
+        raise RuntimeError(f"{directorio / ARCHIVO_PESOS} no corresponde a este modelo: "
+                           f"sobran {resultado.unexpected_keys[:5]}")
+    # Los pesos atados (p. ej. embeddings compartidos) no se guardan dos veces
+    model.tie_weights()
+    sin_cargar = [n for n, t in (*model.named_parameters(), *model.named_buffers()) if t.is_meta]
+    if sin_cargar:
+        raise RuntimeError(f"Faltan pesos en {directorio / ARCHIVO_PESOS}: {sin_cargar[:5]}")
+
+    model.requires_grad_(False)
+    return model.eval()
+
+
+def pipeline_mapeado(modelo: str, directorio: Union[str, Path]):
+    """Pipeline "zero-shot-classification" con los pesos mapeados (exporta la primera vez)."""
+    from transformers import AutoTokenizer, pipeline
+
+    directorio = exportar_pesos(modelo, directorio)
+    return pipeline(
+        "zero-shot-classification",
+        model=cargar_modelo_mapeado(directorio),
+        tokenizer=AutoTokenizer.from_pretrained(str(directorio)),
+    )
+
+
+# ---------- 3. Desglose de memoria ----------
+
+def _kb_a_mb(kb: int) -> float:
+    return kb / 1024.0
+
+
+def desglose_memoria(
+    pid: Optional[int] = None,
+    archivos: Sequence[Union[str, Path]] = (),
+) -> Dict[str, float]:
+    """
+    Memoria del proceso `pid` (por defecto este) en MB, leída de
+    /proc/<pid>/smaps (solo Linux; en otro sistema devuelve {}):
+
+    - rss: residente total.
+    - pss: residente proporcional (cada página compartida se reparte
+      entre los procesos que la usan). Sumando el pss de todos los
+      trabajadores sale la memoria real que ocupan entre todos.
+    - compartida: páginas que usa también algún otro proceso.
+    - propia: páginas privadas modificadas (activaciones, Python,
+      tensores propios); lo que cuesta de verdad cada proceso extra.
+    - pesos_rss / pesos_pss / pesos_compartida: lo mismo, solo para los
+      mapeos de `archivos` (p. ej. el model.safetensors).
+    """
+    ruta = Path(f"/proc/{pid or 'self'}/smaps")
+    if not ruta.exists():
+        return {}
+
+    objetivos = {str(Path(a).resolve()) for a in archivos}
+    total = {"Rss": 0, "Pss": 0, "Shared_Clean": 0, "Shared_Dirty": 0, "Private_Dirty": 0}
+    pesos = {"Rss": 0, "Pss": 0, "Shared_Clean": 0, "Shared_Dirty": 0}
+    en_pesos = False
+    with open(ruta, encoding="utf-8", errors="replace") as f:
+        for linea in f:
+            campos = linea.split()
+            if not campos:
+                continue
+            clave = campos[0]
+            if not clave.endswith(":"):
+                # Cabecera de un mapeo: "inicio-fin permisos offset dev inodo [ruta]"
+                en_pesos = len(campos) >= 6 and " ".join(campos[5:]) in objetivos
+                continue
+            clave = clave[:-1]
+            if clave in total:
+                kb = int(campos[1])
+                total[clave] += kb
+                if en_pesos and clave in pesos:
+                    pesos[clave] += kb
+
+    datos = {
+        "rss": _kb_a_mb(total["Rss"]),
+        "pss": _kb_a_mb(total["Pss"]),
+        "compartida": _kb_a_mb(total["Shared_Clean"] + total["Shared_Dirty"]),
+        "propia": _kb_a_mb(total["Private_Dirty"]),
+    }
+    if objetivos:
+        datos["pesos_rss"] = _kb_a_mb(pesos["Rss"])
+        datos["pesos_pss"] = _kb_a_mb(pesos["Pss"])
+        datos["pesos_compartida"] = _kb_a_mb(pesos["Shared_Clean"] + pesos["Shared_Dirty"])
+    return datos
+
+
+def exportar_prometheus(desglose: Dict[str, float], prefijo: str = "asistente") -> str:
+    """El desglose como gauges de Prometheus (en bytes)."""
+    nombre = f"{prefijo}_memoria_bytes"
+    lineas = [
+        f"# HELP {nombre} Memoria del proceso por tipo (rss, pss, compartida, propia, pesos_*).",
+        f"# TYPE {nombre} gauge",
+    ]
+    for tipo, mb in sorted(desglose.items()):
+        lineas.append(f'{nombre}{{tipo="{tipo}"}} {int(mb * 1024 * 1024)}')
+    return "\n".join(lineas) + "\n"
+
+
+# ---------- 4. Demostración con varios procesos ----------
+
+def _trabajador(modelo: str, directorio: Optional[str], barrera, cola) -> None:
+    from utils_backends import crear_backend
+
+    clasificador = crear_backend("transformers", modelo, ruta_pesos=directorio)
+    # Una inferencia para que cuenten también las activaciones
+    clasificador("No puedo entrar al campus virtual", candidate_labels=["problema de acceso", "problema técnico"])
+    barrera.wait()   # todos cargados a la vez antes de medir
+    archivos = [Path(directorio) / ARCHIVO_PESOS] if directorio else []
+    cola.put((os.getpid(), desglose_memoria(archivos=archivos)))
+    barrera.wait()   # nadie sale hasta que todos han medido
+
+
+if __name__ == "__main__":
+    import argparse
+    import multiprocessing as mp
+
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(
+        description="Carga el modelo en varios procesos a la vez y muestra la memoria de cada uno."
+    )
+    parser.add_argument("--modelo", default="facebook/bart-large-mnli")
+    parser.add_argument("--directorio", default="modelos/bart-large-mnli-safetensors",
+                        help="Dónde está (o se exporta) el model.safetensors a mapear.")
+    parser.add_argument("--procesos", type=int, default=3)
+    parser.add_argument("--sin-mapear", action="store_true", help="Carga clásica: una copia por proceso.")
+    args = parser.parse_args()
+
+    directorio = None
+    if not args.sin_mapear:
+        directorio = str(exportar_pesos(args.modelo, args.directorio))
+
+    ctx = mp.get_context("spawn")
+    barrera = ctx.Barrier(args.procesos)
+    cola = ctx.Queue()
+    procesos = [ctx.Process(target=_trabajador, args=(args.modelo, directorio, barrera, cola))
+                for _ in range(args.procesos)]
+    for p in procesos:
+        p.start()
+    filas = dict(cola.get() for _ in procesos)
+    for p in procesos:
+        p.join()
+
+    tabla = pd.DataFrame.from_dict(filas, orient="index").round(1)
+    tabla.index.name = "pid"
+    print(f"Memoria por proceso (MB), {'pesos mapeados' if directorio else 'carga clásica'}:\n")
+    print(tabla)
+    print(f"\nSuma de RSS: {tabla['rss'].sum():.0f} MB · suma de PSS (memoria real): {tabla['pss'].sum():.0f} MB")
@@ -0,0 +1,125 @@
+# ---------------------------------------------------------
+# Autor: Raúl Cid González
+# Planificador de inferencia: agrupa en un solo lote las
+# peticiones que llegan a la vez desde distintas sesiones
+# ---------------------------------------------------------
+
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional, Tuple
+
+
+class ColaLlenaError(RuntimeError):
+    """La cola del planificador está llena (backpressure)."""
+
+
+class PlanificadorInferencia:
+    """
+    Cola compartida + un hilo que ejecuta el modelo por lotes.
+
+    Cada llamante recibe un Future con su propio resultado. El hilo toma
+    la primera petición y junta las que ya estén esperando. Solo si hay
+    concurrencia (el lote anterior tuvo más de una petición, o ya hay más
+    de una en cola) espera hasta `espera_max_ms` para llenar el lote; con
+    tráfico bajo la petición sale sola y sin esperas añadidas.
+    """
+
+    def __init__(
+        self,
+        funcion_lote: Callable[[List[Any]], List[Any]],
+        max_lote: int = 16,
+        espera_max_ms: float = 15.0,
+        max_cola: int = 256,
+        observar_espera: Optional[Callable[[float], None]] = None,
+    ) -> None:
+        self._funcion_lote = funcion_lote
+        # Recibe, por petición, los segundos que pasó en cola hasta salir en un lote
+        self._observar_espera = observar_espera
+        self.max_lote = max(1, int(max_lote))
+        self.espera_max_s = max(0.0, espera_max_ms / 1000.0)
+        self._cola: "queue.Queue[Tuple[Any, Future, float]]" = queue.Queue(maxsize=max_cola)
+        self._hilo: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._ultimo_lote = 1
+
+    def _arrancar(self) -> None:
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(
+                    target=self._bucle, name="planificador-inferencia", daemon=True
+                )
+                self._hilo.start()
+
+    def enviar(self, entrada: Any, timeout: Optional[float] = None) -> Future:
+        """
+        Encola una petición y devuelve su Future.
+        Si la cola está llena espera hasta `timeout` segundos (None = no
+        espera) y, si sigue llena, lanza ColaLlenaError.
+        """
+        self._arrancar()
+        futuro: Future = Future()
+        try:
+            if timeout is None:
+                self._cola.put_nowait((entrada, futuro, time.perf_counter()))
+            else:
+                self._cola.put((entrada, futuro, time.perf_counter()), timeout=timeout)
+        except queue.Full:
+            raise ColaLlenaError("Demasiadas peticiones en cola, inténtalo de nuevo.") from None
+        return futuro
+
+    def ejecutar(self, entrada: Any, timeout: Optional[float] = None) -> Any:
+        """Atajo síncrono: encola y espera el resultado."""
+        return self.enviar(entrada, timeout=timeout).result()
+
+    @property
+    def en_cola(self) -> int:
+        return self._cola.qsize()
+
+    def _recoger_lote(self) -> List[Tuple[Any, Future, float]]:
+        lote = [self._cola.get()]
+
+        while len(lote) < self.max_lote:
+            try:
+                lote.append(self._cola.get_nowait())
+            except queue.Empty:
+                break
+
+        if len(lote) < self.max_lote and (len(lote) > 1 or self._ultimo_lote > 1):
+            limite = time.perf_counter() + self.espera_max_s
+            while len(lote) < self.max_lote:
+                restante = limite - time.perf_counter()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(self._cola.get(timeout=restante))
+                except queue.Empty:
+                    break
+
+        self._ultimo_lote = len(lote)
+        return lote
+
+    def _bucle(self) -> None:
+        while True:
+            lote = self._recoger_lote()
+            activos = [p for p in lote if p[1].set_running_or_notify_cancel()]
+            if not activos:
+                continue
+            if self._observar_espera is not None:
+                ahora = time.perf_counter()
+                for _, _, encolado in activos:
+                    self._observar_espera(ahora - encolado)
+
+            try:
+                resultados = list(self._funcion_lote([p[0] for p in activos]))
+                if len(resultados) != len(activos):
+                    raise RuntimeError("El lote devolvió un número de resultados distinto al esperado.")
+                for (_, futuro, _), resultado in zip(activos, resultados):
+                    futuro.set_result(resultado)
+            except BaseException as e:
+                for _, futuro, _ in activos:
+                    if not futuro.done():
+                        futuro.set_exception(e)
@@ -0,0 +1,93 @@
+# ---------------------------------------------------------
+# Autor: Raúl Cid González
+# Ejecución con plazo: espera a una tarea como mucho un tiempo
+# y, si no llega, la deja terminar en segundo plano
+# ---------------------------------------------------------
+
+from __future__ import annotations
+
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as PlazoAgotado
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+
+class ResultadoPlazo(NamedTuple):
+    a_tiempo: bool
+    valor: Any                  # resultado si llegó a tiempo; si no, None
+    futuro: Optional[Future]    # la tarea (sigue en marcha si no llegó); None si no se lanzó
+
+
+class EjecutorConPlazo:
+    """
+    Pool de hilos en el que cada llamada espera como mucho `plazo_s`.
+
+    - Si la tarea termina a tiempo, se devuelve su resultado.
+    - Si no, se devuelve enseguida con a_tiempo=False y la tarea sigue
+      en segundo plano; al terminar se llama a `al_terminar(resultado)`.
+    - Como mucho `max_en_vuelo` tareas a la vez (contando las que siguen
+      en segundo plano). Si no cabe ninguna más no se lanza: se devuelve
+      a_tiempo=False sin futuro, para no acumular trabajo sin límite.
+
+    Los contadores (a tiempo, fuera de plazo, sin capacidad, completadas
+    y fallidas en segundo plano) sirven para dimensionar la capacidad.
+    """
+
+    def __init__(self, max_en_vuelo: int = 16, nombre: str = "plazo") -> None:
+        self.max_en_vuelo = max_en_vuelo
+        self._pool = ThreadPoolExecutor(max_workers=max_en_vuelo, thread_name_prefix=nombre)
+        self._hueco = threading.BoundedSemaphore(max_en_vuelo)
+        self._lock = threading.Lock()
+        self._contadores = {
+            "a_tiempo": 0,
+            "fuera_de_plazo": 0,
+            "sin_capacidad": 0,
+            "completadas_fondo": 0,
+            "fallidas_fondo": 0,
+        }
+
+    def _contar(self, clave: str) -> None:
+        with self._lock:
+            self._contadores[clave] += 1
+
+    def ejecutar(
+        self,
+        funcion: Callable[..., Any],
+        *args: Any,
+        plazo_s: Optional[float],
+        al_terminar: Optional[Callable[[Any], None]] = None,
+    ) -> ResultadoPlazo:
+        """`plazo_s=None` espera lo que haga falta (sin degradar)."""
+        if not self._hueco.acquire(blocking=False):
+            self._contar("sin_capacidad")
+            return ResultadoPlazo(False, None, None)
+
+        futuro = self._pool.submit(funcion, *args)
+        futuro.add_done_callback(lambda _: self._hueco.release())
+        try:
+            valor = futuro.result(timeout=plazo_s)
+        except PlazoAgotado:
+            self._contar("fuera_de_plazo")
+            futuro.add_done_callback(lambda f: self._terminar_en_fondo(f, al_terminar))
+            return ResultadoPlazo(False, None, futuro)
+
+        self._contar("a_tiempo")
+        return ResultadoPlazo(True, valor, futuro)
+
+    def _terminar_en_fondo(self, futuro: Future, al_terminar: Optional[Callable[[Any], None]]) -> None:
+        if futuro.cancelled() or futuro.exception() is not None:
+            self._contar("fallidas_fondo")
+            return
+        self._contar("completadas_fondo")
+        if al_terminar is not None:
+            try:
+                al_terminar(futuro.result())
+            except Exception as e:
+                print(f"⚠️ Error al completar una tarea en segundo plano: {e}")
+
+    def estadisticas(self) -> Dict[str, float]:
+        with self._lock:
+            datos: Dict[str, float] = dict(self._contadores)
+        total = datos["a_tiempo"] + datos["fuera_de_plazo"] + datos["sin_capacidad"]
+        datos["total"] = total
+        datos["tasa_degradadas"] = (datos["fuera_de_plazo"] + datos["sin_capacidad"]) / total if total else 0.0
+        return datos
@@ -0,0 +1,167 @@
+# ---------------------------------------------------------
+# Autor: Raúl Cid González
+# Escritura de registros CSV en segundo plano: cola acotada,
+# un único hilo escritor, lotes, bloqueo de archivo y rotación
+# ---------------------------------------------------------
+
+from __future__ import annotations
+
+import atexit
+import csv
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+try:  # POSIX
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore[assignment]
+    import msvcrt
+
+
+@contextmanager
+def bloqueo_archivo(ruta: Path) -> Iterator[None]:
+    """
+    Bloqueo exclusivo entre procesos sobre un archivo auxiliar
+    "<ruta>.lock", para que dos procesos no intercalen líneas ni roten
+    el mismo archivo a la vez.
+    """
+    with open(str(ruta) + ".lock", "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.01)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class EscritorCSV:
+    """
+    Añade filas (dict) a un CSV sin bloquear al que llama.
+
+    - escribir() solo encola: coste de microsegundos en la petición.
+    - Un hilo daemon vacía la cola por lotes con el módulo csv cuando hay
+      `tam_lote` filas o pasa `intervalo_s`, y al salir del proceso.
+    - Si el archivo ya existe se respeta su cabecera (orden de columnas);
+      las columnas que falten se dejan vacías.
+    - Rotación opcional por tamaño (`rotar_bytes`) y/o por día
+      (`rotar_diario`): el archivo actual pasa a "<nombre>-<fecha>.csv".
+    """
+
+    def __init__(
+        self,
+        ruta: Union[str, Path],
+        columnas: List[str],
+        max_cola: int = 10000,
+        tam_lote: int = 256,
+        intervalo_s: float = 0.5,
+        rotar_bytes: Optional[int] = None,
+        rotar_diario: bool = False,
+    ) -> None:
+        self.ruta = Path(ruta)
+        self.columnas = list(columnas)
+        self.tam_lote = tam_lote
+        self.intervalo_s = intervalo_s
+        self.rotar_bytes = rotar_bytes
+        self.rotar_diario = rotar_diario
+        self._cola: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max_cola)
+        self._hilo = threading.Thread(target=self._bucle, name=f"escritor-{self.ruta.name}", daemon=True)
+        self._hilo.start()
+        atexit.register(self.vaciar)
+
+    def escribir(self, fila: Dict[str, Any]) -> None:
+        # Si la cola está llena se espera: mejor frenar que perder filas
+        self._cola.put(fila)
+
+    def vaciar(self, timeout: Optional[float] = None) -> None:
+        """Espera a que todo lo encolado hasta ahora esté en disco."""
+        if timeout is None:
+            self._cola.join()
+            return
+        limite = time.monotonic() + timeout
+        while self._cola.unfinished_tasks and time.monotonic() < limite:
+            time.sleep(0.005)
+
+    def _bucle(self) -> None:
+        while True:
+            lote = [self._cola.get()]
+            limite = time.monotonic() + self.intervalo_s
+            while len(lote) < self.tam_lote:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(self._cola.get(timeout=restante))
+                except queue.Empty:
+                    break
+            try:
+                self._escribir_lote(lote)
+            except Exception as e:
+                # El registro nunca debe tumbar la app
+                print(f"⚠️ No se pudo escribir en {self.ruta}: {e}")
+            finally:
+                for _ in lote:
+                    self._cola.task_done()
+
+    def _nombre_rotado(self) -> Path:
+        sello = datetime.now().strftime("%Y%m%d-%H%M%S")
+        destino = self.ruta.with_name(f"{self.ruta.stem}-{sello}{self.ruta.suffix}")
+        n = 1
+        while destino.exists():
+            destino = self.ruta.with_name(f"{self.ruta.stem}-{sello}-{n}{self.ruta.suffix}")
+            n += 1
+        return destino
+
+    def _rotar_si_toca(self) -> None:
+        try:
+            st = os.stat(self.ruta)
+        except OSError:
+            return
+        if st.st_size == 0:
+            return
+        por_tamano = self.rotar_bytes is not None and st.st_size >= self.rotar_bytes
+        por_dia = self.rotar_diario and datetime.fromtimestamp(st.st_mtime).date() != datetime.now().date()
+        if por_tamano or por_dia:
+            os.replace(self.ruta, self._nombre_rotado())
+
+    def _cabecera_existente(self) -> Optional[List[str]]:
+        try:
+            with open(self.ruta, "r", encoding="utf-8-sig", newline="") as f:
+                primera = next(csv.reader(f), None)
+        except (OSError, StopIteration):
+            return None
+        return [c.strip() for c in primera] if primera else None
+
+    def _escribir_lote(self, lote: List[Dict[str, Any]]) -> None:
+        with bloqueo_archivo(self.ruta):
+            self._rotar_si_toca()
+            cabecera = self._cabecera_existente()
+            with open(self.ruta, "a", encoding="utf-8", newline="") as f:
+                escritor = csv.DictWriter(
+                    f,
+                    fieldnames=cabecera or self.columnas,
+                    extrasaction="ignore",
+                    restval="",
+                    lineterminator="\n",
+                )
+                if cabecera is None:
+                    escritor.writeheader()
+                escritor.writerows(lote)
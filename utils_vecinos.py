@@ -0,0 +1,125 @@
+# ---------------------------------------------------------
+# Autor: Raúl Cid González
+# Vecino más cercano entre incidencias ya confirmadas por los
+# alumnos (feedback SI), para no volver a pasar por el modelo
+# ---------------------------------------------------------
+
+from __future__ import annotations
+
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from utils_csv import SeguidorCSV
+from utils_indice_faq import MatrizDispersa, VectorizadorNgramas
+
+
+class IndiceVecinos:
+    """
+    Índice incremental de mensajes con etiqueta confirmada.
+
+    Los vectores son n-gramas de caracteres con hashing (sin IDF, para
+    que añadir filas no obligue a recalcular nada). Las filas nuevas se
+    acumulan en un búfer pequeño; al llenarse se convierten en un bloque
+    disperso y los bloques de tamaño parecido se fusionan (como un
+    contador binario), así que insertar nunca reconstruye todo el índice
+    y una consulta recorre como mucho log(n) bloques.
+    """
+
+    def __init__(self, tam_bufer: int = 64) -> None:
+        self.tam_bufer = tam_bufer
+        self._vectorizador = VectorizadorNgramas()
+        self._etiquetas: List[str] = []
+        self._bloques: List[Tuple[List[Tuple[np.ndarray, np.ndarray]], MatrizDispersa]] = []
+        self._pendientes: List[Tuple[np.ndarray, np.ndarray]] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._etiquetas)
+
+    def agregar(self, texto: str, etiqueta: str) -> None:
+        vector = self._vectorizador.vectorizar(texto)
+        with self._lock:
+            self._etiquetas.append(etiqueta)
+            self._pendientes.append(vector)
+            if len(self._pendientes) >= self.tam_bufer:
+                self._bloques.append((self._pendientes, MatrizDispersa(self._pendientes)))
+                self._pendientes = []
+                while len(self._bloques) > 1 and len(self._bloques[-1][0]) >= len(self._bloques[-2][0]):
+                    ultimo, _ = self._bloques.pop()
+                    previo, _ = self._bloques.pop()
+                    juntos = previo + ultimo
+                    self._bloques.append((juntos, MatrizDispersa(juntos)))
+
+    def vaciar(self) -> None:
+        with self._lock:
+            self._etiquetas, self._bloques, self._pendientes = [], [], []
+
+    def mas_cercano(self, texto: str) -> Optional[Tuple[str, float]]:
+        """(etiqueta, similitud coseno) del mensaje confirmado más parecido."""
+        cols, pesos = self._vectorizador.vectorizar(texto)
+        with self._lock:
+            if not self._etiquetas:
+                return None
+            # Filas en el mismo orden de inserción: bloques y luego búfer
+            partes = [m.productos(cols, pesos) for _, m in self._bloques]
+            if self._pendientes:
+                partes.append(np.array([_producto(cols, pesos, v) for v in self._pendientes]))
+            sims = np.concatenate(partes)
+            j = int(np.argmax(sims))
+            return self._etiquetas[j], float(sims[j])
+
+
+def _producto(cols: np.ndarray, pesos: np.ndarray, vector: Tuple[np.ndarray, np.ndarray]) -> float:
+    _, ia, ib = np.intersect1d(cols, vector[0], assume_unique=True, return_indices=True)
+    return float(np.dot(pesos[ia], vector[1][ib]))
+
+
+class VecinosConfirmados:
+    """
+    Mantiene un IndiceVecinos al día leyendo solo las filas nuevas de
+    feedback_chat.csv. Una fila entra si el alumno confirmó la respuesta
+    (feedback == "SI") y la etiqueta es una de las categorías válidas.
+    """
+
+    def __init__(
+        self,
+        ruta_feedback: Union[str, Path],
+        categorias_validas: Iterable[str],
+        intervalo_s: float = 2.0,
+    ) -> None:
+        self.indice = IndiceVecinos()
+        self.categorias_validas = set(categorias_validas)
+        self.intervalo_s = intervalo_s
+        self._seguidor = SeguidorCSV(ruta_feedback)
+        self._ultima_revision = float("-inf")
+        self._lock = threading.Lock()
+
+    def actualizar(self, forzar: bool = False) -> None:
+        ahora = time.monotonic()
+        with self._lock:
+            if not forzar and ahora - self._ultima_revision < self.intervalo_s:
+                return
+            self._ultima_revision = ahora
+
+            filas = self._seguidor.nuevas_filas()
+            if self._seguidor.reiniciado:
+                self.indice.vaciar()
+
+            for fila in filas:
+                if str(fila.get("feedback", "")).strip().upper() != "SI":
+                    continue
+                etiqueta = str(fila.get("tipo_detectado", "")).strip()
+                texto = str(fila.get("texto_usuario", "")).strip()
+                if texto and etiqueta in self.categorias_validas:
+                    self.indice.agregar(texto, etiqueta)
+
+    def buscar(self, texto: str, umbral: float) -> Optional[Tuple[str, float]]:
+        self.actualizar()
+        encontrado = self.indice.mas_cercano(texto)
+        if encontrado is None or encontrado[1] < umbral:
+            return None
+        return encontrado
@@ -0,0 +1,201 @@
+# ---------------------------------------------------------
+# Autor: Raúl Cid González
+# Ejecutor zero-shot propio: hipótesis tokenizadas una sola vez,
+# premisa tokenizada una vez por petición y pares montados
+# directamente como tensores
+# ---------------------------------------------------------
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+
+def _buscar(secuencia: List[int], parte: List[int], desde: int = 0) -> int:
+    for i in range(desde, len(secuencia) - len(parte) + 1):
+        if secuencia[i:i + len(parte)] == parte:
+            return i
+    raise ValueError("El tokenizer no conserva las partes del par.")
+
+
+class _PlantillaPares:
+    """
+    Cómo monta el tokenizer un par (premisa, hipótesis): tokens
+    especiales antes, entre y después de cada parte, y sus token_type_ids.
+    Se averigua una sola vez codificando un par de prueba.
+    """
+
+    def __init__(self, tokenizer: Any) -> None:
+        a = tokenizer("a", add_special_tokens=False)["input_ids"]
+        b = tokenizer("b", add_special_tokens=False)["input_ids"]
+        par = tokenizer("a", "b", return_token_type_ids=True)
+        ids = list(par["input_ids"])
+        tipos = list(par.get("token_type_ids") or [0] * len(ids))
+
+        i = _buscar(ids, a)
+        j = _buscar(ids, b, i + len(a))
+        self.prefijo = ids[:i]
+        self.medio = ids[i + len(a):j]
+        self.sufijo = ids[j + len(b):]
+
+        # tipo de la premisa y de la hipótesis, y de los especiales que las rodean
+        self.tipo_a = tipos[i]
+        self.tipo_b = tipos[j]
+        self.tipos_prefijo = tipos[:i]
+        self.tipos_medio = tipos[i + len(a):j]
+        self.tipos_sufijo = tipos[j + len(b):]
+
+
+class EjecutorZeroShot:
+    """
+    Sustituto de pipeline("zero-shot-classification") con el mismo uso y
+    la misma salida ({"sequence", "labels", "scores"}).
+
+    - Las hipótesis ("Esta incidencia trata sobre {}.") se tokenizan una
+      vez por combinación de etiquetas + plantilla y se guardan.
+    - Cada premisa se tokeniza una sola vez y se copia en las filas de
+      sus pares, sin formatear strings ni volver a tokenizar.
+    - Todos los pares van en lotes con padding dinámico y la puntuación
+      es la misma que la del pipeline (softmax de los logits de
+      "entailment" entre etiquetas, o entailment vs contradiction si
+      multi_label=True).
+    """
+
+    def __init__(self, model: Any, tokenizer: Any, max_longitud: Optional[int] = None) -> None:
+        import torch
+
+        self._torch = torch
+        # observar(etapa, segundos): "tokenizacion" (premisas + montaje de
+        # tensores) y "modelo_forward" por cada llamada; None = sin medir
+        self.observar: Optional[Callable[[str, float], None]] = None
+        self.model = model
+        self.tokenizer = tokenizer
+        self._pares = _PlantillaPares(tokenizer)
+        self._hipotesis: Dict[Tuple[Tuple[str, ...], str], List[Tuple[List[int], List[int]]]] = {}
+        self._lock = threading.Lock()
+
+        limite = getattr(tokenizer, "model_max_length", None) or 512
+        if limite > 100_000:  # tokenizers sin límite declarado
+            limite = getattr(getattr(model, "config", None), "max_position_embeddings", 512)
+        self.max_longitud = max_longitud or limite
+
+        self.pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else 0
+        self.usa_tipos = "token_type_ids" in getattr(tokenizer, "model_input_names", [])
+
+        label2id = getattr(getattr(model, "config", None), "label2id", {}) or {}
+        self.entailment_id = -1
+        self.contradiction_id = 0
+        for etiqueta, idx in label2id.items():
+            if etiqueta.lower().startswith("entail"):
+                self.entailment_id = int(idx)
+            if etiqueta.lower().startswith("contra"):
+                self.contradiction_id = int(idx)
+
+    @classmethod
+    def desde_pipeline(cls, pipe: Any) -> "EjecutorZeroShot":
+        return cls(pipe.model, pipe.tokenizer)
+
+    def _codificar_hipotesis(self, etiquetas: Sequence[str], plantilla: str) -> List[Tuple[List[int], List[int]]]:
+        clave = (tuple(etiquetas), plantilla)
+        cod = self._hipotesis.get(clave)
+        if cod is None:
+            with self._lock:
+                cod = self._hipotesis.get(clave)
+                if cod is None:
+                    p = self._pares
+                    cod = []
+                    for etiqueta in etiquetas:
+                        ids = self.tokenizer(plantilla.format(etiqueta), add_special_tokens=False)["input_ids"]
+                        cola = p.medio + ids + p.sufijo
+                        tipos = p.tipos_medio + [p.tipo_b] * len(ids) + p.tipos_sufijo
+                        cod.append((cola, tipos))
+                    self._hipotesis[clave] = cod
+        return cod
+
+    def _logits(self, filas: List[Tuple[List[int], List[int], List[int], List[int]]]):
+        """
+        filas: (premisa, tipos_premisa, cola_hipotesis, tipos_hipotesis).
+        Devuelve (logits, segundos del forward).
+        """
+        torch = self._torch
+        p = self._pares
+        longitudes = [len(p.prefijo) + len(a) + len(c) for a, _, c, _ in filas]
+        n, largo = len(filas), max(longitudes)
+
+        ids = torch.full((n, largo), self.pad_id, dtype=torch.long)
+        mascara = torch.zeros((n, largo), dtype=torch.long)
+        tipos = torch.zeros((n, largo), dtype=torch.long) if self.usa_tipos else None
+        izquierda = getattr(self.tokenizer, "padding_side", "right") == "left"
+
+        for k, ((premisa, t_premisa, cola, t_cola), lon) in enumerate(zip(filas, longitudes)):
+            ini = largo - lon if izquierda else 0
+            fila = p.prefijo + premisa + cola
+            ids[k, ini:ini + lon] = torch.tensor(fila, dtype=torch.long)
+            mascara[k, ini:ini + lon] = 1
+            if tipos is not None:
+                tipos[k, ini:ini + lon] = torch.tensor(p.tipos_prefijo + t_premisa + t_cola, dtype=torch.long)
+
+        entradas = {"input_ids": ids, "attention_mask": mascara}
+        if tipos is not None:
+            entradas["token_type_ids"] = tipos
+        inicio = time.perf_counter()
+        with torch.inference_mode():
+            salida = self.model(**entradas)
+        logits = salida["logits"] if isinstance(salida, dict) else salida.logits
+        logits = np.asarray(logits.float().cpu().numpy() if hasattr(logits, "cpu") else logits)
+        return logits, time.perf_counter() - inicio
+
+    def __call__(
+        self,
+        sequences: Union[str, List[str]],
+        candidate_labels: Union[str, Sequence[str]],
+        hypothesis_template: str = "This example is {}.",
+        multi_label: bool = False,
+        batch_size: Optional[int] = None,
+        **_: Any,
+    ):
+        unica = isinstance(sequences, str)
+        textos = [sequences] if unica else list(sequences)
+        etiquetas = [candidate_labels] if isinstance(candidate_labels, str) else list(candidate_labels)
+        inicio = time.perf_counter()
+        hipotesis = self._codificar_hipotesis(etiquetas, hypothesis_template)
+        p = self._pares
+
+        # Cada premisa se tokeniza una sola vez; si hay que recortarla
+        # (truncation="only_first"), el recorte depende de la hipótesis
+        premisas = self.tokenizer(textos, add_special_tokens=False, verbose=False)["input_ids"]
+        filas = []
+        for premisa in premisas:
+            for cola, t_cola in hipotesis:
+                cabe = self.max_longitud - len(p.prefijo) - len(cola)
+                a = premisa if len(premisa) <= cabe else premisa[:max(cabe, 0)]
+                filas.append((a, [p.tipo_a] * len(a), cola, t_cola))
+
+        paso = batch_size or len(filas)
+        partes = [self._logits(filas[i:i + paso]) for i in range(0, len(filas), paso)]
+        logits = np.concatenate([l for l, _ in partes]).reshape(len(textos), len(etiquetas), -1)
+        if self.observar is not None:
+            forward = sum(seg for _, seg in partes)
+            self.observar("tokenizacion", time.perf_counter() - inicio - forward)
+            self.observar("modelo_forward", forward)
+
+        resultados = []
+        for texto, l in zip(textos, logits):
+            if len(etiquetas) == 1 or multi_label:
+                entail_contr = l[..., [self.contradiction_id, self.entailment_id]]
+                scores = np.exp(entail_contr) / np.exp(entail_contr).sum(-1, keepdims=True)
+                scores = scores[..., 1]
+            else:
+                entail = l[..., self.entailment_id]
+                scores = np.exp(entail) / np.exp(entail).sum(-1, keepdims=True)
+            orden = list(reversed(scores.argsort()))
+            resultados.append({
+                "sequence": texto,
+                "labels": [etiquetas[i] for i in orden],
+                "scores": scores[orden].tolist(),
+            })
+
+        return resultados[0] if unica else resultados